@@ -2,14 +2,25 @@
 """
 Analyze extracted Splitwise expense data.
 
+The report is computed in one vectorized pass (group-by aggregations over the
+expense, item and split frames, with members exploded). Frames parsed from
+JSON/JSONL are cached in data/.cache/, keyed by the input file's content hash,
+so re-running on unchanged data skips the parse.
+
 Usage:
     python analyze_expenses.py              # Full summary
     python analyze_expenses.py --top-items 20  # Top 20 most expensive items
+    python analyze_expenses.py --jsonl      # Stream expenses_raw.jsonl (from extract_expenses.py --stream)
+    python analyze_expenses.py --parquet    # Load the typed expenses/items Parquet files
+    python analyze_expenses.py --format json > report.json  # Machine-readable report
 """
 
 import argparse
+import contextlib
+import hashlib
 import json
-from collections import Counter, defaultdict
+import os
+import sys
 from pathlib import Path
 
 import pandas as pd
@@ -17,44 +28,77 @@ import pandas as pd
 
 DATA_DIR = Path(__file__).resolve().parent / "data"
 RAW_JSON = DATA_DIR / "expenses_raw.json"
+RAW_JSONL = DATA_DIR / "expenses_raw.jsonl"
+EXPENSES_PARQUET = DATA_DIR / "expenses.parquet"
+ITEMS_PARQUET = DATA_DIR / "items.parquet"
+CACHE_DIR = DATA_DIR / ".cache"
+CACHE_VERSION = 1  # Bump when build_dataframes changes the frames it returns
+
+EXPENSE_COLUMNS = ["expense_id", "description", "cost", "date", "payer", "num_users", "num_items", "group_id"]
+ITEM_COLUMNS = ["expense_id", "expense_date", "item_name", "item_price", "num_members", "members", "per_member_cost"]
+
+
+class JsonlRecords:
+    """Re-iterable view of a JSONL file; every pass streams records from disk."""
+
+    def __init__(self, path):
+        self.path = path
 
+    def __iter__(self):
+        with open(self.path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
 
-def load_data():
-    """Load expenses from JSON file."""
-    if not RAW_JSON.exists():
-        print(f"Error: {RAW_JSON} not found. Run extract_expenses.py first.")
+
+def source_path(jsonl=False):
+    """The raw extraction file to analyze; exits if it has not been extracted yet."""
+    path = RAW_JSONL if jsonl else RAW_JSON
+    if not path.exists():
+        hint = "extract_expenses.py --stream" if jsonl else "extract_expenses.py"
+        print(f"Error: {path} not found. Run {hint} first.")
         raise SystemExit(1)
+    return path
+
+
+def load_data(jsonl=False):
+    """Load expenses from the JSON file, or a streaming view of the JSONL file."""
+    path = source_path(jsonl)
+
+    if jsonl:
+        print(f"Streaming expenses from {path.name}\n")
+        return JsonlRecords(path)
 
-    with open(RAW_JSON) as f:
+    with open(path) as f:
         data = json.load(f)
-    print(f"Loaded {len(data)} expenses from {RAW_JSON.name}\n")
+    print(f"Loaded {len(data)} expenses from {path.name}\n")
     return data
 
 
 def build_dataframes(data):
-    """Build expense-level and item-level DataFrames."""
-    expenses_df = pd.DataFrame([
-        {
-            "expense_id": e["expense_id"],
-            "description": e["description"],
-            "cost": e["cost"],
-            "date": e["date"],
-            "payer": e.get("payer"),
-            "num_users": e.get("num_users", 0),
-            "num_items": e.get("num_items", 0),
-            "group_id": e.get("group_id"),
-        }
-        for e in data
-    ])
-    expenses_df["date"] = pd.to_datetime(expenses_df["date"])
-    expenses_df["month"] = expenses_df["date"].dt.to_period("M")
+    """Build expense-level, item-level and split-level DataFrames in one pass over the expenses.
+
+    The split frame has one (member, amount) row per member owing on an expense.
+    """
+    expenses = {column: [] for column in EXPENSE_COLUMNS}
+    items = {column: [] for column in ITEM_COLUMNS}
+    split_members, split_amounts = [], []
 
-    items = []
     for e in data:
-        if not e.get("item_data"):
-            continue
-        for item in e["item_data"]:
-            name = item.get("name", item.get("item_name", ""))
+        expenses["expense_id"].append(e["expense_id"])
+        expenses["description"].append(e["description"])
+        expenses["cost"].append(e["cost"])
+        expenses["date"].append(e["date"])
+        expenses["payer"].append(e.get("payer"))
+        expenses["num_users"].append(e.get("num_users", 0))
+        expenses["num_items"].append(e.get("num_items", 0))
+        expenses["group_id"].append(e.get("group_id"))
+
+        for member, amount in e.get("splits", {}).items():
+            split_members.append(member)
+            split_amounts.append(amount)
+
+        for item in e.get("item_data") or []:
             price = float(item.get("price", item.get("item_price", 0)))
             members_dict = item.get("members", {})
             if isinstance(members_dict, dict):
@@ -63,156 +107,293 @@ def build_dataframes(data):
                 selected = members_dict
             else:
                 selected = []
-            per_member = price / len(selected) if selected else 0
-
-            items.append({
-                "expense_id": e["expense_id"],
-                "expense_date": e["date"],
-                "item_name": name,
-                "item_price": price,
-                "num_members": len(selected),
-                "members": selected,
-                "per_member_cost": round(per_member, 2),
-            })
 
-    items_df = pd.DataFrame(items)
-    if not items_df.empty:
-        items_df["expense_date"] = pd.to_datetime(items_df["expense_date"])
+            items["expense_id"].append(e["expense_id"])
+            items["expense_date"].append(e["date"])
+            items["item_name"].append(item.get("name", item.get("item_name", "")))
+            items["item_price"].append(price)
+            items["num_members"].append(len(selected))
+            items["members"].append(selected)
+            items["per_member_cost"].append(round(price / len(selected), 2) if selected else 0)
 
-    return expenses_df, items_df
+    expenses_df = pd.DataFrame(expenses)
+    expenses_df["date"] = pd.to_datetime(expenses_df["date"])
+    expenses_df["month"] = expenses_df["date"].dt.to_period("M")
 
+    items_df = pd.DataFrame(items)
+    items_df["expense_date"] = pd.to_datetime(items_df["expense_date"])
+
+    splits_df = pd.DataFrame({"member": split_members, "amount": pd.Series(split_amounts, dtype=float)})
+    return expenses_df, items_df, splits_df
+
+
+def file_digest(path):
+    """SHA-256 of a file's contents, read in 1 MiB chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_frames(jsonl=False, use_cache=True):
+    """(expenses_df, items_df, splits_df) for the JSON/JSONL file, cached by its content hash.
+
+    A cache entry is a pickle of the three frames; entries for older versions
+    of the same file are removed when a new one is written.
+    """
+    path = source_path(jsonl)
+    if not use_cache:
+        return build_dataframes(load_data(jsonl=jsonl))
+
+    cache_path = CACHE_DIR / f"{path.name}.{file_digest(path)[:16]}.v{CACHE_VERSION}.pkl"
+    if cache_path.exists():
+        try:
+            frames = pd.read_pickle(cache_path)
+            print(f"Loaded {len(frames[0])} expenses from cached frames for {path.name}\n")
+            return frames
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable cache {cache_path.name}: {e}")
+
+    frames = build_dataframes(load_data(jsonl=jsonl))
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+        pd.to_pickle(frames, tmp_path)
+        os.replace(tmp_path, cache_path)
+        for stale in CACHE_DIR.glob(f"{path.name}.*.pkl"):
+            if stale != cache_path:
+                stale.unlink()
+    except OSError as e:
+        print(f"Warning: Could not cache parsed frames: {e}")
+    return frames
+
+
+def load_parquet():
+    """Load expense and item frames from the Parquet outputs (already typed, no re-parsing).
+
+    Returns (expenses_df, items_df, splits_df).
+    """
+    for path in (EXPENSES_PARQUET, ITEMS_PARQUET):
+        if not path.exists():
+            print(f"Error: {path} not found. Run extract_expenses.py (with pyarrow installed) first.")
+            raise SystemExit(1)
+
+    expenses_df = pd.read_parquet(EXPENSES_PARQUET, columns=EXPENSE_COLUMNS + ["split_members", "split_amounts"])
+    items_df = pd.read_parquet(ITEMS_PARQUET, columns=ITEM_COLUMNS)
+    print(f"Loaded {len(expenses_df)} expenses from {EXPENSES_PARQUET.name}\n")
+
+    splits = expenses_df[["split_members", "split_amounts"]].explode(["split_members", "split_amounts"]).dropna()
+    splits_df = pd.DataFrame({
+        "member": splits["split_members"].to_numpy(),
+        "amount": splits["split_amounts"].to_numpy(dtype=float),
+    })
+    expenses_df = expenses_df.drop(columns=["split_members", "split_amounts"])
+    expenses_df["month"] = expenses_df["date"].dt.to_period("M")
+    return expenses_df, items_df, splits_df
+
+
+def _stat(value):
+    """A float for the JSON report; None (null) where pandas gives NaN, e.g. the mean of no expenses."""
+    value = float(value)
+    return None if value != value else value
+
+
+def compute_report(expenses_df, items_df, splits_df, top_n=15, frequent_n=20, per_member_n=10):
+    """Every report section as plain (JSON-serializable) data."""
+    costs = expenses_df["cost"]
+    dates = expenses_df["date"]
+    report = {
+        "summary": {
+            "total_expenses": len(expenses_df),
+            "total_spend": float(costs.sum()),
+            "average_expense": _stat(costs.mean()),
+            "median_expense": _stat(costs.median()),
+            "max_expense": _stat(costs.max()),
+            "first_date": dates.min().date().isoformat() if len(dates) else None,
+            "last_date": dates.max().date().isoformat() if len(dates) else None,
+            "total_items": int(expenses_df["num_items"].sum()),
+        },
+    }
+
+    # Ties keep first-seen order throughout (stable sorts over sort=False groups)
+    member_totals = splits_df.groupby("member", sort=False)["amount"].sum()
+    member_totals = member_totals.sort_values(ascending=False, kind="stable")
+    report["spending_by_member"] = [
+        {"member": member, "total": total} for member, total in zip(member_totals.index, member_totals.tolist())
+    ]
+
+    payers = expenses_df.groupby("payer", sort=False)["cost"].agg(["size", "sum"])
+    payers = payers.sort_values("size", ascending=False, kind="stable")
+    report["payers"] = [
+        {"payer": payer, "count": count, "total": total}
+        for payer, count, total in zip(payers.index, payers["size"].tolist(), payers["sum"].tolist())
+    ]
+
+    monthly = expenses_df.groupby("month")["cost"].agg(["size", "sum", "mean"])
+    report["monthly"] = [
+        {"month": str(month), "count": count, "total": total, "average": average}
+        for month, count, total, average in zip(
+            monthly.index, monthly["size"].tolist(), monthly["sum"].tolist(), monthly["mean"].tolist(),
+        )
+    ]
 
-def print_summary(expenses_df):
+    if items_df.empty:
+        report["top_items"] = report["item_frequency"] = []
+        report["member_items"] = {}
+        return report
+
+    top = items_df.nlargest(top_n, "item_price")
+    report["top_items"] = [
+        {"item_name": name, "item_price": price}
+        for name, price in zip(top["item_name"].tolist(), top["item_price"].tolist())
+    ]
+
+    frequency = items_df.groupby("item_name", sort=False)["item_price"].agg(["size", "mean"])
+    frequency = frequency.sort_values("size", ascending=False, kind="stable").head(frequent_n)
+    report["item_frequency"] = [
+        {"item_name": name, "count": count, "avg_price": avg_price}
+        for name, count, avg_price in zip(frequency.index, frequency["size"].tolist(), frequency["mean"].tolist())
+    ]
+
+    pairs = items_df[["members", "item_name"]].explode("members").dropna(subset=["members"])
+    pair_counts = pairs.groupby(["members", "item_name"], sort=False).size().reset_index(name="count")
+    pair_counts = pair_counts.sort_values(["members", "count"], ascending=[True, False], kind="stable")
+    pair_counts = pair_counts.groupby("members", sort=False).head(per_member_n)
+    member_items = {}
+    for member, name, count in zip(pair_counts["members"], pair_counts["item_name"], pair_counts["count"].tolist()):
+        member_items.setdefault(member, []).append({"item_name": name, "count": count})
+    report["member_items"] = member_items
+    return report
+
+
+def _money(amount):
+    return "n/a" if amount is None else f"${amount:,.2f}"
+
+
+def print_summary(summary):
     """Print overall summary statistics."""
     print("=" * 60)
     print("SUMMARY")
     print("=" * 60)
-    print(f"Total expenses:      {len(expenses_df)}")
-    print(f"Total spend:         ${expenses_df['cost'].sum():,.2f}")
-    print(f"Average expense:     ${expenses_df['cost'].mean():,.2f}")
-    print(f"Median expense:      ${expenses_df['cost'].median():,.2f}")
-    print(f"Max expense:         ${expenses_df['cost'].max():,.2f}")
-    print(f"Date range:          {expenses_df['date'].min().date()} → {expenses_df['date'].max().date()}")
-    print(f"Total items tracked: {expenses_df['num_items'].sum()}")
+    print(f"Total expenses:      {summary['total_expenses']}")
+    print(f"Total spend:         ${summary['total_spend']:,.2f}")
+    print(f"Average expense:     {_money(summary['average_expense'])}")
+    print(f"Median expense:      {_money(summary['median_expense'])}")
+    print(f"Max expense:         {_money(summary['max_expense'])}")
+    print(f"Date range:          {summary['first_date']} → {summary['last_date']}")
+    print(f"Total items tracked: {summary['total_items']}")
     print()
 
 
-def print_spending_by_member(data):
+def print_spending_by_member(member_totals):
     """Print total amount owed per member across all expenses."""
-    member_totals = defaultdict(float)
-    for e in data:
-        for member, amount in e.get("splits", {}).items():
-            member_totals[member] += amount
-
     print("=" * 60)
     print("SPENDING BY MEMBER (total owed)")
     print("=" * 60)
-    sorted_members = sorted(member_totals.items(), key=lambda x: x[1], reverse=True)
-    for member, total in sorted_members:
-        print(f"  {member:<25} ${total:>10,.2f}")
+    for row in member_totals:
+        print(f"  {row['member']:<25} ${row['total']:>10,.2f}")
     print()
 
 
-def print_payer_stats(expenses_df):
+def print_payer_stats(payers):
     """Print who paid for expenses most often."""
-    payer_counts = expenses_df["payer"].value_counts()
-    payer_totals = expenses_df.groupby("payer")["cost"].sum()
-
     print("=" * 60)
     print("PAYER STATS (who paid)")
     print("=" * 60)
-    for payer in payer_counts.index:
-        print(f"  {payer:<25} {payer_counts[payer]:>3} expenses  ${payer_totals[payer]:>10,.2f}")
+    for row in payers:
+        print(f"  {row['payer']:<25} {row['count']:>3} expenses  ${row['total']:>10,.2f}")
     print()
 
 
-def print_top_items(items_df, n=15):
+def print_top_items(top_items, n=15):
     """Print top most expensive items."""
-    if items_df.empty:
+    if not top_items:
         print("No item data available.\n")
         return
 
     print("=" * 60)
     print(f"TOP {n} MOST EXPENSIVE ITEMS")
     print("=" * 60)
-    top = items_df.nlargest(n, "item_price")
-    for _, row in top.iterrows():
+    for row in top_items:
         print(f"  ${row['item_price']:>8.2f}  {row['item_name']}")
     print()
 
 
-def print_monthly_trends(expenses_df):
+def print_monthly_trends(monthly):
     """Print monthly spending trends."""
-    monthly = expenses_df.groupby("month").agg(
-        count=("expense_id", "count"),
-        total=("cost", "sum"),
-        avg=("cost", "mean"),
-    )
-
     print("=" * 60)
     print("MONTHLY SPENDING TRENDS")
     print("=" * 60)
     print(f"  {'Month':<12} {'Count':>6} {'Total':>12} {'Average':>12}")
     print(f"  {'-'*12} {'-'*6} {'-'*12} {'-'*12}")
-    for month, row in monthly.iterrows():
-        print(f"  {str(month):<12} {int(row['count']):>6} ${row['total']:>10,.2f} ${row['avg']:>10,.2f}")
+    for row in monthly:
+        print(f"  {row['month']:<12} {row['count']:>6} ${row['total']:>10,.2f} ${row['average']:>10,.2f}")
     print()
 
 
-def print_item_frequency(items_df, n=20):
+def print_item_frequency(item_frequency, n=20):
     """Print most frequently ordered items."""
-    if items_df.empty:
+    if not item_frequency:
         print("No item data available.\n")
         return
 
-    freq = items_df["item_name"].value_counts().head(n)
     print("=" * 60)
     print(f"TOP {n} MOST FREQUENT ITEMS")
     print("=" * 60)
-    for name, count in freq.items():
-        avg_price = items_df[items_df["item_name"] == name]["item_price"].mean()
-        print(f"  {count:>3}x  {name:<40} avg ${avg_price:>.2f}")
+    for row in item_frequency:
+        print(f"  {row['count']:>3}x  {row['item_name']:<40} avg ${row['avg_price']:>.2f}")
     print()
 
 
-def print_member_item_frequency(items_df, n=10):
+def print_member_item_frequency(member_items, n=10):
     """Print per-member item frequency."""
-    if items_df.empty:
+    if not member_items:
         print("No item data available.\n")
         return
 
-    member_items = defaultdict(list)
-    for _, row in items_df.iterrows():
-        for member in row["members"]:
-            member_items[member].append(row["item_name"])
-
     print("=" * 60)
     print(f"PER-MEMBER TOP {n} ITEMS")
     print("=" * 60)
-    for member in sorted(member_items.keys()):
-        counter = Counter(member_items[member])
-        top = counter.most_common(n)
+    for member, top in member_items.items():
         print(f"\n  {member}:")
-        for item, count in top:
-            print(f"    {count:>3}x  {item}")
+        for row in top:
+            print(f"    {row['count']:>3}x  {row['item_name']}")
     print()
 
 
 def main():
     parser = argparse.ArgumentParser(description="Analyze extracted Splitwise expenses")
     parser.add_argument("--top-items", type=int, default=15, help="Number of top items to show")
+    parser.add_argument("--jsonl", action="store_true", help="Stream expenses_raw.jsonl instead of loading expenses_raw.json")
+    parser.add_argument("--parquet", action="store_true", help="Load expenses.parquet/items.parquet instead of JSON")
+    parser.add_argument("--format", choices=["text", "json"], default="text",
+                        help="Print the report as text (default) or as JSON for dashboards")
+    parser.add_argument("--no-cache", action="store_true", help="Re-parse the JSON/JSONL file even if cached frames exist")
     args = parser.parse_args()
 
-    data = load_data()
-    expenses_df, items_df = build_dataframes(data)
+    # Keep stdout clean for --format json; status messages go to stderr
+    status_out = sys.stderr if args.format == "json" else sys.stdout
+    with contextlib.redirect_stdout(status_out):
+        if args.parquet:
+            expenses_df, items_df, splits_df = load_parquet()
+        else:
+            expenses_df, items_df, splits_df = load_frames(jsonl=args.jsonl, use_cache=not args.no_cache)
+
+    report = compute_report(expenses_df, items_df, splits_df, top_n=args.top_items)
+
+    if args.format == "json":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
 
-    print_summary(expenses_df)
-    print_spending_by_member(data)
-    print_payer_stats(expenses_df)
-    print_monthly_trends(expenses_df)
-    print_top_items(items_df, n=args.top_items)
-    print_item_frequency(items_df)
-    print_member_item_frequency(items_df)
+    print_summary(report["summary"])
+    print_spending_by_member(report["spending_by_member"])
+    print_payer_stats(report["payers"])
+    print_monthly_trends(report["monthly"])
+    print_top_items(report["top_items"], n=args.top_items)
+    print_item_frequency(report["item_frequency"])
+    print_member_item_frequency(report["member_items"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Assign new raw item names to existing canonical names without the Streamlit app.
+
+Every raw name in the items data that item_name_mapping.json does not cover
+is scored against the mapped names (name_matching.CanonicalIndex, the same
+token_sort_ratio the app clusters with). Fee/tax names are mapped to
+__SHARED__ as the app's quick action does; names whose best match scores at
+least --threshold get that match's canonical name. The rest are written to
+normalization_review.json, most frequent first with their best candidate,
+for review in normalize_app.py (which proposes the same matches in its
+incremental mode).
+
+Meant for the nightly pipeline, between extract_expenses.py and
+build_profiles.py, so preference counts are not split across spelling
+variants of one item.
+
+Usage:
+    python analysis/auto_normalize.py
+    python analysis/auto_normalize.py --threshold 85 --dry-run
+    python analysis/auto_normalize.py --parquet   # Read items.parquet instead of items_flat.csv
+"""
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from name_matching import SHARED, CanonicalIndex, auto_detect_shared
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+CSV_PATH = DATA_DIR / "items_flat.csv"
+RAW_JSONL = DATA_DIR / "expenses_raw.jsonl"
+ITEMS_PARQUET = DATA_DIR / "items.parquet"
+MAPPING_PATH = DATA_DIR / "item_name_mapping.json"
+REVIEW_PATH = DATA_DIR / "normalization_review.json"
+
+DEFAULT_THRESHOLD = 90
+# Best candidates below this score are not worth showing in the review queue
+MIN_SUGGESTION_SCORE = 50
+
+
+def load_name_counts(source, jsonl=False, parquet=False):
+    """Occurrences of each raw item name, most frequent first."""
+    if jsonl:
+        from build_profiles import iter_jsonl_items
+        names = pd.Series([row["item_name"] for row in iter_jsonl_items(source)], dtype=object)
+    elif parquet:
+        names = pd.read_parquet(source, columns=["item_name"])["item_name"].astype(object)
+    else:
+        names = pd.read_csv(source, usecols=["item_name"])["item_name"]
+    return names.dropna().value_counts()
+
+
+def auto_assign(names, mapping, threshold=DEFAULT_THRESHOLD, workers=-1):
+    """Split unmapped `names` into confident assignments and a review queue.
+
+    Returns (assignments, review): assignments maps raw name -> canonical
+    name; review lists {"name", "canonical", "matched", "score"} for names
+    below the threshold, in input order (canonical/matched are None when no
+    candidate scores MIN_SUGGESTION_SCORE).
+    """
+    unmapped = [name for name in names if name not in mapping]
+    assignments = {name: SHARED for name in unmapped if auto_detect_shared(name)}
+    pending = [name for name in unmapped if name not in assignments]
+
+    index = CanonicalIndex(mapping)
+    positions, scores = index.match(pending, threshold=MIN_SUGGESTION_SCORE, workers=workers)
+    review = []
+    for name, position, score in zip(pending, positions.tolist(), scores.tolist()):
+        if position >= 0 and score >= threshold:
+            assignments[name] = index.canonicals[position]
+            continue
+        review.append({
+            "name": name,
+            "canonical": index.canonicals[position] if position >= 0 else None,
+            "matched": index.keys[position] if position >= 0 else None,
+            "score": score,
+        })
+    return assignments, review
+
+
+def write_json_atomic(path, data, **dump_options):
+    """Write JSON so readers (the app, build_profiles.py) never see a half-written file.
+
+    A file whose content would not change is left alone, so its mtime only
+    moves on real changes. Returns whether the file was written.
+    """
+    body = json.dumps(data, **dump_options).encode()
+    try:
+        if path.read_bytes() == body:
+            return False
+    except FileNotFoundError:
+        pass
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(body)
+    os.replace(tmp, path)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Auto-assign new raw item names to canonical names")
+    parser.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD,
+                        help=f"Minimum token_sort_ratio to assign without review (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--jsonl", action="store_true", help="Stream item names from expenses_raw.jsonl")
+    parser.add_argument("--parquet", action="store_true", help="Read items.parquet instead of items_flat.csv")
+    parser.add_argument("--dry-run", action="store_true", help="Print what would change without writing files")
+    args = parser.parse_args()
+
+    source = RAW_JSONL if args.jsonl else ITEMS_PARQUET if args.parquet else CSV_PATH
+    if not source.exists():
+        print(f"Error: {source} not found. Run extract_expenses.py{' --stream' if args.jsonl else ''} first.")
+        return
+
+    mapping = {}
+    if MAPPING_PATH.exists():
+        with open(MAPPING_PATH) as f:
+            mapping = json.load(f)
+
+    start = time.perf_counter()
+    counts = load_name_counts(source, jsonl=args.jsonl, parquet=args.parquet)
+    assignments, review = auto_assign(counts.index.tolist(), mapping, threshold=args.threshold)
+    elapsed = time.perf_counter() - start
+
+    unmapped = len(assignments) + len(review)
+    print(f"{len(counts)} raw names, {len(mapping)} mapped, {unmapped} new ({elapsed:.2f}s)")
+    print(f"  auto-assigned: {len(assignments)} "
+          f"({sum(c == SHARED for c in assignments.values())} as {SHARED})")
+    print(f"  for review:    {len(review)}")
+    for name, canonical in list(assignments.items())[:10]:
+        print(f"    {name!r} -> {canonical!r}")
+
+    for entry in review:
+        entry["count"] = int(counts[entry["name"]])
+
+    if args.dry_run:
+        return
+
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    if assignments:
+        write_json_atomic(MAPPING_PATH, {**mapping, **assignments}, indent=2, sort_keys=True)
+        print(f"\nAdded {len(assignments)} mappings to {MAPPING_PATH}")
+    # Recomputed every run: the queue is whatever is still unmapped now
+    if write_json_atomic(REVIEW_PATH, review, indent=2):
+        print(f"Wrote {len(review)} names to review to {REVIEW_PATH}")
+    else:
+        print(f"{REVIEW_PATH} unchanged ({len(review)} names to review)")
+
+
+if __name__ == "__main__":
+    main()
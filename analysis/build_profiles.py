@@ -5,91 +5,376 @@ Build member preference profiles from normalized item data.
 Reads items_flat.csv + item_name_mapping.json, aggregates member frequency
 per canonical item, and outputs member_preferences.json.
 
+The aggregation is columnar: names are mapped once per distinct raw name,
+combined names and members are exploded with integer codes, and counts and
+means are group-by reductions.
+
+Additive aggregates (member counts, appearances, price sums) and the IDs of
+the expenses they cover are kept in profile_state.json; later runs only fold
+in item rows from new expenses. Use --full after changing or deleting old
+expenses. A full rebuild also happens when the name mapping changes the
+canonical names of items the aggregates already cover; new mapping entries
+for other names (as auto_normalize.py adds every run) keep the build
+incremental.
+
+Per-group shards in the same state format go to profiles/<group_id>.json,
+with profiles/index.json listing each group's expense count and shard hash.
+The backend loads a group's shard when that group auto-splits. Shards are
+rebuilt from every item row (one vectorized aggregation per group); group
+IDs come from expenses_flat.csv / expenses.parquet / the JSONL records.
+
+It also trains the backend's local item → members model
+(services/classifier.py) on every non-shared item row and writes
+item_classifier.npz; see evaluate_classifier.py for its held-out accuracy.
+
 Usage:
     python analysis/build_profiles.py
+    python analysis/build_profiles.py --full    # Rebuild the aggregates from every item row
+    python analysis/build_profiles.py --jsonl   # Stream items from expenses_raw.jsonl instead
+    python analysis/build_profiles.py --parquet # Read items.parquet (members already a list column)
+    python analysis/build_profiles.py --no-publish  # Leave backend/data/ alone (pipeline.py publishes)
 """
 
+import argparse
+import hashlib
 import json
+import os
 import shutil
-from collections import defaultdict
+import sys
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
+# Aggregate format shared with the backend's live preference updates
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+from services import classifier  # noqa: E402
+from services.preferences import (  # noqa: E402
+    SHARED, canonical_names, load_state, mapping_fingerprint, merge, save_state, to_preferences,
+)
+
 DATA_DIR = Path(__file__).resolve().parent / "data"
 CSV_PATH = DATA_DIR / "items_flat.csv"
+EXPENSES_CSV = DATA_DIR / "expenses_flat.csv"
+EXPENSES_PARQUET = DATA_DIR / "expenses.parquet"
+RAW_JSONL = DATA_DIR / "expenses_raw.jsonl"
+ITEMS_PARQUET = DATA_DIR / "items.parquet"
 MAPPING_PATH = DATA_DIR / "item_name_mapping.json"
 OUTPUT_PATH = DATA_DIR / "member_preferences.json"
-BACKEND_DATA_DIR = Path(__file__).resolve().parent.parent / "backend" / "data"
+STATE_PATH = DATA_DIR / "profile_state.json"
+PROFILES_DIR = DATA_DIR / "profiles"
+CLASSIFIER_PATH = DATA_DIR / "item_classifier.npz"
+BACKEND_DATA_DIR = BACKEND_DIR / "data"
 BACKEND_OUTPUT = BACKEND_DATA_DIR / "member_preferences.json"
+BACKEND_STATE = BACKEND_DATA_DIR / "profile_state.json"
+BACKEND_PROFILES_DIR = BACKEND_DATA_DIR / "profiles"
+BACKEND_CLASSIFIER = BACKEND_DATA_DIR / "item_classifier.npz"
+
+
+def iter_jsonl_items(path):
+    """Yield item rows (expense_id, item_name, item_price, members) from expenses_raw.jsonl."""
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            expense = json.loads(line)
+            expense_id = expense["expense_id"]
+            group_id = expense.get("group_id")
+            for item in expense.get("item_data") or []:
+                members = item.get("members", {})
+                if isinstance(members, dict):
+                    members = [m for m, selected in members.items() if selected]
+                elif not isinstance(members, list):
+                    members = []
+                yield {
+                    "expense_id": expense_id,
+                    "group_id": group_id,
+                    "item_name": item.get("name", item.get("item_name", "")),
+                    "item_price": float(item.get("price", item.get("item_price", 0))),
+                    "members": members,
+                }
+
+
+def split_members(value):
+    """Members of an item row: a |-joined string (CSV) or a list (JSONL/Parquet)."""
+    if isinstance(value, str):
+        value = value.split("|")
+    return [m.strip() for m in value if m and m.strip()]
+
+
+def _explode(codes, lists):
+    """Expand per-row codes into the rows' list entries.
+
+    `lists[code]` holds the entries for every row with that code (-1 = none).
+    Returns (row index of each entry, entry values), in row order.
+    """
+    lengths = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+    offsets = np.cumsum(lengths) - lengths
+    values = np.array([v for entries in lists for v in entries], dtype=object)
+    # A trailing zero-length slot, so code -1 indexes "no entries"
+    row_lengths = np.append(lengths, 0)[codes]
+    rows = np.repeat(np.arange(len(codes)), row_lengths)
+    within = np.arange(len(rows)) - np.repeat(np.cumsum(row_lengths) - row_lengths, row_lengths)
+    flat = np.repeat(np.append(offsets, 0)[codes], row_lengths) + within
+    return rows, values[flat]
+
+
+def canonical_rows(df, name_mapping):
+    """One row per (canonical_name, original item row), in original row order.
+
+    Names are mapped once per distinct raw name, not once per row.
+    """
+    codes, raw_names = pd.factorize(df["item_name"])
+    rows, canonical = _explode(codes, [canonical_names(name, name_mapping) for name in raw_names])
+    return pd.DataFrame({
+        "canonical_name": canonical,
+        "item_price": df["item_price"].to_numpy()[rows],
+        "row": rows,
+    })
+
+
+def member_counts(expanded, members):
+    """(canonical_name, member, count) sorted by canonical, then first appearance.
+
+    `members` is the original rows' members column; `expanded.row` points into it.
+    """
+    members = members.reset_index(drop=True)
+    first = members.dropna().head(1).tolist()
+    if first and not isinstance(first[0], str):
+        members = members.map(tuple, na_action="ignore")  # list columns: factorize needs hashables
+    member_codes, member_values = pd.factorize(members)
+    pair_rows, pair_members = _explode(
+        member_codes[expanded["row"].to_numpy()], [split_members(value) for value in member_values],
+    )
+
+    canonical_codes, canonicals = pd.factorize(expanded["canonical_name"], sort=True)
+    member_ids, member_names = pd.factorize(pair_members)
+    keys = canonical_codes[pair_rows].astype(np.int64) * max(len(member_names), 1) + member_ids
+    unique_keys, first_seen, counts = np.unique(keys, return_index=True, return_counts=True)
+    pair_canonicals, pair_member_ids = np.divmod(unique_keys, max(len(member_names), 1))
+
+    order = np.lexsort((first_seen, pair_canonicals))
+    return pd.DataFrame({
+        "canonical_name": np.asarray(canonicals, dtype=object)[pair_canonicals[order]],
+        "member": np.asarray(member_names, dtype=object)[pair_member_ids[order]],
+        "count": counts[order],
+    })
+
+
+def canonical_stats(expanded):
+    """Appearances, price sum and priced-row count per canonical name (alphabetical index).
+
+    Each group's prices are summed as one contiguous numpy slice, the same
+    pairwise summation Series.mean uses; groupby's own sum differs slightly
+    and can flip avg_price in the last rounded cent.
+    """
+    codes, names = pd.factorize(expanded["canonical_name"], sort=True)
+    keep = codes >= 0
+    codes = codes[keep]
+    prices = expanded["item_price"].to_numpy(dtype=np.float64)[keep]
+    priced = ~np.isnan(prices)
+
+    order = np.argsort(codes, kind="stable")
+    sorted_prices = np.where(priced, prices, 0.0)[order]
+    sizes = np.bincount(codes, minlength=len(names))
+    bounds = np.concatenate([[0], np.cumsum(sizes)])
+    sums = np.array([sorted_prices[start:end].sum() for start, end in zip(bounds[:-1], bounds[1:])])
+    priced_counts = np.bincount(codes, weights=priced, minlength=len(names)).astype(np.int64)
+
+    return pd.DataFrame({"appearances": sizes, "price_sum": sums, "price_count": priced_counts}, index=names)
+
+
+def build_aggregates(df, name_mapping):
+    """Additive aggregates (services.preferences format) for item rows.
+
+    Returns (aggregates, number of expanded canonical rows).
+    """
+    expanded = canonical_rows(df, name_mapping)
+    stats = canonical_stats(expanded)
+    aggregates = {
+        canonical: {"members": {}, "appearances": appearances, "price_sum": price_sum, "price_count": price_count}
+        for canonical, appearances, price_sum, price_count in zip(
+            stats.index, stats["appearances"].tolist(), stats["price_sum"].tolist(), stats["price_count"].tolist(),
+        )
+    }
+    counts = member_counts(expanded, df["members"])
+    for canonical, member, count in zip(counts["canonical_name"], counts["member"], counts["count"].tolist()):
+        aggregates[canonical]["members"][member] = count
+    return aggregates, len(expanded)
+
+
+def build_preferences(df, name_mapping):
+    """member_preferences.json content for item rows (item_name, item_price, members).
+
+    Returns (preferences, number of expanded canonical rows).
+    """
+    aggregates, num_expanded = build_aggregates(df, name_mapping)
+    return to_preferences(aggregates), num_expanded
+
+
+def load_item_rows(source, jsonl=False, parquet=False):
+    """Item rows (expense_id, item_name, item_price, members) from the chosen source (JSONL adds group_id)."""
+    columns = ["expense_id", "item_name", "item_price", "members"]
+    if jsonl:
+        df = pd.DataFrame(iter_jsonl_items(source), columns=columns + ["group_id"])
+    elif parquet:
+        df = pd.read_parquet(source, columns=columns)
+        df["item_name"] = df["item_name"].astype(object)
+    else:
+        df = pd.read_csv(source, usecols=columns)
+    df["expense_id"] = df["expense_id"].astype(str)
+    return df
+
+
+def attach_group_ids(df, jsonl=False, parquet=False):
+    """Add a group_id column (str, None for non-group expenses); False if group IDs are unavailable."""
+    if jsonl:
+        return "group_id" in df.columns
+    source = EXPENSES_PARQUET if parquet else EXPENSES_CSV
+    if not source.exists():
+        return False
+    if parquet:
+        expenses = pd.read_parquet(source, columns=["expense_id", "group_id"])
+    else:
+        expenses = pd.read_csv(source, usecols=["expense_id", "group_id"], dtype=str)
+    groups = dict(zip(expenses["expense_id"].astype(str), expenses["group_id"]))
+    df["group_id"] = df["expense_id"].map(groups)
+    return True
+
+
+def _group_key(group_id):
+    """Shard name for a group ID as stored in CSV/Parquet/JSON ("123", 123, 123.0), or None."""
+    if pd.isna(group_id):
+        return None
+    try:
+        key = int(float(group_id))
+    except (TypeError, ValueError):
+        return None
+    return str(key) if key > 0 else None
+
+
+def build_shards(df, name_mapping):
+    """{group_id: (aggregates, expense_ids)} for item rows of group expenses."""
+    keys = df["group_id"].map(_group_key)
+    shards = {}
+    for group_id, rows in df.groupby(keys, sort=True):
+        aggregates, _ = build_aggregates(rows, name_mapping)
+        shards[group_id] = (aggregates, set(rows["expense_id"]))
+    return shards
+
+
+def write_shards(shards, fingerprint, directory=PROFILES_DIR):
+    """Write one state file per group plus index.json; removes shards of groups no longer present."""
+    directory.mkdir(parents=True, exist_ok=True)
+    index = {}
+    for group_id, (aggregates, expense_ids) in shards.items():
+        path = directory / f"{group_id}.json"
+        save_state(path, aggregates, expense_ids, fingerprint, group_id=group_id)
+        index[group_id] = {
+            "expenses": len(expense_ids),
+            "items": len(aggregates),
+            "sha256": hashlib.sha256(path.read_bytes()).hexdigest(),
+        }
+    for path in directory.glob("*.json"):
+        if path.stem.isdigit() and path.stem not in index:
+            path.unlink()
+    with open(directory / "index.json.tmp", "w") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(directory / "index.json.tmp", directory / "index.json")
+    return index
+
+
+def publish_shards(src=PROFILES_DIR, dst=BACKEND_PROFILES_DIR):
+    """Copy the shards into the backend's profiles directory, one atomic replace per file."""
+    dst.mkdir(parents=True, exist_ok=True)
+    names = {path.name for path in src.glob("*.json")}
+    for name in sorted(names - {"index.json"}) + ["index.json"]:
+        if (src / name).exists():
+            copy_atomic(src / name, dst / name)
+    for path in dst.glob("*.json"):
+        if path.name not in names:
+            path.unlink()
+
+
+def classifier_rows(df, name_mapping):
+    """(item name, members, canonical name) training rows, without fee/tax items mapped to __SHARED__.
+
+    The canonical name is the first of canonical_names(), i.e. a key of
+    member_preferences.json, so local-model matches can be looked up there.
+    """
+    for name, members in zip(df["item_name"].tolist(), df["members"].tolist()):
+        if not isinstance(name, str) or name_mapping.get(name) == SHARED:
+            continue
+        canonicals = canonical_names(name, name_mapping)
+        if not canonicals:
+            continue
+        # CSV rows without members read as NaN
+        members = split_members(members) if isinstance(members, (str, list, tuple, np.ndarray)) else []
+        yield name, members, canonicals[0]
+
+
+def train_classifier(df, name_mapping):
+    """Local item → members model arrays (services.classifier format)."""
+    return classifier.train(classifier_rows(df, name_mapping))
+
+
+def copy_atomic(src, dst):
+    """Copy so readers (the running backend) never see a half-written file."""
+    tmp = dst.with_name(dst.name + ".tmp")
+    shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Build member preference profiles")
+    parser.add_argument("--jsonl", action="store_true",
+                        help="Stream items from expenses_raw.jsonl (extract_expenses.py --stream) instead of items_flat.csv")
+    parser.add_argument("--parquet", action="store_true", help="Read items.parquet instead of items_flat.csv")
+    parser.add_argument("--full", action="store_true", help="Ignore profile_state.json and rebuild from every item row")
+    parser.add_argument("--no-publish", action="store_true", help="Don't copy the outputs into backend/data/")
+    args = parser.parse_args()
+
     # Load data
-    if not CSV_PATH.exists():
-        print(f"Error: {CSV_PATH} not found. Run extract_expenses.py first.")
+    source = RAW_JSONL if args.jsonl else ITEMS_PARQUET if args.parquet else CSV_PATH
+    if not source.exists():
+        print(f"Error: {source} not found. Run extract_expenses.py{' --stream' if args.jsonl else ''} first.")
         return
 
     if not MAPPING_PATH.exists():
         print(f"Error: {MAPPING_PATH} not found. Run the Streamlit normalize_app.py first.")
         return
 
-    df = pd.read_csv(CSV_PATH)
     with open(MAPPING_PATH) as f:
         name_mapping = json.load(f)
 
-    print(f"Loaded {len(df)} item rows, {len(name_mapping)} name mappings")
-
-    # Build expanded rows: one row per (canonical_name, original_row)
-    # Handles comma-separated canonical names for combined items (e.g. "paneer, onions")
-    expanded_rows = []
-    for _, row in df.iterrows():
-        raw_name = row["item_name"]
-        mapped = name_mapping.get(raw_name)
-
-        if mapped is None:
-            # Fallback: use lowercased raw name
-            canonicals = [raw_name.lower().strip()]
-        elif mapped == "__SHARED__":
-            canonicals = ["__SHARED__"]
-        elif "," in mapped:
-            # Combined item — split into multiple canonical names
-            canonicals = [c.strip() for c in mapped.split(",") if c.strip()]
-        else:
-            canonicals = [mapped]
-
-        for canon in canonicals:
-            expanded_rows.append({
-                "canonical_name": canon,
-                "item_price": row["item_price"],
-                "members": row["members"],
-            })
-
-    df_expanded = pd.DataFrame(expanded_rows)
-    print(f"Expanded to {len(df_expanded)} rows ({len(df)} original, {len(df_expanded) - len(df)} from splits)")
-
-    # Build preference profiles
-    preferences = {}
-
-    for canonical, group in df_expanded.groupby("canonical_name"):
-        # Count member frequency
-        member_counts = defaultdict(int)
-        for members_str in group["members"]:
-            if pd.isna(members_str):
-                continue
-            for member in str(members_str).split("|"):
-                member = member.strip()
-                if member:
-                    member_counts[member] += 1
-
-        preferences[canonical] = {
-            "members": dict(sorted(member_counts.items(), key=lambda x: -x[1])),
-            "total_appearances": len(group),
-            "avg_price": round(group["item_price"].mean(), 2),
-        }
+    df = load_item_rows(source, jsonl=args.jsonl, parquet=args.parquet)
+    print(f"Loaded {len(df)} item rows from {source.name}, {len(name_mapping)} name mappings")
+
+    # Fold new expenses into the saved aggregates, or rebuild them
+    fingerprint = mapping_fingerprint(name_mapping, df["item_name"].unique())
+    state = None if args.full else load_state(STATE_PATH)
+    if state:
+        processed = set(state["expense_ids"])
+        covered = df["expense_id"].isin(processed)
+        if state.get("mapping_fingerprint") != mapping_fingerprint(name_mapping, df.loc[covered, "item_name"].unique()):
+            print("Name mapping changed for items already aggregated; rebuilding from scratch")
+            state = None
 
-    # Sort by total appearances
-    preferences = dict(sorted(preferences.items(), key=lambda x: -x[1]["total_appearances"]))
+    if state:
+        new_rows = df[~covered]
+        aggregates = state["aggregates"]
+        delta, num_expanded = build_aggregates(new_rows, name_mapping)
+        merge(aggregates, delta)
+        expense_ids = processed | set(new_rows["expense_id"])
+        print(f"Applied {len(new_rows)} new item rows from {len(expense_ids) - len(processed)} expenses "
+              f"({num_expanded} canonical rows) to the saved aggregates")
+    else:
+        aggregates, num_expanded = build_aggregates(df, name_mapping)
+        expense_ids = set(df["expense_id"])
+        print(f"Expanded to {num_expanded} rows ({len(df)} original, {num_expanded - len(df)} from splits)")
+
+    preferences = to_preferences(aggregates)
 
     print(f"\nBuilt preferences for {len(preferences)} canonical items")
     print(f"Top 10 most frequent items:")
@@ -101,11 +386,31 @@ def main():
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     with open(OUTPUT_PATH, "w") as f:
         json.dump(preferences, f, indent=2)
-    print(f"\nSaved preferences to {OUTPUT_PATH}")
+    save_state(STATE_PATH, aggregates, expense_ids, fingerprint)
+    print(f"\nSaved preferences to {OUTPUT_PATH} (aggregates in {STATE_PATH.name})")
+
+    # Per-group shards for the backend's group-scoped auto-split
+    has_groups = attach_group_ids(df, jsonl=args.jsonl, parquet=args.parquet)
+    if has_groups:
+        index = write_shards(build_shards(df, name_mapping), fingerprint)
+        print(f"Saved {len(index)} group profiles to {PROFILES_DIR}")
+    else:
+        print(f"Warning: no group IDs ({EXPENSES_CSV.name} / {EXPENSES_PARQUET.name} missing); skipped group profiles")
+
+    model = train_classifier(df, name_mapping)
+    classifier.save(CLASSIFIER_PATH, model)
+    print(f"Trained local item classifier on {len(model['keys'])} distinct names ({CLASSIFIER_PATH.name})")
+
+    if args.no_publish:
+        return
 
-    # Copy to backend/data/
+    # Copy to backend/data/ (a running backend picks up the new state on its next flush)
     BACKEND_DATA_DIR.mkdir(parents=True, exist_ok=True)
-    shutil.copy2(OUTPUT_PATH, BACKEND_OUTPUT)
+    copy_atomic(OUTPUT_PATH, BACKEND_OUTPUT)
+    copy_atomic(STATE_PATH, BACKEND_STATE)
+    copy_atomic(CLASSIFIER_PATH, BACKEND_CLASSIFIER)
+    if has_groups:
+        publish_shards()
     print(f"Copied to {BACKEND_OUTPUT}")
 
 
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Held-out evaluation of the local item → members classifier (backend/services/classifier.py).
+
+Splits the item rows by expense (a stable hash of the expense ID puts about
+--test-fraction of expenses in the test set), trains on the rest exactly as
+build_profiles.py does, and predicts every test item with the expense's own
+members as the active members. For each confidence threshold it reports:
+  - coverage: share of test items answered locally (Gemini calls avoided)
+  - exact / jaccard: member-set exact-match rate and mean Jaccard on those items
+and the overall accuracy and per-item latency.
+
+Usage:
+    python analysis/evaluate_classifier.py
+    python analysis/evaluate_classifier.py --parquet --test-fraction 0.3
+    python analysis/evaluate_classifier.py --format json > classifier_eval.json
+"""
+
+import argparse
+import json
+import time
+import zlib
+
+from build_profiles import (
+    CSV_PATH, ITEMS_PARQUET, MAPPING_PATH, RAW_JSONL, load_item_rows, split_members, train_classifier,
+)
+from services.classifier import CLASSIFIER_MIN_CONFIDENCE, ItemClassifier
+
+THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9]
+
+
+def is_test(expense_id, test_fraction):
+    """Stable train/test assignment of an expense (no RNG, same split every run)."""
+    return zlib.crc32(str(expense_id).encode()) % 10_000 < test_fraction * 10_000
+
+
+def jaccard(a, b):
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def evaluate(df, name_mapping, test_fraction=0.2, thresholds=THRESHOLDS):
+    """Metrics dict for a model trained on the train expenses and run on the test expenses."""
+    test_mask = df["expense_id"].map(lambda e: is_test(e, test_fraction))
+    train_df, test_df = df[~test_mask], df[test_mask]
+
+    start = time.perf_counter()
+    model = ItemClassifier(train_classifier(train_df, name_mapping))
+    train_seconds = time.perf_counter() - start
+
+    # Ground truth and the expense's members (the members a receipt would be split between)
+    test_rows = []
+    for expense_id, rows in test_df.groupby("expense_id", sort=False):
+        truths = [split_members(m) if not isinstance(m, float) else [] for m in rows["members"].tolist()]
+        active = sorted({m for members in truths for m in members})
+        for name, truth in zip(rows["item_name"].tolist(), truths):
+            if isinstance(name, str) and truth and name_mapping.get(name) != "__SHARED__":
+                test_rows.append((name, truth, active))
+
+    start = time.perf_counter()
+    predictions = [model.predict(name, active) for name, _, active in test_rows]
+    predict_seconds = time.perf_counter() - start
+
+    def summarize(selected):
+        pairs = [(p["members"], truth) for p, (_, truth, _) in selected]
+        return {
+            "items": len(pairs),
+            "coverage": len(pairs) / len(test_rows) if test_rows else 0.0,
+            "exact": sum(set(p) == set(t) for p, t in pairs) / len(pairs) if pairs else 0.0,
+            "jaccard": sum(jaccard(p, t) for p, t in pairs) / len(pairs) if pairs else 0.0,
+        }
+
+    scored = list(zip(predictions, test_rows))
+    return {
+        "train_expenses": int(train_df["expense_id"].nunique()),
+        "test_expenses": int(test_df["expense_id"].nunique()),
+        "train_names": len(model),
+        "test_items": len(test_rows),
+        "train_seconds": round(train_seconds, 3),
+        "predict_ms_per_item": round(1000 * predict_seconds / max(len(test_rows), 1), 4),
+        "all_items": summarize(scored),
+        "thresholds": {
+            str(t): summarize([(p, row) for p, row in scored if p["confidence"] >= t and p["members"]])
+            for t in thresholds
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the local item classifier on held-out expenses")
+    parser.add_argument("--jsonl", action="store_true", help="Stream items from expenses_raw.jsonl")
+    parser.add_argument("--parquet", action="store_true", help="Read items.parquet instead of items_flat.csv")
+    parser.add_argument("--test-fraction", type=float, default=0.2, help="Share of expenses held out")
+    parser.add_argument("--format", choices=["text", "json"], default="text", help="Output format")
+    args = parser.parse_args()
+
+    source = RAW_JSONL if args.jsonl else ITEMS_PARQUET if args.parquet else CSV_PATH
+    if not source.exists():
+        print(f"Error: {source} not found. Run extract_expenses.py first.")
+        return
+    name_mapping = {}
+    if MAPPING_PATH.exists():
+        with open(MAPPING_PATH) as f:
+            name_mapping = json.load(f)
+
+    df = load_item_rows(source, jsonl=args.jsonl, parquet=args.parquet)
+    result = evaluate(df, name_mapping, test_fraction=args.test_fraction)
+
+    if args.format == "json":
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"Trained on {result['train_expenses']} expenses ({result['train_names']} distinct names) "
+          f"in {result['train_seconds']:.2f}s; testing on {result['test_items']} items "
+          f"from {result['test_expenses']} expenses")
+    print(f"Prediction: {result['predict_ms_per_item']:.3f} ms per item")
+    overall = result["all_items"]
+    print(f"All items:  exact {overall['exact']:.1%}  jaccard {overall['jaccard']:.3f}")
+    print(f"\n{'threshold':>9} {'coverage':>9} {'exact':>7} {'jaccard':>8}   (coverage = Gemini calls avoided)")
+    for threshold, stats in result["thresholds"].items():
+        marker = "  <- CLASSIFIER_MIN_CONFIDENCE" if float(threshold) == CLASSIFIER_MIN_CONFIDENCE else ""
+        print(f"{threshold:>9} {stats['coverage']:>8.1%} {stats['exact']:>6.1%} {stats['jaccard']:>8.3f}{marker}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,35 @@
 Extract all itemized expenses from Splitwise that were created by SplitWise AI.
 
 Looks for expenses where the `details` field starts with "EXPENSE_ID:" and
-contains "---ITEMDATA---" with JSON item data.
+contains "---ITEMDATA---" with item data (compact v2 or legacy JSON).
 
 Usage:
     python extract_expenses.py                  # Extract all expenses
     python extract_expenses.py --group-id 123   # Filter by group
     python extract_expenses.py --list-groups    # List available groups
     python extract_expenses.py --with-comments  # Also fetch comments (slower)
+    python extract_expenses.py --full           # Ignore the checkpoint, refetch everything
+    python extract_expenses.py --concurrency 8  # Parallel page/comment requests (default 4)
+    python extract_expenses.py --stream         # Write JSONL/CSV page by page (flat memory)
+
+After the first run, a checkpoint (latest `updated_at` seen and the extracted
+expense IDs) is kept in data/extract_checkpoint.json. Later runs only fetch
+expenses created, updated or deleted since then and merge them into the
+existing dataset.
+
+Pages and comments are fetched by a thread pool. Every request still goes
+through the shared token-bucket limiter (SPLITWISE_RATE_LIMIT /
+SPLITWISE_RATE_BURST) with retry on 429, so raising --concurrency never
+exceeds the configured request rate.
+
+--stream transforms each page as it arrives and appends it to
+expenses_raw.jsonl and the two CSVs, so memory does not grow with the length
+of the history. It is always a full pass in API order; it neither reads nor
+updates the checkpoint.
+
+When pyarrow is installed, both modes also write typed Parquet files
+(expenses.parquet, items.parquet): members as list columns, dates as UTC
+timestamps and dictionary-encoded item names, with a fixed schema.
 """
 
 import argparse
@@ -17,12 +39,28 @@ import json
 import csv
 import os
 import sys
+import threading
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
 
 from dotenv import load_dotenv
 from splitwise import Splitwise
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet outputs are optional
+    pa = pq = None
+
+# Shared Splitwise rate limiter and ITEMDATA codec live in the backend
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+from services.splitwise_client import RateLimitedSplitwise  # noqa: E402
+from services import itemdata  # noqa: E402
+
 
 # Load credentials from frontend/.env
 FRONTEND_ENV = Path(__file__).resolve().parent.parent / "frontend" / ".env"
@@ -33,79 +71,210 @@ CONSUMER_SECRET = os.getenv("NEXT_PUBLIC_SPLITWISE_SECRET_KEY")
 API_KEY = os.getenv("NEXT_PUBLIC_SPLITWISE_API_KEY")
 
 DATA_DIR = Path(__file__).resolve().parent / "data"
+RAW_JSON_PATH = DATA_DIR / "expenses_raw.json"
+RAW_JSONL_PATH = DATA_DIR / "expenses_raw.jsonl"
+EXPENSES_CSV_PATH = DATA_DIR / "expenses_flat.csv"
+ITEMS_CSV_PATH = DATA_DIR / "items_flat.csv"
+EXPENSES_PARQUET_PATH = DATA_DIR / "expenses.parquet"
+ITEMS_PARQUET_PATH = DATA_DIR / "items.parquet"
+CHECKPOINT_PATH = DATA_DIR / "extract_checkpoint.json"
+CHECKPOINT_VERSION = 1
+PAGE_SIZE = 50
+DEFAULT_CONCURRENCY = 4
+
+EXPENSE_CSV_FIELDS = [
+    "expense_id", "stored_expense_id", "description", "cost", "date",
+    "created_at", "group_id", "payer", "num_users", "num_items",
+    "split_members", "split_amounts",
+]
+ITEM_CSV_FIELDS = [
+    "expense_id", "expense_description", "expense_date",
+    "item_name", "item_price", "num_members", "members", "per_member_cost",
+]
+
+if pa is not None:
+    _TIMESTAMP = pa.timestamp("ms", tz="UTC")
+    EXPENSES_SCHEMA = pa.schema([
+        ("expense_id", pa.string()),
+        ("stored_expense_id", pa.string()),
+        ("description", pa.string()),
+        ("cost", pa.float64()),
+        ("date", _TIMESTAMP),
+        ("created_at", _TIMESTAMP),
+        ("updated_at", _TIMESTAMP),
+        ("group_id", pa.string()),
+        ("payer", pa.string()),
+        ("num_users", pa.int32()),
+        ("num_items", pa.int32()),
+        ("split_members", pa.list_(pa.string())),
+        ("split_amounts", pa.list_(pa.float64())),
+    ])
+    ITEMS_SCHEMA = pa.schema([
+        ("expense_id", pa.string()),
+        ("expense_description", pa.string()),
+        ("expense_date", _TIMESTAMP),
+        ("item_name", pa.dictionary(pa.int32(), pa.string())),
+        ("item_price", pa.float64()),
+        ("num_members", pa.int32()),
+        ("members", pa.list_(pa.string())),
+        ("per_member_cost", pa.float64()),
+    ])
 
 
 def get_splitwise():
-    """Initialize and return authenticated Splitwise instance."""
+    """Initialize and return authenticated, rate-limited Splitwise instance."""
     if not all([CONSUMER_KEY, CONSUMER_SECRET, API_KEY]):
         print("Error: Missing Splitwise credentials in frontend/.env")
         print("Required: NEXT_PUBLIC_SPLITWISE_CONSUMER_KEY, NEXT_PUBLIC_SPLITWISE_SECRET_KEY, NEXT_PUBLIC_SPLITWISE_API_KEY")
         sys.exit(1)
 
-    sObj = Splitwise(CONSUMER_KEY, CONSUMER_SECRET, api_key=API_KEY)
+    sObj = RateLimitedSplitwise(Splitwise(CONSUMER_KEY, CONSUMER_SECRET, api_key=API_KEY), API_KEY)
     user = sObj.getCurrentUser()
     print(f"Authenticated as: {user.getFirstName()} {user.getLastName()}")
     return sObj
 
 
 def parse_expense_comment(comment: str):
-    """Parse the JSON data from Splitwise expense details.
-
-    Replicates backend/app.py:616 logic.
-    """
+    """Parse the item data (compact v2 or legacy JSON) from Splitwise expense details."""
     try:
-        if "---ITEMDATA---" in comment:
-            parts = comment.split("---ITEMDATA---")
-            if len(parts) > 1:
-                json_data = parts[1].strip()
-                return json.loads(json_data)
+        return itemdata.parse_details(comment).items
     except Exception as e:
         print(f"  Warning: Error parsing item data: {e}")
     return None
 
 
-def parse_expense_id(details: str):
-    """Extract the EXPENSE_ID value from details field."""
-    if not details:
-        return None
-    for line in details.split("\n"):
-        line = line.strip()
-        if line.startswith("EXPENSE_ID:"):
-            return line.split("EXPENSE_ID:")[1].strip()
-    return None
+class Progress:
+    """Thread-safe done/total counter that prints throughput about once a second."""
 
+    def __init__(self, label, total=None):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.start = time.monotonic()
+        self._last_print = self.start
+        self._printed = None
+        self._lock = threading.Lock()
 
-def fetch_all_expenses(sObj, group_id=None):
-    """Paginate through ALL Splitwise expenses."""
-    all_expenses = []
-    offset = 0
-    limit = 50
+    def advance(self, n=1):
+        with self._lock:
+            self.done += n
+            now = time.monotonic()
+            if now - self._last_print >= 1 or self.done == self.total:
+                self._last_print = now
+                self._print(now)
 
-    while True:
-        kwargs = {"offset": offset, "limit": limit}
-        if group_id:
-            kwargs["group_id"] = group_id
+    def finish(self):
+        if self._printed != self.done:
+            self._print(time.monotonic())
 
-        print(f"  Fetching expenses offset={offset}...", end="", flush=True)
-        expenses = sObj.getExpenses(**kwargs)
-        print(f" got {len(expenses)}")
+    def _print(self, now):
+        self._printed = self.done
+        elapsed = max(now - self.start, 1e-9)
+        of_total = f"/{self.total}" if self.total is not None else ""
+        print(f"  {self.label}: {self.done}{of_total} ({self.done / elapsed:.1f}/s, {elapsed:.1f}s)", flush=True)
 
-        if not expenses:
-            break
 
-        all_expenses.extend(expenses)
-        offset += limit
+def iter_expense_pages(sObj, group_id=None, updated_after=None, concurrency=DEFAULT_CONCURRENCY):
+    """Yield pages of Splitwise expenses in offset order as they arrive.
 
+    Keeps `concurrency` pages in flight and stops at the first short page.
+    Expenses already yielded on an earlier page are dropped (they can shift
+    between pages while we paginate).
+    """
+    kwargs = {"limit": PAGE_SIZE}
+    if group_id:
+        kwargs["group_id"] = group_id
+    if updated_after:
+        kwargs["updated_after"] = updated_after
+
+    progress = Progress("expenses fetched")
+
+    def fetch_page(offset):
+        expenses = sObj.getExpenses(offset=offset, **kwargs)
+        progress.advance(len(expenses))
+        return expenses
+
+    seen = set()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        next_offset = 0
+        in_flight = []
+        while True:
+            while len(in_flight) < max(1, concurrency):
+                in_flight.append(pool.submit(fetch_page, next_offset))
+                next_offset += PAGE_SIZE
+            page = in_flight.pop(0).result()
+            fresh = [exp for exp in page if exp.getId() not in seen]
+            seen.update(exp.getId() for exp in fresh)
+            yield fresh
+            if len(page) < PAGE_SIZE:
+                # Last page; pages requested past it come back empty
+                for future in in_flight:
+                    future.cancel()
+                break
+    progress.finish()
+
+
+def fetch_all_expenses(sObj, group_id=None, updated_after=None, concurrency=DEFAULT_CONCURRENCY):
+    """Paginate through ALL Splitwise expenses (or only those updated after a timestamp)."""
+    all_expenses = []
+    for page in iter_expense_pages(sObj, group_id, updated_after, concurrency):
+        all_expenses.extend(page)
     return all_expenses
 
 
+def get_expense_comments(sObj, expense_id):
+    """Comments on one expense, as plain dicts ([] if they cannot be fetched)."""
+    try:
+        comments = sObj.getComments(expense_id)
+    except Exception as e:
+        print(f"  Warning: Could not fetch comments for {expense_id}: {e}")
+        return []
+    return [
+        {
+            "user": f"{c.getUser().getFirstName() if c.getUser() else 'Unknown'}",
+            "content": c.getContent(),
+            "created_at": c.getCreatedAt(),
+        }
+        for c in comments
+    ]
+
+
+def attach_comments(sObj, expenses_data, concurrency=DEFAULT_CONCURRENCY, progress=None):
+    """Fetch comments for every extracted expense in parallel (order is preserved)."""
+    own_progress = progress is None
+    if own_progress:
+        progress = Progress("comments fetched", total=len(expenses_data))
+
+    def fetch(exp):
+        comments = get_expense_comments(sObj, exp["expense_id"])
+        progress.advance()
+        return comments
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for exp, comments in zip(expenses_data, pool.map(fetch, expenses_data)):
+            exp["comments"] = comments
+    if own_progress:
+        progress.finish()
+
+
+def skip_reason(expense):
+    """Why an expense is not an itemized SplitWise AI expense, or None if it is."""
+    if expense.getPayment():
+        return "payments"
+    if expense.getDeletedAt():
+        return "deleted"
+    if not (expense.getDetails() or "").startswith("EXPENSE_ID:"):
+        return "no EXPENSE_ID"
+    return None
+
+
 def extract_expense_data(expense, sObj=None, fetch_comments=False):
     """Extract structured data from a single Splitwise expense."""
     details = expense.getDetails() or ""
     expense_id = str(expense.getId())
 
     # Parse the stored EXPENSE_ID and item data
-    stored_id = parse_expense_id(details)
+    stored_id = itemdata.parse_expense_id(details)
     item_data = parse_expense_comment(details)
 
     # Extract user splits
@@ -128,6 +297,7 @@ def extract_expense_data(expense, sObj=None, fetch_comments=False):
         "cost": float(expense.getCost() or 0),
         "date": expense.getDate(),
         "created_at": expense.getCreatedAt(),
+        "updated_at": expense.getUpdatedAt(),
         "group_id": str(expense.getGroupId()) if expense.getGroupId() else None,
         "payer": payer,
         "splits": splits,
@@ -137,104 +307,303 @@ def extract_expense_data(expense, sObj=None, fetch_comments=False):
         "raw_details": details,
     }
 
-    # Optionally fetch comments
+    # Optionally fetch comments (main() batches these through attach_comments instead)
     if fetch_comments and sObj:
-        try:
-            time.sleep(0.5)  # Rate limit
-            comments = sObj.getComments(expense_id)
-            data["comments"] = [
-                {
-                    "user": f"{c.getUser().getFirstName() if c.getUser() else 'Unknown'}",
-                    "content": c.getContent(),
-                    "created_at": c.getCreatedAt(),
-                }
-                for c in comments
-            ]
-        except Exception as e:
-            print(f"  Warning: Could not fetch comments for {expense_id}: {e}")
-            data["comments"] = []
+        data["comments"] = get_expense_comments(sObj, expense_id)
 
     return data
 
 
+def expense_csv_row(exp):
+    """Row of expenses_flat.csv for one extracted expense."""
+    return {
+        "expense_id": exp["expense_id"],
+        "stored_expense_id": exp.get("stored_expense_id"),
+        "description": exp["description"],
+        "cost": exp["cost"],
+        "date": exp["date"],
+        "created_at": exp.get("created_at"),
+        "group_id": exp.get("group_id"),
+        "payer": exp.get("payer"),
+        "num_users": exp.get("num_users", 0),
+        "num_items": exp.get("num_items", 0),
+        "split_members": "|".join(exp.get("splits", {}).keys()),
+        "split_amounts": "|".join(str(v) for v in exp.get("splits", {}).values()),
+    }
+
+
+def item_records(exp):
+    """One row per item of an extracted expense, with members as a list."""
+    for item in exp.get("item_data") or []:
+        # Handle both possible item formats
+        item_name = item.get("name", item.get("item_name", ""))
+        item_price = item.get("price", item.get("item_price", 0))
+
+        # Extract members who are selected for this item
+        members_dict = item.get("members", {})
+        if isinstance(members_dict, dict):
+            selected_members = [m for m, selected in members_dict.items() if selected]
+        elif isinstance(members_dict, list):
+            selected_members = members_dict
+        else:
+            selected_members = []
+
+        per_member_cost = float(item_price) / len(selected_members) if selected_members else 0
+
+        yield {
+            "expense_id": exp["expense_id"],
+            "expense_description": exp["description"],
+            "expense_date": exp["date"],
+            "item_name": item_name,
+            "item_price": float(item_price),
+            "num_members": len(selected_members),
+            "members": selected_members,
+            "per_member_cost": round(per_member_cost, 2),
+        }
+
+
+def item_csv_rows(exp):
+    """Rows of items_flat.csv for one extracted expense."""
+    for row in item_records(exp):
+        row["members"] = "|".join(row["members"])
+        yield row
+
+
+def parse_timestamp(value):
+    """Splitwise ISO 8601 string -> datetime (None if missing or unparseable)."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def parquet_tables(expenses_data):
+    """Arrow tables (expenses, items) for a batch of extracted expenses."""
+    expense_rows = []
+    item_rows = []
+    for exp in expenses_data:
+        splits = exp.get("splits") or {}
+        expense_rows.append({
+            "expense_id": exp["expense_id"],
+            "stored_expense_id": exp.get("stored_expense_id"),
+            "description": exp["description"],
+            "cost": exp["cost"],
+            "date": parse_timestamp(exp["date"]),
+            "created_at": parse_timestamp(exp.get("created_at")),
+            "updated_at": parse_timestamp(exp.get("updated_at")),
+            "group_id": exp.get("group_id"),
+            "payer": exp.get("payer"),
+            "num_users": exp.get("num_users", 0),
+            "num_items": exp.get("num_items", 0),
+            "split_members": list(splits.keys()),
+            "split_amounts": [float(v) for v in splits.values()],
+        })
+        for row in item_records(exp):
+            row["expense_date"] = parse_timestamp(row["expense_date"])
+            item_rows.append(row)
+    return (
+        pa.Table.from_pylist(expense_rows, schema=EXPENSES_SCHEMA),
+        pa.Table.from_pylist(item_rows, schema=ITEMS_SCHEMA),
+    )
+
+
+class ParquetOutputs:
+    """Append batches of extracted expenses to expenses.parquet and items.parquet.
+
+    Batches are buffered up to `row_group_size` expenses so streaming runs do
+    not produce one tiny row group per page. Files are written under a .tmp
+    name and moved into place by close().
+    """
+
+    def __init__(self, row_group_size=2000):
+        self.row_group_size = row_group_size
+        self.buffer = []
+        self.paths = [EXPENSES_PARQUET_PATH, ITEMS_PARQUET_PATH]
+        self.tmp_paths = [path.with_name(path.name + ".tmp") for path in self.paths]
+        self.writers = [
+            pq.ParquetWriter(tmp_path, schema)
+            for tmp_path, schema in zip(self.tmp_paths, (EXPENSES_SCHEMA, ITEMS_SCHEMA))
+        ]
+
+    def write(self, expenses_data):
+        self.buffer.extend(expenses_data)
+        if len(self.buffer) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        for writer, table in zip(self.writers, parquet_tables(self.buffer)):
+            writer.write_table(table)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        for writer in self.writers:
+            writer.close()
+        for tmp_path, path in zip(self.tmp_paths, self.paths):
+            os.replace(tmp_path, path)
+
+
 def save_data(expenses_data):
     """Save extracted data to JSON and CSV files."""
     DATA_DIR.mkdir(parents=True, exist_ok=True)
 
     # 1. Full JSON
-    json_path = DATA_DIR / "expenses_raw.json"
+    json_path = RAW_JSON_PATH
     with open(json_path, "w") as f:
         json.dump(expenses_data, f, indent=2, default=str)
     print(f"Saved {len(expenses_data)} expenses to {json_path}")
 
     # 2. Expenses flat CSV
-    csv_path = DATA_DIR / "expenses_flat.csv"
+    csv_path = EXPENSES_CSV_PATH
     with open(csv_path, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            "expense_id", "stored_expense_id", "description", "cost", "date",
-            "created_at", "group_id", "payer", "num_users", "num_items",
-            "split_members", "split_amounts",
-        ])
+        writer = csv.DictWriter(f, fieldnames=EXPENSE_CSV_FIELDS)
         writer.writeheader()
-        for exp in expenses_data:
-            writer.writerow({
-                "expense_id": exp["expense_id"],
-                "stored_expense_id": exp.get("stored_expense_id"),
-                "description": exp["description"],
-                "cost": exp["cost"],
-                "date": exp["date"],
-                "created_at": exp.get("created_at"),
-                "group_id": exp.get("group_id"),
-                "payer": exp.get("payer"),
-                "num_users": exp.get("num_users", 0),
-                "num_items": exp.get("num_items", 0),
-                "split_members": "|".join(exp.get("splits", {}).keys()),
-                "split_amounts": "|".join(str(v) for v in exp.get("splits", {}).values()),
-            })
+        writer.writerows(expense_csv_row(exp) for exp in expenses_data)
     print(f"Saved expenses flat CSV to {csv_path}")
 
     # 3. Items flat CSV
-    items_csv_path = DATA_DIR / "items_flat.csv"
-    item_rows = []
-    for exp in expenses_data:
-        if not exp.get("item_data"):
-            continue
-        for item in exp["item_data"]:
-            # Handle both possible item formats
-            item_name = item.get("name", item.get("item_name", ""))
-            item_price = item.get("price", item.get("item_price", 0))
-
-            # Extract members who are selected for this item
-            members_dict = item.get("members", {})
-            if isinstance(members_dict, dict):
-                selected_members = [m for m, selected in members_dict.items() if selected]
-            elif isinstance(members_dict, list):
-                selected_members = members_dict
-            else:
-                selected_members = []
-
-            per_member_cost = float(item_price) / len(selected_members) if selected_members else 0
-
-            item_rows.append({
-                "expense_id": exp["expense_id"],
-                "expense_description": exp["description"],
-                "expense_date": exp["date"],
-                "item_name": item_name,
-                "item_price": float(item_price),
-                "num_members": len(selected_members),
-                "members": "|".join(selected_members),
-                "per_member_cost": round(per_member_cost, 2),
-            })
-
+    items_csv_path = ITEMS_CSV_PATH
+    item_rows = [row for exp in expenses_data for row in item_csv_rows(exp)]
     with open(items_csv_path, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            "expense_id", "expense_description", "expense_date",
-            "item_name", "item_price", "num_members", "members", "per_member_cost",
-        ])
+        writer = csv.DictWriter(f, fieldnames=ITEM_CSV_FIELDS)
         writer.writeheader()
         writer.writerows(item_rows)
     print(f"Saved {len(item_rows)} item rows to {items_csv_path}")
 
+    # 4. Typed Parquet
+    if pa is None:
+        print("pyarrow not installed; skipping Parquet outputs")
+        return
+    parquet = ParquetOutputs()
+    parquet.write(expenses_data)
+    parquet.close()
+    print(f"Saved Parquet files to {EXPENSES_PARQUET_PATH.name}, {ITEMS_PARQUET_PATH.name}")
+
+
+def stream_extract(sObj, group_id=None, with_comments=False, concurrency=DEFAULT_CONCURRENCY):
+    """Extract page by page, appending to expenses_raw.jsonl and the CSVs.
+
+    Only one page of expenses is held in memory for the JSONL and CSVs; the
+    Parquet files buffer up to ParquetOutputs.row_group_size expenses per row
+    group, independent of page boundaries. Files are written under a .tmp name
+    and moved into place once the run completes.
+    Returns (expenses written, item rows written, Counter of skip reasons).
+    """
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    paths = [RAW_JSONL_PATH, EXPENSES_CSV_PATH, ITEMS_CSV_PATH]
+    tmp_paths = [path.with_name(path.name + ".tmp") for path in paths]
+    comment_progress = Progress("comments fetched") if with_comments else None
+    parquet = ParquetOutputs() if pa is not None else None
+    skipped = Counter()
+    num_expenses = num_items = 0
+
+    with open(tmp_paths[0], "w") as jsonl_file, \
+            open(tmp_paths[1], "w", newline="") as expenses_file, \
+            open(tmp_paths[2], "w", newline="") as items_file:
+        expense_writer = csv.DictWriter(expenses_file, fieldnames=EXPENSE_CSV_FIELDS)
+        item_writer = csv.DictWriter(items_file, fieldnames=ITEM_CSV_FIELDS)
+        expense_writer.writeheader()
+        item_writer.writeheader()
+
+        for page in iter_expense_pages(sObj, group_id=group_id, concurrency=concurrency):
+            extracted = []
+            for exp in page:
+                reason = skip_reason(exp)
+                if reason:
+                    skipped[reason] += 1
+                else:
+                    extracted.append(extract_expense_data(exp))
+            if with_comments and extracted:
+                attach_comments(sObj, extracted, concurrency=concurrency, progress=comment_progress)
+
+            for data in extracted:
+                jsonl_file.write(json.dumps(data, default=str) + "\n")
+                expense_writer.writerow(expense_csv_row(data))
+                for row in item_csv_rows(data):
+                    item_writer.writerow(row)
+                    num_items += 1
+            if parquet:
+                parquet.write(extracted)
+            num_expenses += len(extracted)
+
+    if comment_progress:
+        comment_progress.finish()
+    for tmp_path, path in zip(tmp_paths, paths):
+        os.replace(tmp_path, path)
+    if parquet:
+        parquet.close()
+    return num_expenses, num_items, skipped
+
+
+def print_extraction_summary(found, skipped):
+    print(f"\nExtraction complete:")
+    print(f"  Itemized expenses found: {found}")
+    print(f"  Skipped (payments): {skipped['payments']}")
+    print(f"  Skipped (deleted): {skipped['deleted']}")
+    print(f"  Skipped (no EXPENSE_ID): {skipped['no EXPENSE_ID']}")
+
+
+def load_checkpoint(group_id):
+    """Return the previous run's checkpoint and dataset, or (None, None) if a full run is needed."""
+    if not CHECKPOINT_PATH.exists() or not RAW_JSON_PATH.exists():
+        return None, None
+    try:
+        with open(CHECKPOINT_PATH) as f:
+            checkpoint = json.load(f)
+        with open(RAW_JSON_PATH) as f:
+            existing = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read checkpoint ({e}), doing a full refresh")
+        return None, None
+
+    if checkpoint.get("version") != CHECKPOINT_VERSION or not checkpoint.get("updated_at"):
+        print("Checkpoint format changed, doing a full refresh")
+        return None, None
+    if checkpoint.get("group_id") != group_id:
+        print("Checkpoint was made for a different --group-id, doing a full refresh")
+        return None, None
+    if sorted(exp["expense_id"] for exp in existing) != checkpoint.get("expense_ids"):
+        print("expenses_raw.json no longer matches the checkpoint, doing a full refresh")
+        return None, None
+    return checkpoint, existing
+
+
+def save_checkpoint(group_id, updated_at, expenses_data):
+    """Write the checkpoint atomically, after the data files it describes."""
+    checkpoint = {
+        "version": CHECKPOINT_VERSION,
+        "group_id": group_id,
+        "updated_at": updated_at,
+        "expense_ids": sorted(exp["expense_id"] for exp in expenses_data),
+    }
+    tmp_path = CHECKPOINT_PATH.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, CHECKPOINT_PATH)
+
+
+def sort_expenses(expenses_data):
+    """Newest first, so full and incremental runs write identical files."""
+    return sorted(expenses_data, key=lambda e: (e.get("date") or "", int(e["expense_id"])), reverse=True)
+
+
+def merge_expenses(existing, changed, removed_ids):
+    """Apply changed and removed expenses (by expense_id) to the previous dataset."""
+    merged = {exp["expense_id"]: exp for exp in existing}
+    for expense_id in removed_ids:
+        merged.pop(expense_id, None)
+    for exp in changed:
+        previous = merged.get(exp["expense_id"])
+        # Keep comments fetched by an earlier --with-comments run
+        if previous and "comments" in previous and "comments" not in exp:
+            exp["comments"] = previous["comments"]
+        merged[exp["expense_id"]] = exp
+    return sort_expenses(merged.values())
+
 
 def list_groups(sObj):
     """List all available Splitwise groups."""
@@ -250,7 +619,12 @@ def main():
     parser = argparse.ArgumentParser(description="Extract Splitwise expenses created by SplitWise AI")
     parser.add_argument("--group-id", type=int, help="Filter by Splitwise group ID")
     parser.add_argument("--list-groups", action="store_true", help="List available groups and exit")
-    parser.add_argument("--with-comments", action="store_true", help="Also fetch comments (slower due to rate limits)")
+    parser.add_argument("--with-comments", action="store_true", help="Also fetch comments (one request per expense)")
+    parser.add_argument("--full", action="store_true", help="Ignore the checkpoint and rebuild the dataset from scratch")
+    parser.add_argument("--stream", action="store_true",
+                        help="Write expenses_raw.jsonl and the CSVs page by page (flat memory, always a full pass)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Parallel Splitwise requests (default {DEFAULT_CONCURRENCY}); still rate limited")
     args = parser.parse_args()
 
     sObj = get_splitwise()
@@ -259,47 +633,78 @@ def main():
         list_groups(sObj)
         return
 
-    # Fetch all expenses
-    print("\nFetching expenses from Splitwise...")
-    all_expenses = fetch_all_expenses(sObj, group_id=args.group_id)
+    if args.stream:
+        print("\nStreaming expenses from Splitwise...")
+        found, num_items, skipped = stream_extract(
+            sObj, group_id=args.group_id, with_comments=args.with_comments, concurrency=args.concurrency,
+        )
+        print_extraction_summary(found, skipped)
+        print(f"\nSaved {found} expenses to {RAW_JSONL_PATH}")
+        print(f"Saved {num_items} item rows to {ITEMS_CSV_PATH}")
+        return
+
+    checkpoint, existing = (None, None) if args.full else load_checkpoint(args.group_id)
+    updated_after = checkpoint["updated_at"] if checkpoint else None
+
+    # Fetch all expenses, or only those changed since the checkpoint
+    if updated_after:
+        print(f"\nFetching expenses updated since {updated_after} (use --full to refetch everything)...")
+    else:
+        print("\nFetching expenses from Splitwise...")
+    all_expenses = fetch_all_expenses(
+        sObj, group_id=args.group_id, updated_after=updated_after, concurrency=args.concurrency,
+    )
     print(f"Total expenses fetched: {len(all_expenses)}")
+    latest_update = max([updated_after or ""] + [exp.getUpdatedAt() or "" for exp in all_expenses]) or None
+    if checkpoint:
+        # The checkpoint timestamp is inclusive; don't re-merge what the last run already saw
+        all_expenses = [
+            exp for exp in all_expenses
+            if (exp.getUpdatedAt() or "") > updated_after or str(exp.getId()) not in checkpoint["expense_ids"]
+        ]
 
     # Filter for SplitWise AI expenses (have EXPENSE_ID in details)
     print("\nFiltering for SplitWise AI itemized expenses...")
     extracted = []
-    skipped_payments = 0
-    skipped_deleted = 0
-    skipped_no_id = 0
+    # Expenses that are (no longer) itemized; dropped from the dataset on incremental runs
+    removed_ids = set()
+    skipped = Counter()
 
     for exp in all_expenses:
-        # Skip payments
-        if exp.getPayment():
-            skipped_payments += 1
-            continue
-
-        # Skip deleted
-        if exp.getDeletedAt():
-            skipped_deleted += 1
-            continue
-
-        details = exp.getDetails() or ""
-        if not details.startswith("EXPENSE_ID:"):
-            skipped_no_id += 1
+        # Skip payments, deleted and non-itemized expenses
+        reason = skip_reason(exp)
+        if reason:
+            skipped[reason] += 1
+            removed_ids.add(str(exp.getId()))
             continue
 
         print(f"  Extracting: {exp.getDescription()} (${exp.getCost()})")
-        data = extract_expense_data(exp, sObj=sObj, fetch_comments=args.with_comments)
+        data = extract_expense_data(exp)
         extracted.append(data)
 
-    print(f"\nExtraction complete:")
-    print(f"  Itemized expenses found: {len(extracted)}")
-    print(f"  Skipped (payments): {skipped_payments}")
-    print(f"  Skipped (deleted): {skipped_deleted}")
-    print(f"  Skipped (no EXPENSE_ID): {skipped_no_id}")
+    if args.with_comments and extracted:
+        print(f"\nFetching comments for {len(extracted)} expenses...")
+        attach_comments(sObj, extracted, concurrency=args.concurrency)
+
+    print_extraction_summary(len(extracted), skipped)
+
+    if checkpoint:
+        known = set(checkpoint["expense_ids"])
+        added = sum(1 for exp in extracted if exp["expense_id"] not in known)
+        dropped = len(known & removed_ids)
+        print(f"  Merging into existing dataset: {added} new, {len(extracted) - added} updated, {dropped} removed")
+        if not extracted and not dropped:
+            save_checkpoint(args.group_id, latest_update, existing)
+            print("\nNo changes since the last run.")
+            return
+        extracted = merge_expenses(existing, extracted, removed_ids)
+    else:
+        extracted = sort_expenses(extracted)
 
-    if extracted:
+    if extracted or checkpoint:
         print("\nSaving data...")
         save_data(extracted)
+        save_checkpoint(args.group_id, latest_update, extracted)
         print("\nDone! Files saved to analysis/data/")
     else:
         print("\nNo itemized expenses found. Nothing to save.")
@@ -0,0 +1,291 @@
+"""
+Fuzzy clustering of raw item names, shared by normalize_app.py and the benchmarks.
+
+Similar pairs come from rapidfuzz's multi-core `cdist` (token_sort_ratio),
+computed in row blocks over the upper triangle so memory stays bounded. The
+pairs are then grouped either greedily around seed names (the app's original
+grouping) or into connected components (union-find). Names that only differ
+in case or surrounding whitespace are compared once.
+
+All-pairs scoring is still quadratic. With candidates="lsh", likely-similar
+pairs are first generated in near-linear time (MinHash LSH over character
+shingles of the token-sorted name, plus a sorted-neighbourhood window), and
+only those are scored with token_sort_ratio. That trades a little recall for
+speed; benchmarks/bench_candidate_recall.py measures it.
+"""
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+# Upper bound on score-matrix cells held in memory per block (uint8, so ~32 MB)
+MAX_BLOCK_CELLS = 32_000_000
+
+# LSH defaults: 32 bands of 3 MinHash rows over character 3-grams. A pair with
+# shingle Jaccard 0.4 (typical at token_sort_ratio ~75) collides in some band
+# with probability ~0.88, one at 0.05 with ~0.004.
+LSH_BANDS = 32
+LSH_ROWS = 3
+SHINGLE_SIZE = 3
+# Pair each name with this many neighbours in token-sorted order
+NEIGHBOUR_WINDOW = 4
+# Buckets larger than this get windowed pairs instead of all pairs
+MAX_BUCKET = 200
+# Candidate pairs scored per cpdist call
+VERIFY_CHUNK = 1_000_000
+# Name count above which the app defaults to LSH candidates
+LSH_MIN_NAMES = 20_000
+
+
+def normalize(name):
+    return name.lower().strip()
+
+
+def similar_pairs(names, threshold, workers=-1, on_progress=None):
+    """Index pairs (i < j) of names whose token_sort_ratio is >= threshold.
+
+    `names` should already be normalized. Returns two int64 arrays. Calls
+    `on_progress(rows_done, total_rows)` after each block.
+    """
+    n = len(names)
+    block_size = max(1, MAX_BLOCK_CELLS // max(n, 1))
+    left, right = [], []
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        # Scores below the cutoff come back as 0; the row block is only compared
+        # with itself and later names, since the matrix is symmetric
+        scores = process.cdist(
+            names[start:end], names[start:], scorer=fuzz.token_sort_ratio,
+            score_cutoff=threshold, dtype=np.uint8, workers=workers,
+        )
+        rows, cols = np.nonzero(scores >= threshold)
+        upper = cols > rows
+        left.append(rows[upper] + start)
+        right.append(cols[upper] + start)
+        if on_progress is not None:
+            on_progress(end, n)
+    if not left:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(left).astype(np.int64), np.concatenate(right).astype(np.int64)
+
+
+def _mix64(x):
+    """splitmix64 finalizer over a uint64 array (wrapping arithmetic)."""
+    with np.errstate(over="ignore"):
+        x = x ^ (x >> np.uint64(30))
+        x = x * np.uint64(0xBF58476D1CE4E5B9)
+        x = x ^ (x >> np.uint64(27))
+        x = x * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def _token_sorted(names):
+    return [" ".join(sorted(name.split())) for name in names]
+
+
+def _shingle_hashes(keys, k):
+    """Hashes of every character k-gram of each padded key, plus each key's start offset.
+
+    Keys are padded with spaces so every key has at least one shingle and word
+    boundaries count. Hashing is done on code points in one numpy pass, so it
+    is stable across processes (unlike hash()).
+    """
+    padded = [f" {key} ".ljust(k) for key in keys]
+    lengths = np.fromiter((len(p) for p in padded), dtype=np.int64, count=len(padded))
+    codes = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+    # Polynomial hash of each window; windows crossing into the next key are dropped
+    window_count = len(codes) - k + 1
+    hashes = np.zeros(window_count, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for offset in range(k):
+            hashes = hashes * np.uint64(1_000_003) + codes[offset:offset + window_count]
+    shingles_per_key = lengths - k + 1
+    valid = np.ones(window_count, dtype=bool)
+    ends = starts + lengths
+    for tail in range(1, k):
+        crossing = ends - tail
+        valid[crossing[crossing < window_count]] = False
+    offsets = np.concatenate([[0], np.cumsum(shingles_per_key)[:-1]])
+    return _mix64(hashes[valid]), offsets
+
+
+def minhash_signatures(keys, num_perm, k=SHINGLE_SIZE, seed=0):
+    """(len(keys), num_perm) uint64 MinHash signatures over character k-grams."""
+    hashes, offsets = _shingle_hashes(keys, k)
+    rng = np.random.default_rng(seed)
+    salts = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+    signatures = np.empty((len(keys), num_perm), dtype=np.uint64)
+    for p, salt in enumerate(salts):
+        # One permutation at a time keeps memory at one hash per shingle
+        signatures[:, p] = np.minimum.reduceat(_mix64(hashes ^ salt), offsets)
+    return signatures
+
+
+def _bucket_pairs(keys, rank, max_bucket, window):
+    """All pairs within each bucket of equal `keys`; oversized buckets get windowed pairs by `rank`."""
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    bounds = np.concatenate([[0], np.flatnonzero(np.diff(sorted_keys)) + 1, [len(keys)]])
+    starts, sizes = bounds[:-1], np.diff(bounds)
+    left, right = [], []
+    for size in np.unique(sizes[sizes > 1]).tolist():
+        group_starts = starts[sizes == size]
+        if size <= max_bucket:
+            i, j = np.triu_indices(size, k=1)
+            left.append(order[group_starts[:, None] + i].ravel())
+            right.append(order[group_starts[:, None] + j].ravel())
+            continue
+        for start in group_starts.tolist():
+            members = order[start:start + size]
+            members = members[np.argsort(rank[members], kind="stable")]
+            for d in range(1, window + 1):
+                left.append(members[:-d])
+                right.append(members[d:])
+    return left, right
+
+
+def candidate_pairs(names, bands=LSH_BANDS, rows=LSH_ROWS, k=SHINGLE_SIZE,
+                    window=NEIGHBOUR_WINDOW, max_bucket=MAX_BUCKET, seed=0):
+    """Likely-similar index pairs (i < j), without scoring them.
+
+    Union of MinHash LSH band collisions over character k-grams of the
+    token-sorted names and a sorted-neighbourhood pass pairing each name with
+    the next `window` names in token-sorted order. `names` should already be
+    normalized. Returns two int64 arrays sorted by (i, j).
+    """
+    n = len(names)
+    if n < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    keys = _token_sorted(names)
+    order = np.array(sorted(range(n), key=keys.__getitem__), dtype=np.int64)
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+
+    left, right = [], []
+    for d in range(1, min(window, n - 1) + 1):
+        left.append(order[:-d])
+        right.append(order[d:])
+
+    signatures = minhash_signatures(keys, bands * rows, k=k, seed=seed)
+    for band in range(bands):
+        band_key = signatures[:, band * rows]
+        for col in range(band * rows + 1, (band + 1) * rows):
+            band_key = _mix64(band_key ^ signatures[:, col])
+        band_left, band_right = _bucket_pairs(band_key, rank, max_bucket, window)
+        left.extend(band_left)
+        right.extend(band_right)
+
+    left, right = np.concatenate(left), np.concatenate(right)
+    low, high = np.minimum(left, right), np.maximum(left, right)
+    pair_ids = np.unique(low[low != high] * n + high[low != high])
+    return pair_ids // n, pair_ids % n
+
+
+def similar_pairs_lsh(names, threshold, workers=-1, on_progress=None, **lsh_options):
+    """Like similar_pairs, but only scores the pairs from candidate_pairs.
+
+    Calls `on_progress(pairs_done, total_pairs)` after each scored chunk.
+    """
+    left, right = candidate_pairs(names, **lsh_options)
+    if not len(left):
+        return left, right
+    names = np.asarray(names, dtype=object)
+    keep = []
+    for start in range(0, len(left), VERIFY_CHUNK):
+        end = min(start + VERIFY_CHUNK, len(left))
+        scores = process.cpdist(
+            names[left[start:end]], names[right[start:end]], scorer=fuzz.token_sort_ratio,
+            score_cutoff=threshold, dtype=np.uint8, workers=workers,
+        )
+        keep.append(scores >= threshold)
+        if on_progress is not None:
+            on_progress(end, len(left))
+    keep = np.concatenate(keep)
+    return left[keep], right[keep]
+
+
+CANDIDATES = {"all": similar_pairs, "lsh": similar_pairs_lsh}
+
+
+def greedy_labels(n, left, right):
+    """Seed-based grouping: in index order, each unassigned name claims its unassigned neighbours.
+
+    Same clusters as comparing every name against every later one in a double
+    loop; a label is its cluster's seed (smallest index).
+    """
+    # CSR adjacency over both directions of every pair
+    sources = np.concatenate([left, right])
+    targets = np.concatenate([right, left])
+    order = np.argsort(sources, kind="stable")
+    neighbours = targets[order]
+    indptr = np.searchsorted(sources[order], np.arange(n + 1))
+
+    labels = np.full(n, -1, dtype=np.int64)
+    for i in range(n):
+        if labels[i] >= 0:
+            continue
+        labels[i] = i
+        candidates = neighbours[indptr[i]:indptr[i + 1]]
+        labels[candidates[labels[candidates] < 0]] = i
+    return labels
+
+
+def connected_components(n, left, right):
+    """Component label per node for undirected edges; a label is its component's smallest node."""
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in zip(left.tolist(), right.tolist()):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            # Keep the smaller index as root so labels don't depend on edge order
+            if root_a < root_b:
+                parent[root_b] = root_a
+            else:
+                parent[root_a] = root_b
+    return np.array([find(x) for x in range(n)], dtype=np.int64)
+
+
+LINKAGES = {"greedy": greedy_labels, "components": connected_components}
+
+
+def group_labels(labels):
+    """Clusters (lists of indices) from per-index labels, ordered by first index."""
+    order = np.argsort(labels, kind="stable")
+    sorted_labels = labels[order]
+    bounds = np.flatnonzero(np.diff(sorted_labels)) + 1
+    groups = [group.tolist() for group in np.split(order, bounds)] if len(order) else []
+    groups.sort(key=lambda group: group[0])
+    return groups
+
+
+def cluster_names(names, threshold, linkage="greedy", workers=-1, on_progress=None, candidates="all"):
+    """Cluster item names using token_sort_ratio fuzzy matching.
+
+    Returns a list of clusters, each a list of indices into `names`, ordered
+    by their first index, with indices ascending: the result only depends on
+    the input order, never on worker scheduling.
+
+    linkage="greedy" groups each seed name with the names similar to it;
+    "components" also chains a ~ b ~ c into one cluster, which merges far more
+    on dense catalogues (sizes, brands and pack counts of one product).
+
+    candidates="all" scores every pair; "lsh" scores only the pairs from
+    candidate_pairs, which may miss a few similar pairs but scales to 100k+ names.
+    """
+    if linkage not in LINKAGES:
+        raise ValueError(f"Unknown linkage {linkage!r}; expected one of {sorted(LINKAGES)}")
+    if candidates not in CANDIDATES:
+        raise ValueError(f"Unknown candidates {candidates!r}; expected one of {sorted(CANDIDATES)}")
+    # Exact duplicates after normalizing share one row of the score matrix
+    codes, unique = pd.factorize(pd.Series([normalize(n) for n in names], dtype=object))
+    left, right = CANDIDATES[candidates](list(unique), threshold, workers=workers, on_progress=on_progress)
+    unique_labels = LINKAGES[linkage](len(unique), left, right)
+    return group_labels(unique_labels[codes]) if len(codes) else []
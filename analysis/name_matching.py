@@ -0,0 +1,109 @@
+"""
+Match new raw item names against the canonical names already in item_name_mapping.json.
+
+CanonicalIndex holds every mapped raw name (normalized, deduplicated) and
+every plain canonical name, each pointing at its canonical value. New names
+are scored against it with the same token_sort_ratio as name_clustering, in
+row blocks through rapidfuzz's multi-core `cdist`, so a week's new names cost
+one small (new × mapped) matrix instead of a full reclustering.
+"""
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from name_clustering import MAX_BLOCK_CELLS, cluster_names, normalize
+
+SHARED = "__SHARED__"
+
+SHARED_KEYWORDS = [
+    "tax", "fees", "fee", "tip", "delivery", "service fee", "bag fee",
+    "discount", "tax & fees", "checkout bag", "bag fee tax",
+]
+
+
+def auto_detect_shared(name):
+    """Check if a name is likely a shared/fee item."""
+    lower = name.lower().strip()
+    return any(kw in lower for kw in SHARED_KEYWORDS)
+
+
+class CanonicalIndex:
+    """Normalized mapped names and the canonical name each one maps to."""
+
+    def __init__(self, mapping):
+        targets = {}
+        # Sorted so a key claimed by two raw names always resolves the same way
+        for raw, canonical in sorted(mapping.items()):
+            targets.setdefault(normalize(raw), canonical)
+        for canonical in sorted(set(mapping.values())):
+            # Combined-item mappings ("paneer, onions") are not a single target
+            if canonical != SHARED and "," not in canonical:
+                targets.setdefault(normalize(canonical), canonical)
+        self.keys = list(targets)
+        self.canonicals = list(targets.values())
+
+    def __len__(self):
+        return len(self.keys)
+
+    def match(self, names, threshold=0, workers=-1):
+        """Best indexed key per name: (key positions, scores).
+
+        Scores below `threshold` come back as 0 with position -1. Ties go to
+        the earliest key, so results are deterministic.
+        """
+        n = len(names)
+        positions = np.full(n, -1, dtype=np.int64)
+        scores = np.zeros(n, dtype=np.uint8)
+        if not n or not self.keys:
+            return positions, scores
+        queries = [normalize(name) for name in names]
+        block_size = max(1, MAX_BLOCK_CELLS // len(self.keys))
+        for start in range(0, n, block_size):
+            end = min(start + block_size, n)
+            matrix = process.cdist(
+                queries[start:end], self.keys, scorer=fuzz.token_sort_ratio,
+                score_cutoff=threshold, dtype=np.uint8, workers=workers,
+            )
+            best = matrix.argmax(axis=1)
+            best_scores = matrix[np.arange(end - start), best]
+            found = best_scores > 0
+            positions[start:end][found] = best[found]
+            scores[start:end] = best_scores
+        return positions, scores
+
+    def propose(self, names, threshold, workers=-1):
+        """Proposed assignments for names scoring >= threshold against the index.
+
+        Returns (proposals, leftovers): proposals are dicts with name,
+        canonical, matched (the indexed key) and score, in input order;
+        leftovers are the names with no match.
+        """
+        positions, scores = self.match(names, threshold=threshold, workers=workers)
+        proposals, leftovers = [], []
+        for name, position, score in zip(names, positions.tolist(), scores.tolist()):
+            if position < 0 or score < threshold:
+                leftovers.append(name)
+                continue
+            proposals.append({
+                "name": name,
+                "canonical": self.canonicals[position],
+                "matched": self.keys[position],
+                "score": score,
+            })
+        return proposals, leftovers
+
+
+def normalize_incrementally(names, mapping, threshold, linkage="greedy", candidates="all",
+                            workers=-1, on_progress=None):
+    """Propose canonical names for the unmapped `names`, then cluster what is left.
+
+    Returns (proposals, clusters): see CanonicalIndex.propose; clusters are
+    lists of names from the leftovers, clustered only among themselves.
+    """
+    unmapped = [name for name in names if name not in mapping]
+    proposals, leftovers = CanonicalIndex(mapping).propose(unmapped, threshold, workers=workers)
+    clusters = cluster_names(
+        leftovers, threshold, linkage=linkage, candidates=candidates,
+        workers=workers, on_progress=on_progress,
+    )
+    return proposals, [[leftovers[i] for i in cluster] for cluster in clusters]
@@ -9,64 +9,102 @@ Usage:
     streamlit run analysis/normalize_app.py
 
 Flow:
-    1. Click "Run Clustering" — auto-groups similar names
+    1. Click "Run Clustering" — auto-groups similar names. With an existing
+       mapping, only unmapped names are considered: close matches to mapped
+       names are proposed for their canonical name, the rest are clustered
     2. Review clusters — remove wrong items, apply canonical names
     3. Use the move/merge tool to fix misplaced items
     4. Save when done
 """
 
+import hashlib
 import json
+import sys
 from pathlib import Path
 
 import pandas as pd
 import streamlit as st
-from rapidfuzz import fuzz
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from name_clustering import CANDIDATES, LINKAGES, LSH_MIN_NAMES, cluster_names  # noqa: E402
+from name_matching import auto_detect_shared, normalize_incrementally  # noqa: E402
 
 DATA_DIR = Path(__file__).resolve().parent / "data"
 CSV_PATH = DATA_DIR / "items_flat.csv"
+ITEMS_PARQUET = DATA_DIR / "items.parquet"
 OUTPUT_PATH = DATA_DIR / "item_name_mapping.json"
 
-SHARED_KEYWORDS = [
-    "tax", "fees", "fee", "tip", "delivery", "service fee", "bag fee",
-    "discount", "tax & fees", "checkout bag", "bag fee tax",
-]
+PAGE_SIZES = [10, 25, 50]
+# Clustering results kept per (data, threshold, options); each holds every cluster
+MAX_CACHED_CLUSTERINGS = 8
+
+
+def items_path():
+    """The items file load_items reads: items.parquet if present, else items_flat.csv."""
+    return ITEMS_PARQUET if ITEMS_PARQUET.exists() else CSV_PATH
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _file_hash(path, mtime_ns, size):
+    """sha256 of a file; cached per (path, mtime, size) so reruns only stat it."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_hash(path):
+    stat = Path(path).stat()
+    return _file_hash(str(path), stat.st_mtime_ns, stat.st_size)
 
 
 def load_items():
-    """Load unique item names and their frequency from items_flat.csv."""
-    df = pd.read_csv(CSV_PATH)
-    counts = df["item_name"].value_counts().reset_index()
+    """Load unique item names and their frequency (items.parquet if present, else items_flat.csv)."""
+    path = items_path()
+    if path == ITEMS_PARQUET:
+        names = pd.read_parquet(path, columns=["item_name"])["item_name"].astype(object)
+    else:
+        names = pd.read_csv(path, usecols=["item_name"])["item_name"]
+    counts = names.value_counts().reset_index()
     counts.columns = ["item_name", "count"]
     return counts
 
 
-def cluster_names(names, threshold):
-    """Cluster item names using token_sort_ratio fuzzy matching."""
-    lowered = [n.lower().strip() for n in names]
-    visited = set()
-    clusters = []
+@st.cache_data(show_spinner=False, max_entries=4)
+def load_items_cached(data_hash):
+    """load_items, re-read only when the items file's content hash changes."""
+    return load_items()
+
+
+@st.cache_resource
+def _clustering_cache():
+    # Process-wide, so results survive reruns and are shared across sessions;
+    # a plain dict because cache_data would replay the progress updates
+    return {}
 
-    for i, name_i in enumerate(lowered):
-        if i in visited:
-            continue
-        cluster = [i]
-        visited.add(i)
-        for j, name_j in enumerate(lowered):
-            if j in visited:
-                continue
-            score = fuzz.token_sort_ratio(name_i, name_j)
-            if score >= threshold:
-                cluster.append(j)
-                visited.add(j)
-        clusters.append(cluster)
 
-    return clusters
+def cached_clustering(key, compute):
+    """Result of compute() for `key`, computing at most once per key (bounded, oldest evicted)."""
+    cache = _clustering_cache()
+    if key not in cache:
+        while len(cache) >= MAX_CACHED_CLUSTERINGS:
+            del cache[next(iter(cache))]
+        cache[key] = compute()
+    return cache[key]
 
 
-def auto_detect_shared(name):
-    """Check if a name is likely a shared/fee item."""
-    lower = name.lower().strip()
-    return any(kw in lower for kw in SHARED_KEYWORDS)
+def mapping_hash(mapping):
+    return hashlib.sha256(json.dumps(mapping, sort_keys=True).encode()).hexdigest()
+
+
+def _paginate(entries, page_size, key):
+    """Render a page picker for `entries` and return the entries on the selected page."""
+    page_count = max(1, -(-len(entries) // page_size))
+    # Filters can shrink the page count under the current page
+    st.session_state[key] = min(st.session_state.get(key, 1), page_count)
+    page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, step=1, key=key)
+    return entries[(page - 1) * page_size:page * page_size]
 
 
 def get_clusters():
@@ -80,13 +118,14 @@ def main():
     st.set_page_config(page_title="Item Name Normalizer", layout="wide")
     st.title("Item Name Normalizer")
 
-    if not CSV_PATH.exists():
+    if not CSV_PATH.exists() and not ITEMS_PARQUET.exists():
         st.error(f"Data file not found: {CSV_PATH}")
         st.info("Run `python analysis/extract_expenses.py` first to generate items_flat.csv")
         return
 
-    # Load data
-    item_counts = load_items()
+    # Load data (cached until the file's content changes)
+    data_hash = file_hash(items_path())
+    item_counts = load_items_cached(data_hash)
     counts_dict = dict(zip(item_counts["item_name"], item_counts["count"]))
     unique_names = item_counts["item_name"].tolist()
 
@@ -111,19 +150,68 @@ def main():
     st.markdown("### Step 1: Cluster similar names")
     st.caption("Groups similar names together. You can then edit clusters before applying.")
 
-    threshold = st.slider("Similarity threshold (higher = stricter)", 50, 100, 75, 5)
+    col_threshold, col_linkage, col_candidates = st.columns([3, 1, 1])
+    with col_threshold:
+        threshold = st.slider("Similarity threshold (higher = stricter)", 50, 100, 75, 5)
+    with col_linkage:
+        linkage = st.selectbox(
+            "Linkage", list(LINKAGES), index=0,
+            help="greedy: group names around a seed name. components: also chain a ~ b ~ c into one group.",
+        )
+    with col_candidates:
+        candidate_modes = list(CANDIDATES)
+        candidates = st.selectbox(
+            "Candidates", candidate_modes,
+            index=candidate_modes.index("lsh" if len(unique_names) > LSH_MIN_NAMES else "all"),
+            help="all: score every pair (exact). lsh: score only likely-similar pairs (fast, may miss a few).",
+        )
+
+    incremental = st.checkbox(
+        "Only unmapped names (match them to existing canonical names first)",
+        value=bool(mapping),
+        help="Unmapped names close to an already-mapped name are proposed for that canonical name; "
+             "only the rest are clustered.",
+    )
 
     if st.button("Run Clustering", type="primary"):
-        with st.spinner("Clustering..."):
-            raw_clusters = cluster_names(unique_names, threshold)
-            raw_clusters.sort(key=len, reverse=True)
-
-            # Convert to editable format: dict of cluster_id -> list of item names
-            editable = {}
-            for i, indices in enumerate(raw_clusters):
-                items = [unique_names[idx] for idx in indices]
-                editable[f"c{i}"] = items
-            st.session_state.editable_clusters = editable
+        progress = st.progress(0.0, text="Clustering...")
+
+        def on_progress(done, total):
+            progress.progress(done / total, text=f"Scored {done} / {total}")
+
+        if incremental:
+            # Proposals depend on the mapping as well as the data
+            key = ("incremental", data_hash, mapping_hash(mapping), threshold, linkage, candidates)
+            proposals, raw_clusters = cached_clustering(key, lambda: normalize_incrementally(
+                unique_names, mapping, threshold, linkage=linkage, candidates=candidates,
+                on_progress=on_progress,
+            ))
+        else:
+            key = ("full", data_hash, threshold, linkage, candidates)
+            proposals = []
+            raw_clusters = cached_clustering(key, lambda: [
+                [unique_names[idx] for idx in indices]
+                for indices in cluster_names(
+                    unique_names, threshold, linkage=linkage, candidates=candidates, on_progress=on_progress,
+                )
+            ])
+        # Copies, so edits in this session never touch the cached result
+        raw_clusters = [list(items) for items in raw_clusters]
+        proposals = list(proposals)
+        progress.empty()
+        # Stable sort keeps equal-sized clusters in first-index order
+        raw_clusters.sort(key=len, reverse=True)
+
+        # Convert to editable format: dict of cluster_id -> list of item names
+        editable = {}
+        for i, items in enumerate(raw_clusters):
+            editable[f"c{i}"] = items
+        st.session_state.editable_clusters = editable
+        st.session_state.proposals = proposals
+
+    proposals = st.session_state.get("proposals", [])
+    if proposals:
+        _render_proposals(proposals, mapping, counts_dict)
 
     clusters = get_clusters()
     if not clusters:
@@ -163,7 +251,24 @@ def main():
         "**Apply** sets the canonical name for all items in the cluster."
     )
 
-    for cid, cluster_items in sorted(multi_clusters.items(), key=lambda x: -len(x[1])):
+    # Only one page of clusters is rendered, so each rerun costs the same however many there are
+    col_filter, col_search, col_size, col_page = st.columns([2, 3, 1, 1])
+    with col_filter:
+        unmapped_only = st.checkbox("Only clusters with unmapped names", value=True)
+    with col_search:
+        search = st.text_input("Filter by name", placeholder="Search names...").lower().strip()
+    review = sorted(multi_clusters.items(), key=lambda x: -len(x[1]))
+    if unmapped_only:
+        review = [(cid, items) for cid, items in review if any(n not in mapping for n in items)]
+    if search:
+        review = [(cid, items) for cid, items in review if any(search in n.lower() for n in items)]
+    with col_size:
+        page_size = st.selectbox("Per page", PAGE_SIZES, index=0)
+    with col_page:
+        review_page = _paginate(review, page_size, "review_page")
+    st.caption(f"{len(review)} clusters match the filters")
+
+    for cid, cluster_items in review_page:
         all_mapped = all(n in mapping for n in cluster_items)
         status = " (done)" if all_mapped else ""
 
@@ -249,12 +354,18 @@ def main():
     for name in unique_names:
         low = name.lower()
         if " and " in low or " & " in low or " + " in low:
-            combined_items.append(name)
+            if not (unmapped_only and name in mapping):
+                combined_items.append(name)
 
     if not combined_items:
         st.info("No combined items found.")
     else:
-        for name in combined_items:
+        col_caption, col_page = st.columns([6, 1])
+        with col_page:
+            combined_page = _paginate(combined_items, page_size, "combined_page")
+        with col_caption:
+            st.caption(f"{len(combined_items)} combined items")
+        for name in combined_page:
             count = counts_dict.get(name, 0)
             current = mapping.get(name, "")
             done = name in mapping
@@ -352,6 +463,41 @@ def main():
     _render_save_section(mapping, unique_names, mapped_count)
 
 
+def _render_proposals(proposals, mapping, counts_dict):
+    """Render proposed canonical names for unmapped items, with accept/edit before applying."""
+    st.markdown(f"### Proposed assignments ({len(proposals)} new names)")
+    st.caption(
+        "New names that closely match an already-mapped name. "
+        "Untick wrong proposals or edit the canonical name, then apply."
+    )
+    table = pd.DataFrame({
+        "accept": True,
+        "count": [counts_dict.get(p["name"], 0) for p in proposals],
+        "name": [p["name"] for p in proposals],
+        "canonical": [p["canonical"] for p in proposals],
+        "matched": [p["matched"] for p in proposals],
+        "score": [p["score"] for p in proposals],
+    })
+    edited = st.data_editor(
+        table,
+        disabled=["count", "name", "matched", "score"],
+        hide_index=True,
+        key="proposals_editor",
+        use_container_width=True,
+    )
+    accepted = edited[edited["accept"]]
+    if st.button(f"Apply {len(accepted)} accepted proposals", type="primary", disabled=accepted.empty):
+        for name, canonical in zip(accepted["name"], accepted["canonical"]):
+            mapping[name] = "__SHARED__" if auto_detect_shared(name) else canonical
+        # Rejected proposals go back to review as single-name clusters
+        clusters = get_clusters()
+        for name in edited.loc[~edited["accept"], "name"]:
+            clusters[f"c{len(clusters) + 100}_{name}"] = [name]
+        st.session_state.proposals = []
+        st.rerun()
+    st.markdown("---")
+
+
 def _render_save_section(mapping, unique_names, mapped_count):
     """Render the save/export section."""
     st.markdown("### Save")
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Run the analysis pipeline, skipping stages whose inputs and outputs are unchanged.
+
+Stages (dependencies in brackets):
+    extract    extract_expenses.py (only with --extract: it calls the Splitwise API)
+    normalize  auto_normalize.py                        [extract]
+    profiles   build_profiles.py --no-publish           [normalize]
+    analyze    analyze_expenses.py --format json > report.json   [extract]
+    publish    copy preferences, profile state, group shards, classifier and mapping into backend/data/   [profiles]
+
+Content hashes of every stage's inputs and outputs are kept in
+data/pipeline_state.json. A stage is skipped when its inputs hash the same as
+after its last successful run and its outputs are still what it wrote. Hashes
+are cached per (mtime, size), so unchanged files are only stat'ed and a
+no-change rerun takes milliseconds. Stages whose dependencies are done run in
+parallel (normalize → profiles → publish alongside analyze).
+
+Files are published with an atomic replace. A running backend adopts the new
+profile_state.json on its next flush; a changed item_name_mapping.json or
+item_classifier.npz needs a backend restart.
+
+Usage:
+    python analysis/pipeline.py
+    python analysis/pipeline.py --extract          # Fetch new expenses first
+    python analysis/pipeline.py --force profiles   # Rerun a stage even if nothing changed
+    python analysis/pipeline.py --parquet          # Read items.parquet/expenses.parquet instead of CSV/JSON
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+ANALYSIS_DIR = Path(__file__).resolve().parent
+DATA_DIR = ANALYSIS_DIR / "data"
+BACKEND_DATA_DIR = ANALYSIS_DIR.parent / "backend" / "data"
+STATE_PATH = DATA_DIR / "pipeline_state.json"
+LOG_DIR = DATA_DIR / "logs"
+
+STATE_VERSION = 1
+
+ITEMS_CSV = DATA_DIR / "items_flat.csv"
+ITEMS_PARQUET = DATA_DIR / "items.parquet"
+EXPENSES_JSON = DATA_DIR / "expenses_raw.json"
+EXPENSES_CSV = DATA_DIR / "expenses_flat.csv"
+EXPENSES_PARQUET = DATA_DIR / "expenses.parquet"
+MAPPING = DATA_DIR / "item_name_mapping.json"
+REVIEW = DATA_DIR / "normalization_review.json"
+PREFERENCES = DATA_DIR / "member_preferences.json"
+PROFILE_STATE = DATA_DIR / "profile_state.json"
+REPORT = DATA_DIR / "report.json"
+CLASSIFIER = DATA_DIR / "item_classifier.npz"
+# Lists every per-group shard with its hash, so it stands in for the whole directory
+PROFILES_INDEX = DATA_DIR / "profiles" / "index.json"
+
+# analysis/data file -> backend/data file
+PUBLISHED = {
+    PREFERENCES: BACKEND_DATA_DIR / "member_preferences.json",
+    PROFILE_STATE: BACKEND_DATA_DIR / "profile_state.json",
+    MAPPING: BACKEND_DATA_DIR / "item_name_mapping.json",
+    CLASSIFIER: BACKEND_DATA_DIR / "item_classifier.npz",
+}
+
+
+class Stage:
+    """One pipeline step: a script to run (or a function), its files and the stages it waits for."""
+
+    def __init__(self, name, inputs, outputs, deps=(), command=None, run=None, stdout=None, owns_outputs=True,
+                 optional_inputs=()):
+        self.name = name
+        self.inputs = list(inputs)
+        # Hashed like inputs, but the stage still runs (degraded) without them
+        self.optional_inputs = list(optional_inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.command = command
+        self.run = run
+        self.stdout = stdout
+        # False when something else also writes the outputs: then only their existence is checked
+        self.owns_outputs = owns_outputs
+
+
+def build_stages(parquet=False, extract=False):
+    """The pipeline's stages, in dependency order."""
+    python = sys.executable
+    items = ITEMS_PARQUET if parquet else ITEMS_CSV
+    expenses = [EXPENSES_PARQUET, ITEMS_PARQUET] if parquet else [EXPENSES_JSON]
+    # build_profiles.py reads each expense's group ID from here for the per-group shards
+    group_ids = EXPENSES_PARQUET if parquet else EXPENSES_CSV
+    source_flag = ["--parquet"] if parquet else []
+    extract_deps = ["extract"] if extract else []
+
+    stages = []
+    if extract:
+        # Remote input: always runs; its outputs are what the other stages hash
+        stages.append(Stage(
+            "extract", inputs=[], outputs=[items, *expenses],
+            command=[python, str(ANALYSIS_DIR / "extract_expenses.py")],
+        ))
+    stages += [
+        Stage(
+            "normalize", inputs=[items, MAPPING], outputs=[MAPPING, REVIEW], deps=extract_deps,
+            command=[python, str(ANALYSIS_DIR / "auto_normalize.py"), *source_flag],
+        ),
+        Stage(
+            "profiles", inputs=[items, MAPPING], optional_inputs=[group_ids],
+            outputs=[PREFERENCES, PROFILE_STATE, PROFILES_INDEX, CLASSIFIER], deps=["normalize"],
+            command=[python, str(ANALYSIS_DIR / "build_profiles.py"), "--no-publish", *source_flag],
+        ),
+        Stage(
+            "analyze", inputs=expenses, outputs=[REPORT], deps=extract_deps,
+            command=[python, str(ANALYSIS_DIR / "analyze_expenses.py"), "--format", "json", *source_flag],
+            stdout=REPORT,
+        ),
+        Stage(
+            "publish", inputs=[*PUBLISHED, PROFILES_INDEX], outputs=list(PUBLISHED.values()), deps=["profiles"],
+            # The backend rewrites its profile_state.json with live updates
+            run=publish, owns_outputs=False,
+        ),
+    ]
+    return stages
+
+
+def publish():
+    """Copy the backend artifacts into backend/data/, each with an atomic replace."""
+    from build_profiles import copy_atomic, publish_shards
+
+    BACKEND_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    publish_shards()
+    for src, dst in PUBLISHED.items():
+        copy_atomic(src, dst)
+
+
+class HashCache:
+    """sha256 of files, recomputed only when a file's (mtime, size) changes."""
+
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+
+    def digest(self, path):
+        """Content hash of `path`, or None if it does not exist."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = str(path)
+        entry = self.entries.get(key)
+        if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return entry["sha256"]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        self.entries[key] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": digest.hexdigest()}
+        return digest.hexdigest()
+
+    def digests(self, paths):
+        return {str(path): self.digest(path) for path in paths}
+
+
+def load_state(path=STATE_PATH):
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"version": STATE_VERSION, "stages": {}, "hashes": {}}
+    if state.get("version") != STATE_VERSION:
+        return {"version": STATE_VERSION, "stages": {}, "hashes": {}}
+    return state
+
+
+def save_state(state, path=STATE_PATH):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def is_fresh(stage, record, hashes):
+    """True if the stage's inputs and outputs still hash as they did after its last run."""
+    if record is None or stage.name == "extract":
+        return False
+    if record.get("inputs") != hashes.digests(stage.inputs + stage.optional_inputs):
+        return False
+    if not stage.owns_outputs:
+        return all(path.exists() for path in stage.outputs)
+    outputs = hashes.digests(stage.outputs)
+    return record.get("outputs") == outputs and None not in outputs.values()
+
+
+def run_stage(stage):
+    """Run one stage; returns (ok, message). Script output goes to data/logs/<stage>.log."""
+    if stage.run is not None:
+        try:
+            stage.run()
+        except Exception as e:
+            return False, f"{type(e).__name__}: {e}"
+        return True, ""
+
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    log_path = LOG_DIR / f"{stage.name}.log"
+    with open(log_path, "w") as log:
+        if stage.stdout is None:
+            result = subprocess.run(stage.command, cwd=ANALYSIS_DIR, stdout=log, stderr=subprocess.STDOUT)
+        else:
+            # Written under .tmp, so a failed run leaves the previous output in place
+            tmp = stage.stdout.with_name(stage.stdout.name + ".tmp")
+            with open(tmp, "w") as out:
+                result = subprocess.run(stage.command, cwd=ANALYSIS_DIR, stdout=out, stderr=log)
+            if result.returncode == 0:
+                os.replace(tmp, stage.stdout)
+            else:
+                tmp.unlink(missing_ok=True)
+    if result.returncode != 0:
+        return False, f"exit code {result.returncode}, see {log_path}"
+    return True, ""
+
+
+def run_pipeline(stages, force=(), max_workers=4):
+    """Run stages in dependency order, in parallel where possible.
+
+    Returns a list of (stage name, status, seconds, message) in completion
+    order; status is "ran", "skipped", "failed" or "blocked" (a dependency failed).
+    """
+    state = load_state()
+    hashes = HashCache(state["hashes"])
+    pending = {stage.name: stage for stage in stages}
+    finished, results = {}, []
+
+    def settle(name, status, seconds, message=""):
+        finished[name] = status
+        results.append((name, status, seconds, message))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running = {}
+        while pending or running:
+            for name, stage in list(pending.items()):
+                deps = [finished.get(dep) for dep in stage.deps]
+                if any(status in ("failed", "blocked") for status in deps):
+                    del pending[name]
+                    settle(name, "blocked", 0.0, "a dependency failed")
+                    continue
+                if any(status is None for status in deps):
+                    continue
+                del pending[name]
+                start = time.perf_counter()
+                if name not in force and is_fresh(stage, state["stages"].get(name), hashes):
+                    settle(name, "skipped", time.perf_counter() - start)
+                    continue
+                # A stage may create a file it also reads (normalize starts an empty mapping)
+                missing = [str(path) for path in stage.inputs if not path.exists() and path not in stage.outputs]
+                if missing:
+                    settle(name, "failed", 0.0, f"missing inputs: {', '.join(missing)}")
+                    continue
+                running[pool.submit(run_stage, stage)] = (name, start)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, start = running.pop(future)
+                ok, message = future.result()
+                stage = next(stage for stage in stages if stage.name == name)
+                if ok:
+                    # Inputs are hashed after the run: a stage may rewrite its own input (normalize)
+                    state["stages"][name] = {
+                        "inputs": hashes.digests(stage.inputs + stage.optional_inputs),
+                        "outputs": hashes.digests(stage.outputs) if stage.owns_outputs else {},
+                    }
+                else:
+                    state["stages"].pop(name, None)
+                settle(name, "ran" if ok else "failed", time.perf_counter() - start, message)
+
+    state["hashes"] = hashes.entries
+    save_state(state)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the analysis pipeline incrementally")
+    parser.add_argument("--extract", action="store_true", help="Fetch new expenses from Splitwise first")
+    parser.add_argument("--parquet", action="store_true", help="Read the Parquet outputs instead of CSV/JSON")
+    parser.add_argument("--force", nargs="*", default=[], metavar="STAGE",
+                        help="Rerun these stages even if unchanged (no names = all stages)")
+    parser.add_argument("--workers", type=int, default=4, help="Stages run at the same time")
+    args = parser.parse_args()
+
+    stages = build_stages(parquet=args.parquet, extract=args.extract)
+    names = [stage.name for stage in stages]
+    force = set(names) if args.force == [] and "--force" in sys.argv else set(args.force)
+    unknown = force - set(names)
+    if unknown:
+        parser.error(f"unknown stage(s) {sorted(unknown)}; choose from {names}")
+
+    start = time.perf_counter()
+    results = run_pipeline(stages, force=force, max_workers=args.workers)
+    total = time.perf_counter() - start
+
+    order = {name: i for i, name in enumerate(names)}
+    for name, status, seconds, message in sorted(results, key=lambda r: order[r[0]]):
+        print(f"  {name:<10} {status:<8} {seconds:8.2f}s  {message}".rstrip())
+    print(f"Pipeline finished in {total:.2f}s")
+
+    if any(name == "publish" and status == "ran" for name, status, _, _ in results):
+        print(f"Published {len(PUBLISHED)} files to {BACKEND_DATA_DIR} "
+              "(restart the backend if item_name_mapping.json or item_classifier.npz changed)")
+    if any(status in ("failed", "blocked") for _, status, _, _ in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Replay historical receipts through the auto-split pipeline and score it.
+
+Every extracted expense with ITEMDATA becomes one /api/auto-split call: its
+items, and the members appearing on any of them as the active members. The
+call goes through backend/services/auto_split.py (the code the endpoint
+runs) with the backend's data files, and the predicted members are compared
+with the stored ITEMDATA members:
+  - micro precision / recall over (item, member) pairs
+  - exact-match rate of the member sets
+  - the same, broken down by the stage that answered (shared, fuzzy_match,
+    local_model, Gemini's high/medium/low, unmatched)
+  - seconds spent per stage, and the number of remote calls and items sent
+
+The remote (Gemini) step is replaced according to --remote:
+  none         no remote step; what the local stages miss stays unmatched
+  all-members  a local stand-in assigning every active member
+  recorded     responses from --recordings; receipts without one get none
+  gemini       real Gemini calls (GEMINI_API_KEY); --record saves them to --recordings
+
+Results are written as sorted, indented JSON (default data/replay_results.json)
+so two runs can be diffed. The profiles are normally built from the same
+history: use --since to replay only receipts newer than the last build for an
+honest estimate.
+
+Usage:
+    python analysis/replay_auto_split.py
+    python analysis/replay_auto_split.py --remote gemini --record
+    python analysis/replay_auto_split.py --remote recorded --since 2025-06-01 --output /tmp/after.json
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ANALYSIS_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = ANALYSIS_DIR.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+from services.auto_split import STAGES, auto_split_items, gemini_auto_assign  # noqa: E402
+from services.classifier import CLASSIFIER_MIN_CONFIDENCE, ItemClassifier  # noqa: E402
+from services.preferences import CompactPreferences, GroupProfiles  # noqa: E402
+
+DATA_DIR = ANALYSIS_DIR / "data"
+RAW_JSON = DATA_DIR / "expenses_raw.json"
+RAW_JSONL = DATA_DIR / "expenses_raw.jsonl"
+BACKEND_DATA_DIR = BACKEND_DIR / "data"
+RECORDINGS_PATH = DATA_DIR / "gemini_recordings.json"
+OUTPUT_PATH = DATA_DIR / "replay_results.json"
+
+REMOTE_MODES = ["none", "all-members", "recorded", "gemini"]
+
+
+def load_expenses(jsonl=False):
+    if jsonl:
+        with open(RAW_JSONL) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    with open(RAW_JSON) as f:
+        return json.load(f)
+
+
+def receipt(expense):
+    """(items, active members, true members per item) of one extracted expense."""
+    items, truths = [], []
+    for item in expense.get("item_data") or []:
+        members = item.get("members", {})
+        if isinstance(members, dict):
+            members = [m for m, selected in members.items() if selected]
+        elif not isinstance(members, list):
+            members = []
+        items.append({
+            "name": item.get("name", item.get("item_name", "")),
+            "price": float(item.get("price", item.get("item_price", 0))),
+        })
+        truths.append([m.strip() for m in members if m and m.strip()])
+    active = sorted({m for members in truths for m in members})
+    return items, active, truths
+
+
+def recording_key(items, members):
+    """Stable key of one remote request (what the Gemini prompt depends on besides preferences)."""
+    body = json.dumps({"items": items, "members": members}, sort_keys=True)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def make_remote(mode, recordings, record):
+    """The remote_assign stand-in for `mode` (None = no remote step)."""
+    if mode == "none":
+        return None
+
+    if mode == "all-members":
+        async def remote(items, members, preferences):
+            return [
+                {"name": i["name"], "matched_canonical": None, "members": list(members), "confidence": "low"}
+                for i in items
+            ]
+        return remote
+
+    if mode == "recorded":
+        async def remote(items, members, preferences):
+            return recordings.get(recording_key(items, members), [])
+        return remote
+
+    api_key = os.getenv("GEMINI_API_KEY", "")
+    if not api_key:
+        sys.exit("Error: --remote gemini needs GEMINI_API_KEY")
+
+    async def remote(items, members, preferences):
+        response = await gemini_auto_assign(items, members, preferences, api_key)
+        if record:
+            recordings[recording_key(items, members)] = response
+        return response
+    return remote
+
+
+class Scores:
+    """Micro precision/recall and exact-match counts over predicted vs true member sets."""
+
+    def __init__(self):
+        self.items = 0
+        self.exact = 0
+        self.true_positives = 0
+        self.predicted = 0
+        self.actual = 0
+
+    def add(self, predicted, actual):
+        predicted, actual = set(predicted), set(actual)
+        self.items += 1
+        self.exact += predicted == actual
+        self.true_positives += len(predicted & actual)
+        self.predicted += len(predicted)
+        self.actual += len(actual)
+
+    def to_dict(self):
+        return {
+            "items": self.items,
+            "exact_match": round(self.exact / self.items, 4) if self.items else 0.0,
+            "precision": round(self.true_positives / self.predicted, 4) if self.predicted else 0.0,
+            "recall": round(self.true_positives / self.actual, 4) if self.actual else 0.0,
+        }
+
+
+async def replay(expenses, preferences, name_mapping, classifier, remote, group_profiles=None,
+                 min_confidence=CLASSIFIER_MIN_CONFIDENCE):
+    """Metrics dict for replaying `expenses` through auto_split_items."""
+    overall, by_confidence = Scores(), defaultdict(Scores)
+    stats = {}
+    receipts = 0
+    start = time.perf_counter()
+    for expense in expenses:
+        items, active, truths = receipt(expense)
+        if not items or not active:
+            continue
+        receipts += 1
+        prefs = preferences
+        if group_profiles is not None and expense.get("group_id"):
+            prefs = group_profiles.get(expense["group_id"]) or preferences
+        result = await auto_split_items(
+            items, active, prefs, name_mapping, classifier=classifier, remote_assign=remote,
+            min_confidence=min_confidence, stats=stats,
+        )
+        # Results are per item name; duplicate names on one receipt take the first truth
+        truth_by_name = {}
+        for item, truth in zip(items, truths):
+            truth_by_name.setdefault(item["name"], truth)
+        for predicted in result["items"]:
+            truth = truth_by_name.get(predicted["name"], [])
+            overall.add(predicted["members"], truth)
+            by_confidence[predicted["confidence"]].add(predicted["members"], truth)
+    total_seconds = time.perf_counter() - start
+
+    seconds = stats.get("seconds", dict.fromkeys(STAGES, 0.0))
+    return {
+        "receipts": receipts,
+        "overall": overall.to_dict(),
+        "by_confidence": {name: scores.to_dict() for name, scores in sorted(by_confidence.items())},
+        "remote_calls": stats.get("remote_calls", 0),
+        "remote_items": stats.get("remote_items", 0),
+        "latency_ms": {
+            "per_stage_total": {stage: round(1000 * seconds[stage], 1) for stage in STAGES},
+            "per_receipt": round(1000 * total_seconds / receipts, 3) if receipts else 0.0,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay historical receipts through auto-split")
+    parser.add_argument("--jsonl", action="store_true", help="Read expenses_raw.jsonl instead of expenses_raw.json")
+    parser.add_argument("--remote", choices=REMOTE_MODES, default="none", help="Stand-in for the Gemini step")
+    parser.add_argument("--recordings", type=Path, default=RECORDINGS_PATH, help="Recorded Gemini responses")
+    parser.add_argument("--record", action="store_true", help="With --remote gemini, save responses to --recordings")
+    parser.add_argument("--no-classifier", action="store_true", help="Skip the local model stage")
+    parser.add_argument("--by-group", action="store_true", help="Use each expense's group profile shard if present")
+    parser.add_argument("--min-confidence", type=float, default=CLASSIFIER_MIN_CONFIDENCE,
+                        help="Local model confidence threshold")
+    parser.add_argument("--since", help="Only replay expenses dated on or after this ISO date")
+    parser.add_argument("--output", type=Path, default=OUTPUT_PATH, help="Where to write the results JSON")
+    args = parser.parse_args()
+
+    expenses = load_expenses(jsonl=args.jsonl)
+    if args.since:
+        expenses = [e for e in expenses if (e.get("date") or "") >= args.since]
+
+    with open(BACKEND_DATA_DIR / "member_preferences.json") as f:
+        preferences = CompactPreferences(json.load(f))
+    with open(BACKEND_DATA_DIR / "item_name_mapping.json") as f:
+        name_mapping = json.load(f)
+    classifier = None if args.no_classifier else ItemClassifier.load(BACKEND_DATA_DIR / "item_classifier.npz")
+    group_profiles = GroupProfiles(BACKEND_DATA_DIR / "profiles") if args.by_group else None
+
+    recordings = {}
+    if args.remote in ("recorded", "gemini") and args.recordings.exists():
+        with open(args.recordings) as f:
+            recordings = json.load(f)
+    remote = make_remote(args.remote, recordings, args.record)
+
+    metrics = asyncio.run(replay(
+        expenses, preferences, name_mapping, classifier, remote, group_profiles,
+        min_confidence=args.min_confidence,
+    ))
+    results = {
+        "config": {
+            "remote": args.remote,
+            "classifier": classifier is not None,
+            "min_confidence": args.min_confidence,
+            "by_group": args.by_group,
+            "since": args.since,
+        },
+        **metrics,
+    }
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+    if args.record:
+        with open(args.recordings, "w") as f:
+            json.dump(recordings, f, indent=2, sort_keys=True)
+
+    overall = results["overall"]
+    print(f"Replayed {results['receipts']} receipts ({overall['items']} items) with remote={args.remote}")
+    print(f"  exact {overall['exact_match']:.1%}  precision {overall['precision']:.3f}  recall {overall['recall']:.3f}")
+    for name, scores in results["by_confidence"].items():
+        print(f"  {name:<12} {scores['items']:>6} items  exact {scores['exact_match']:.1%}")
+    print(f"  remote calls: {results['remote_calls']} ({results['remote_items']} items)")
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
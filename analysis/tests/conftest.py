@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Tests import the analysis scripts the way they import each other: `import build_profiles`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,17 @@
+import json
+
+from analyze_expenses import build_dataframes, compute_report, print_summary
+
+
+def test_empty_report_is_valid_json(capsys):
+    report = compute_report(*build_dataframes([]))
+
+    summary = report["summary"]
+    assert summary["total_expenses"] == 0
+    assert summary["average_expense"] is None
+    assert summary["median_expense"] is None
+    assert summary["max_expense"] is None
+    json.dumps(report, allow_nan=False)
+
+    print_summary(summary)
+    assert "Average expense:     n/a" in capsys.readouterr().out
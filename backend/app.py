@@ -1,9 +1,9 @@
 # main.py
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Response
 from fastapi.responses import RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Callable, Mapping, Union
 from splitwise import Splitwise
 from splitwise.expense import Expense, ExpenseUser
 from google import genai
@@ -13,21 +13,31 @@ import PIL.Image
 from io import BytesIO
 from pathlib import Path
 from dotenv import load_dotenv
-from rapidfuzz import fuzz
 import uuid
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 from datetime import datetime
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from services.splitwise_client import RateLimitedSplitwise
+from services.idempotency import IdempotencyStore, IdempotencyConflict, fingerprint
+from services.jobs import JobManager, QueueFull
+from services.split_engine import compute_splits, reconcile_splits, to_cents, format_cents
+from services import itemdata
+from services.responses import FastJSONResponse
+from services.preferences import CompactPreferences, GroupProfiles, LiveProfiles
+from services.classifier import ItemClassifier
+from services.auto_split import auto_split_items, gemini_auto_assign, is_shared_item
 # from database.connection import connect_to_mongo, close_mongo_connection
 # from models.database import SplitData, MemberMapping
-import json as json_lib
 
 # Load environment variables
 load_dotenv()
 
 
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 # command to run server in port 8001 # uvicorn main:app --reload --port 8001
 
 # Configure CORS
@@ -54,6 +64,10 @@ SPLITWISE_CONSUMER_SECRET = os.getenv("SPLITWISE_CONSUMER_SECRET", "")
 SESSION_SECRET = os.getenv("SESSION_SECRET", "change-me-to-a-random-32-char-secret")
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000").rstrip("/")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+# Max expenses submitted to Splitwise at once by /api/create-expenses
+BULK_CREATE_CONCURRENCY = int(os.getenv("BULK_CREATE_CONCURRENCY", "3"))
+# Per-member rounding slack between the client's splits and the ITEMDATA split check
+SPLIT_TOLERANCE_CENTS = 1
 
 serializer = URLSafeTimedSerializer(SESSION_SECRET)
 
@@ -84,33 +98,69 @@ def get_current_session(request: Request) -> dict:
     return session
 
 
-def get_splitwise_client(session: dict) -> Splitwise:
-    """Create a Splitwise client using the OAuth2 access token from the session."""
+def get_splitwise_client(session: dict) -> RateLimitedSplitwise:
+    """Create a Splitwise client using the OAuth2 access token from the session.
+
+    Calls go through the shared rate limiter: per-token token bucket, retries with
+    backoff on 429/transient errors, and coalescing of identical concurrent reads.
+    """
     sObj = Splitwise(SPLITWISE_CONSUMER_KEY, SPLITWISE_CONSUMER_SECRET)
     sObj.setOAuth2AccessToken({"access_token": session["access_token"]})
-    return sObj
+    return RateLimitedSplitwise(sObj, session["access_token"])
+
+
+# Background receipt analysis (submit-and-poll mode of /api/analyze-*)
+analysis_jobs = JobManager()
+
+# Completed create/update results, replayed for retries carrying the same Idempotency-Key
+idempotency_store = IdempotencyStore()
+
+
+def _run_idempotent(request: Request, response: Response, session: dict, scope: str, payload: BaseModel, fn):
+    """Run `fn(state)` at most once per Idempotency-Key header (if the client sent one)."""
+    key = request.headers.get("idempotency-key")
+    if not key:
+        return fn({})
+    try:
+        result, replayed = idempotency_store.execute(
+            f"{session.get('user_id')}:{scope}:{key}",
+            fingerprint(payload.model_dump_json()),
+            fn,
+        )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
 
 
-# Global member preferences for auto-split
-member_preferences: dict = {}
+# Global member preferences for auto-split, until live aggregates are loaded
+member_preferences: Mapping = {}
 # Raw item name → canonical name mapping for fuzzy pre-pass
 item_name_mapping: dict = {}
 
-ALWAYS_SHARED_KEYWORDS = ["tax", "service fee", "delivery fee", "tip", "bag fee", "discount", "fees", "tax & fees"]
+
+# Additive aggregates behind member_preferences, updated after each created expense
+live_profiles = LiveProfiles(Path(__file__).resolve().parent / "data" / "profile_state.json")
+# Per-group shards of the same aggregates, loaded when a group first auto-splits
+group_profiles = GroupProfiles(Path(__file__).resolve().parent / "data" / "profiles")
+# Local item → members model; Gemini only sees items it is not confident about
+item_classifier: Optional[ItemClassifier] = None
 
 # Models
 
 
 @app.on_event("startup")
 async def startup_event():
-    global member_preferences, item_name_mapping
+    global member_preferences, item_name_mapping, item_classifier
     # await connect_to_mongo()
+    analysis_jobs.start()
 
     # Load member preferences
     prefs_path = Path(__file__).resolve().parent / "data" / "member_preferences.json"
     if prefs_path.exists():
         with open(prefs_path) as f:
-            member_preferences = json.load(f)
+            member_preferences = CompactPreferences(json.load(f))
         print(f"Loaded member preferences: {len(member_preferences)} items")
     else:
         print(f"Warning: member_preferences.json not found at {prefs_path}")
@@ -124,10 +174,28 @@ async def startup_event():
     else:
         print(f"Warning: item_name_mapping.json not found at {mapping_path}")
 
+    classifier_path = Path(__file__).resolve().parent / "data" / "item_classifier.npz"
+    item_classifier = await asyncio.to_thread(ItemClassifier.load, classifier_path)
+    if item_classifier is not None:
+        print(f"Loaded item classifier: {len(item_classifier)} names")
+    else:
+        print(f"Warning: item_classifier.npz not found at {classifier_path}; all fuzzy misses go to Gemini")
+
+    # Live preference updates need the aggregates written by build_profiles.py
+    if await asyncio.to_thread(live_profiles.load):
+        live_profiles.start()
+        print(f"Loaded preference aggregates: {len(live_profiles.expense_ids)} expenses")
+    else:
+        print("Warning: profile_state.json not found; preferences update only on rebuild")
+    # Writes expenses recorded for a group into its shard file
+    group_profiles.start()
+
 @app.on_event("shutdown")
 async def shutdown_event():
     # await close_mongo_connection()
-    pass
+    await analysis_jobs.stop()
+    await live_profiles.stop()
+    await group_profiles.stop()
 
 
 class ItemMember(BaseModel):
@@ -211,7 +279,7 @@ async def auth_logout():
 # --- Splitwise API Endpoints ---
 
 @app.get("/api/members")
-async def get_members(request: Request, group_id: Optional[int] = None):
+def get_members(request: Request, group_id: Optional[int] = None):
     try:
         session = get_current_session(request)
         sObj = get_splitwise_client(session)
@@ -238,7 +306,7 @@ async def get_members(request: Request, group_id: Optional[int] = None):
         raise HTTPException(status_code=400, detail=f"Failed to get members: {str(e)}")
 
 @app.get("/api/groups")
-async def get_groups(request: Request):
+def get_groups(request: Request):
     try:
         session = get_current_session(request)
         sObj = get_splitwise_client(session)
@@ -255,21 +323,11 @@ async def get_groups(request: Request):
         raise HTTPException(status_code=400, detail=f"Failed to get groups: {str(e)}")
 
 
-@app.post("/api/analyze-bills")
-async def analyze_bills(
-    request: Request,
-    files: List[UploadFile] = File(...),
-):
-    get_current_session(request)  # require auth
+def _analyze_bill_images(progress: Callable[[float, str], None], images_bytes: List[bytes]) -> dict:
+    """Extract items from receipt images with Gemini (blocking)."""
     try:
         client = genai.Client(api_key=GEMINI_API_KEY)
 
-        # Read image bytes
-        images_bytes = []
-        for file in files:
-            contents = await file.read()
-            images_bytes.append(contents)
-
         # Prompt for extraction
         prompt = """Extract items and prices from this receipt. Return JSON array.
 
@@ -301,6 +359,7 @@ Items in image:"""
             content_parts.append(types.Part.from_bytes(data=img_bytes, mime_type="image/jpeg"))
 
         # Call Gemini with structured output
+        progress(0.2, "Reading receipt with Gemini")
         response = client.models.generate_content(
             model="gemini-2.5-flash",
             contents=content_parts,
@@ -311,6 +370,7 @@ Items in image:"""
             )
         )
 
+        progress(0.9, "Parsing items")
         # Parse JSON directly (structured output guarantees valid JSON)
         items_json = json.loads(response.text)
 
@@ -343,24 +403,41 @@ Items in image:"""
     except json.JSONDecodeError as e:
         print(f"Failed to parse JSON from response: {response.text}")
         return {"items": [], "metadata": None}
+
+
+
+
+@app.post("/api/analyze-bills")
+async def analyze_bills(
+    request: Request,
+    response: Response,
+    files: List[UploadFile] = File(...),
+    mode: str = "sync",
+):
+    """Analyze receipt images. `mode=async` queues the work and returns a job ID to poll."""
+    session = get_current_session(request)  # require auth
+    try:
+        # Read image bytes
+        images_bytes = []
+        for file in files:
+            contents = await file.read()
+            images_bytes.append(contents)
+
+        if mode == "async":
+            return _submit_analysis_job(session, response, "analyze-bills", _analyze_bill_images, images_bytes)
+        return await asyncio.to_thread(_analyze_bill_images, _ignore_progress, images_bytes)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error details: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Failed to analyze bills: {str(e)}")
 
 
-@app.post("/api/analyze-pdf")
-async def analyze_pdf(
-    request: Request,
-    file: UploadFile = File(...),
-):
-    """Parse Instacart receipt PDF and extract items with metadata."""
-    get_current_session(request)  # require auth
+def _analyze_pdf_bytes(progress: Callable[[float, str], None], pdf_bytes: bytes) -> dict:
+    """Parse Instacart receipt PDF and extract items with metadata (blocking)."""
     try:
         client = genai.Client(api_key=GEMINI_API_KEY)
 
-        # Read PDF bytes
-        pdf_bytes = await file.read()
-
         prompt = """Extract ALL data from this Instacart receipt PDF.
 
 Instructions:
@@ -412,6 +489,7 @@ CRITICAL: Prices must match the PDF exactly. The sum of all non-refunded item fi
             required=["store_name", "delivery_date", "delivery_time", "items", "totals"]
         )
 
+        progress(0.2, "Reading PDF with Gemini")
         response = client.models.generate_content(
             model="gemini-2.5-flash",
             contents=[
@@ -425,6 +503,7 @@ CRITICAL: Prices must match the PDF exactly. The sum of all non-refunded item fi
             )
         )
 
+        progress(0.9, "Validating totals")
         receipt = json.loads(response.text)
 
         # Validate: sum of non-refunded items should equal subtotal
@@ -466,140 +545,348 @@ CRITICAL: Prices must match the PDF exactly. The sum of all non-refunded item fi
     except json.JSONDecodeError as e:
         print(f"Failed to parse JSON from Gemini response")
         raise HTTPException(status_code=400, detail="Failed to parse PDF response as JSON")
+
+
+@app.post("/api/analyze-pdf")
+async def analyze_pdf(
+    request: Request,
+    response: Response,
+    file: UploadFile = File(...),
+    mode: str = "sync",
+):
+    """Parse Instacart receipt PDF and extract items with metadata.
+
+    `mode=async` queues the work and returns a job ID to poll.
+    """
+    session = get_current_session(request)  # require auth
+    try:
+        # Read PDF bytes
+        pdf_bytes = await file.read()
+
+        if mode == "async":
+            return _submit_analysis_job(session, response, "analyze-pdf", _analyze_pdf_bytes, pdf_bytes)
+        return await asyncio.to_thread(_analyze_pdf_bytes, _ignore_progress, pdf_bytes)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error parsing PDF: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Failed to parse PDF: {str(e)}")
 
 
-@app.post("/api/create-expense")
-async def create_expense(expense_req: ExpenseRequest, request: Request):
+def _ignore_progress(progress: float, stage: str):
+    pass
+
+
+def _submit_analysis_job(session: dict, response: Response, kind: str, fn: Callable, payload) -> dict:
+    """Queue an analysis and return its job ID (202) instead of waiting for Gemini."""
     try:
-        session = get_current_session(request)
-        sObj = get_splitwise_client(session)
-        print(expense_req)
-        # Get member IDs
-        user = sObj.getCurrentUser()
-        friends = sObj.getFriends()
-        
-        mem_to_id = {}
-        mem_to_id[user.first_name] = user.id
-        for friend in friends:
-            mem_to_id[friend.first_name] = friend.id
-        
-        # Get group IDs
-        groups = sObj.getGroups()
-        groups_to_ids = {}
-        for group in groups:
-            groups_to_ids[group.name] = group.id
-        
-        # Round amounts
-        total_amt = round(expense_req.total_amt, 2)
-        splits = {member: round(amount, 2) for member, amount in expense_req.splits.items()}
-        
-        # Calculate rounding difference
-        splits_sum = sum(splits.values())
-        rounding_difference = total_amt - splits_sum
-        
-        if expense_req.paid_user in splits:
-            splits[expense_req.paid_user] = round(splits[expense_req.paid_user] + rounding_difference, 2)
-        
-        # Create expense
-        expense = Expense()
-        expense.setCost(str(total_amt))
-        expense.setDescription(expense_req.description)
-        expense.setGroupId(groups_to_ids[expense_req.group_id])
-        expense.setDetails(expense_req.comment)
-        
-        # Create payer
-        payer = ExpenseUser()
-        payer.setId(mem_to_id[expense_req.paid_user])
-        payer.setPaidShare(str(total_amt))
-        
-        # Set owed share for payer
-        if expense_req.paid_user in splits:
-            payer.setOwedShare(str(splits[expense_req.paid_user]))
-        else:
-            payer.setOwedShare('0')
-        
-        # Add payer to users list
-        users = [payer]
-        
-        # Add debtors
-        for member, amount in splits.items():
-            if amount == 0 or member == expense_req.paid_user:
-                continue
-            
-            debtor = ExpenseUser()
-            debtor.setId(mem_to_id[member])
-            debtor.setPaidShare('0')
-            debtor.setOwedShare(str(amount))
-            users.append(debtor)
+        job = analysis_jobs.submit(str(session.get("user_id")), kind, fn, payload)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    response.status_code = 202
+    return {"job_id": job.id, "status": job.status}
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    """Poll a queued analysis: status, progress and (once done) the same result as sync mode."""
+    session = get_current_session(request)
+    job = analysis_jobs.get(job_id)
+    if job is None or job.owner != str(session.get("user_id")):
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job.to_dict()
+
+
+def _resolve_splitwise_ids(sObj) -> tuple:
+    """Map member first names and group names to their Splitwise IDs."""
+    user = sObj.getCurrentUser()
+    friends = sObj.getFriends()
+
+    mem_to_id = {}
+    mem_to_id[user.first_name] = user.id
+    for friend in friends:
+        mem_to_id[friend.first_name] = friend.id
+
+    groups = sObj.getGroups()
+    groups_to_ids = {}
+    for group in groups:
+        groups_to_ids[group.name] = group.id
+
+    return mem_to_id, groups_to_ids
+
+
+def _validate_expense_request(expense_req: ExpenseRequest, mem_to_id: dict, groups_to_ids: dict) -> Optional[str]:
+    """Return an error message if the expense cannot be submitted, else None."""
+    if expense_req.group_id not in groups_to_ids:
+        return f"Unknown group: {expense_req.group_id}"
+    if expense_req.paid_user not in mem_to_id:
+        return f"Unknown payer: {expense_req.paid_user}"
+    unknown = [m for m, amount in expense_req.splits.items() if round(amount, 2) and m not in mem_to_id]
+    if unknown:
+        return f"Unknown members: {', '.join(unknown)}"
+    if to_cents(expense_req.total_amt) <= 0:
+        return "Total amount must be positive"
+    try:
+        _owed_cents(expense_req)
+    except HTTPException as e:
+        return e.detail
+    return None
+
+
+def _owed_cents(expense_req: ExpenseRequest) -> tuple:
+    """Per-member owed cents for a write, summing exactly to the total.
+
+    The client's splits are authoritative and only rounded to whole cents
+    (largest remainder; any gap to the total is charged to the payer). When
+    the ITEMDATA items account for the whole total they are split again as a
+    check, unassigned items going to the payer as on the client, and splits
+    that disagree by more than a rounding cent are rejected with a 400.
+    """
+    total_cents = to_cents(expense_req.total_amt)
+    splits = reconcile_splits(expense_req.splits, expense_req.total_amt, expense_req.paid_user)
+    items = parse_expense_comment(expense_req.comment)
+    if isinstance(items, list) and items:
+        expected, items_cents, _ = compute_splits(items, paid_user=expense_req.paid_user)
+        if items_cents == total_cents:
+            mismatched = sorted(
+                m for m in expected.keys() | splits.keys()
+                if abs(expected.get(m, 0) - splits.get(m, 0)) > SPLIT_TOLERANCE_CENTS
+            )
+            if mismatched:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Splits do not match the itemized receipt for: {', '.join(mismatched)}",
+                )
+    return splits, total_cents
+
+
+def _submit_expense(sObj, expense_req: ExpenseRequest, mem_to_id: dict, groups_to_ids: dict, state: Optional[dict] = None) -> dict:
+    """Create the expense in Splitwise and stamp its EXPENSE_ID into the comment.
+
+    `state` carries progress across idempotent retries: once the expense exists,
+    a retry only redoes the comment update instead of creating a duplicate.
+    """
+    if state is None:
+        state = {}
+    # Exact integer-cent shares that add up to the total
+    splits, total_cents = _owed_cents(expense_req)
+    total_amt = format_cents(total_cents)
+    
+    # Create expense
+    expense = Expense()
+    expense.setCost(total_amt)
+    expense.setDescription(expense_req.description)
+    expense.setGroupId(groups_to_ids[expense_req.group_id])
+    expense.setDetails(itemdata.compact_details(expense_req.comment))
+    
+    # Create payer
+    payer = ExpenseUser()
+    payer.setId(mem_to_id[expense_req.paid_user])
+    payer.setPaidShare(total_amt)
+    
+    # Set owed share for payer
+    if expense_req.paid_user in splits:
+        payer.setOwedShare(format_cents(splits[expense_req.paid_user]))
+    else:
+        payer.setOwedShare('0')
+    
+    # Add payer to users list
+    users = [payer]
+    
+    # Add debtors
+    for member, amount in splits.items():
+        if amount == 0 or member == expense_req.paid_user:
+            continue
         
-        # Set users and create expense
-        expense.setUsers(users)
+        debtor = ExpenseUser()
+        debtor.setId(mem_to_id[member])
+        debtor.setPaidShare('0')
+        debtor.setOwedShare(format_cents(amount))
+        users.append(debtor)
+    
+    # Set users and create expense
+    expense.setUsers(users)
+    if state.get("expense_id"):
+        # A previous attempt already created it; only the comment update is left
+        expense_id, errors = state["expense_id"], None
+        print("Resuming expense", expense_id)
+    else:
         expense_res, errors = sObj.createExpense(expense)
         # get expense id
         expense_id = expense_res.getId()
+        state["expense_id"] = expense_id
         print("Expense created successfully:", expense_res)
         print("Expense ID:", expense_id)
 
-        # Update the expense with the expense ID in the comment
-        if expense_id:
-            # Get the original comment
-            original_comment = expense.getDetails()
-            
-            # Add expense ID to the comment, preserving the ITEMDATA section
-            updated_comment = f"EXPENSE_ID:{expense_id}\n{original_comment}"
-            
-            # Create a new expense object for updating
-            expense.setId(expense_id)
-            expense.setDetails(updated_comment)  # In Splitwise API, "details" is the comment field
-            
-            # Update the expense
-            update_result, update_errors = sObj.updateExpense(expense)
-            
-            print("new expense id", update_result.getId())
-            if update_errors:
-                print(f"Warning: Could not update expense comment: {update_errors}")
-                return {"status": "warning", "message": "Expense created but comment update failed."}
-            else:
-                print("Expense comment updated successfully to include expense ID", update_result.getId())
-
-        # After successful Splitwise creation, ADD THIS BLOCK:
-        # Parse the item data from comment
-        item_data = parse_expense_comment(expense_req.comment)
+    # Update the expense with the expense ID in the comment
+    if expense_id:
+        # Get the original comment
+        original_comment = expense.getDetails()
+        
+        # Add expense ID to the comment, preserving the ITEMDATA section
+        updated_comment = f"EXPENSE_ID:{expense_id}\n{original_comment}"
         
-        # if item_data:
-        #     # Save to MongoDB
-        #     split_doc = SplitData(
-        #         splitwise_id=str(expense_id),
-        #         group_id=str(groups_to_ids[expense_req.group_id]),
-        #         group_name=expense_req.group_id,
-        #         description=expense_req.description,
-        #         total_amount=float(expense_req.total_amt),
-        #         paid_by=expense_req.paid_user,
-        #         created_by=user.first_name,
-        #         items=item_data,
-        #         member_splits=expense_req.splits,
-        #         created_at=datetime.utcnow(),
-        #         updated_at=datetime.utcnow()
-        #     )
-        #     await split_doc.insert()
-        #     print(f"Saved split data to MongoDB with ID: {split_doc.id}")
-
-
-
-        # expense.setId(3774471460)
-        # expense_res, errors = sObj.updateExpense(expense)
-
-        if errors:
-            raise HTTPException(status_code=400, detail=f"Error creating expense: {errors}")
+        # Create a new expense object for updating
+        expense.setId(expense_id)
+        expense.setDetails(updated_comment)  # In Splitwise API, "details" is the comment field
         
-        return {"status": "success", "expense": update_result}
+        # Update the expense
+        update_result, update_errors = sObj.updateExpense(expense)
+        
+        print("new expense id", update_result.getId())
+        if update_errors:
+            print(f"Warning: Could not update expense comment: {update_errors}")
+            return {"status": "warning", "message": "Expense created but comment update failed."}
+        else:
+            print("Expense comment updated successfully to include expense ID", update_result.getId())
+
+    # After successful Splitwise creation, ADD THIS BLOCK:
+    # Parse the item data from comment
+    item_data = parse_expense_comment(expense_req.comment)
+    # Let auto-split learn from this expense right away
+    if expense_id:
+        try:
+            live_profiles.record(str(expense_id), item_data, item_name_mapping)
+            group_profiles.record(groups_to_ids[expense_req.group_id], str(expense_id), item_data, item_name_mapping)
+        except Exception as e:
+            print(f"Warning: Could not update preferences: {e}")
+    
+    # if item_data:
+    #     # Save to MongoDB
+    #     split_doc = SplitData(
+    #         splitwise_id=str(expense_id),
+    #         group_id=str(groups_to_ids[expense_req.group_id]),
+    #         group_name=expense_req.group_id,
+    #         description=expense_req.description,
+    #         total_amount=float(expense_req.total_amt),
+    #         paid_by=expense_req.paid_user,
+    #         created_by=user.first_name,
+    #         items=item_data,
+    #         member_splits=expense_req.splits,
+    #         created_at=datetime.utcnow(),
+    #         updated_at=datetime.utcnow()
+    #     )
+    #     await split_doc.insert()
+    #     print(f"Saved split data to MongoDB with ID: {split_doc.id}")
+
+
+
+    # expense.setId(3774471460)
+    # expense_res, errors = sObj.updateExpense(expense)
+
+    if errors:
+        raise HTTPException(status_code=400, detail=f"Error creating expense: {errors}")
+    
+    return {"status": "success", "expense": update_result}
+
+
+@app.post("/api/create-expense")
+def create_expense(expense_req: ExpenseRequest, request: Request, response: Response):
+    try:
+        session = get_current_session(request)
+        sObj = get_splitwise_client(session)
+        print(expense_req)
+
+        def submit(state: dict) -> dict:
+            mem_to_id, groups_to_ids = _resolve_splitwise_ids(sObj)
+            return _submit_expense(sObj, expense_req, mem_to_id, groups_to_ids, state)
+
+        return _run_idempotent(request, response, session, "create-expense", expense_req, submit)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to create expense: {str(e)}")
 
 
+class BulkExpenseRequest(BaseModel):
+    expenses: List[ExpenseRequest]
+    concurrency: Optional[int] = None  # capped at BULK_CREATE_CONCURRENCY
+
+
+@app.post("/api/create-expenses")
+def create_expenses(bulk_req: BulkExpenseRequest, request: Request):
+    """Create several expenses at once.
+
+    Members and groups are resolved once, every expense is validated up front,
+    and the valid ones are submitted in parallel (bounded by the concurrency
+    limit). Each expense gets its own success/error result, so one bad expense
+    does not block the rest.
+    """
+    session = get_current_session(request)
+    if not bulk_req.expenses:
+        raise HTTPException(status_code=400, detail="No expenses to create")
+    try:
+        sObj = get_splitwise_client(session)
+        mem_to_id, groups_to_ids = _resolve_splitwise_ids(sObj)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to create expenses: {str(e)}")
+
+    results: List[Optional[dict]] = [None] * len(bulk_req.expenses)
+    to_submit = []
+    for index, expense_req in enumerate(bulk_req.expenses):
+        error = _validate_expense_request(expense_req, mem_to_id, groups_to_ids)
+        if error:
+            results[index] = {"index": index, "status": "error", "detail": error}
+        else:
+            to_submit.append(index)
+
+    def submit(index: int) -> dict:
+        try:
+            result = _submit_expense(sObj, bulk_req.expenses[index], mem_to_id, groups_to_ids)
+        except HTTPException as e:
+            return {"index": index, "status": "error", "detail": e.detail}
+        except Exception as e:
+            return {"index": index, "status": "error", "detail": f"Failed to create expense: {str(e)}"}
+        return {"index": index, **result}
+
+    concurrency = max(1, min(bulk_req.concurrency or BULK_CREATE_CONCURRENCY, BULK_CREATE_CONCURRENCY))
+    if to_submit:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(to_submit))) as pool:
+            for result in pool.map(submit, to_submit):
+                results[result["index"]] = result
+
+    failed = sum(1 for r in results if r["status"] == "error")
+    return {
+        "results": results,
+        "succeeded": len(results) - failed,
+        "failed": failed,
+    }
+
+
+class SplitItem(BaseModel):
+    name: str
+    price: float
+    members: Union[List[str], Dict[str, bool]] = []
+
+class ComputeSplitsRequest(BaseModel):
+    items: List[SplitItem]
+    members: List[str] = []
+    paid_user: Optional[str] = None
+
+
+@app.post("/api/compute-splits")
+def compute_splits_endpoint(split_req: ComputeSplitsRequest, request: Request):
+    """Per-member owed amounts for ITEMDATA items, in exact cents.
+
+    Shared/fee items with nobody selected are split across all members; other
+    unassigned items go to `paid_user` (or are reported as unassigned).
+    """
+    get_current_session(request)  # require auth
+    splits, total_cents, unassigned_cents = compute_splits(
+        [item.model_dump() for item in split_req.items],
+        members=split_req.members,
+        paid_user=split_req.paid_user,
+        is_shared=is_shared_item,
+    )
+    return {
+        "splits": {m: format_cents(c) for m, c in splits.items()},
+        "splits_cents": splits,
+        "total": format_cents(total_cents),
+        "total_cents": total_cents,
+        "unassigned_cents": unassigned_cents,
+    }
+
+
 # --- Auto-Split Models and Endpoint ---
 
 class AutoSplitItem(BaseModel):
@@ -609,12 +896,14 @@ class AutoSplitItem(BaseModel):
 class AutoSplitRequest(BaseModel):
     items: List[AutoSplitItem]
     members: List[str]
+    # Splitwise group ID; uses that group's preference shard when one exists
+    group_id: Optional[int] = None
 
 class AutoSplitResultItem(BaseModel):
     name: str
     price: float
     members: List[str]
-    confidence: str  # "high", "medium", "low", "unmatched", "shared"
+    confidence: str  # "high", "medium", "low", "unmatched", "shared", "fuzzy_match", "local_model"
     matched_canonical: Optional[str] = None
 
 class AutoSplitResponse(BaseModel):
@@ -624,271 +913,32 @@ class AutoSplitResponse(BaseModel):
     unmatched: int
 
 
-def _is_shared_item(name: str) -> bool:
-    """Check if an item name matches shared/fee keywords."""
-    lower = name.lower().strip()
-    for kw in ALWAYS_SHARED_KEYWORDS:
-        if kw in lower:
-            return True
-    return False
-
-
-def _fuzzy_match_item(name: str, mapping: dict, threshold: int = 50) -> str | None:
-    """Try to match a receipt item name to a canonical name using fuzzy matching.
-
-    Uses the same token_sort_ratio algorithm as normalize_app.py.
-    Returns the canonical name if best score >= threshold, else None.
-    """
-    lower_name = name.lower().strip()
-    best_score = 0
-    best_canonical = None
-
-    for raw_name, canonical in mapping.items():
-        if canonical == "__SHARED__":
-            continue
-        score = fuzz.token_sort_ratio(lower_name, raw_name.lower().strip())
-        if score > best_score:
-            best_score = score
-            best_canonical = canonical
-
-    if best_score >= threshold:
-        return best_canonical
-    return None
-
-
-def _build_compact_preferences(preferences: dict, active_members: List[str], top_n: int = 5) -> str:
-    """Build a compact string of preferences for the Gemini prompt.
-
-    Items where all active members have purchased are marked as ALL
-    to reduce prompt size and signal universal assignment.
-    """
-    num_active = len(active_members)
-    lines = []
-    for canonical, data in preferences.items():
-        if canonical == "__SHARED__":
-            continue
-        item_members = data["members"]
-        # Count how many of the active members appear in this item's history
-        active_buyers = sum(1 for m in active_members if m in item_members)
-
-        if num_active > 1 and active_buyers == num_active:
-            # All active members have bought this — mark as ALL
-            lines.append(f"- {canonical}: ALL [{data['total_appearances']}x]")
-        else:
-            top_members = list(item_members.items())[:top_n]
-            members_str = ", ".join(f"{m}({c})" for m, c in top_members)
-            lines.append(f"- {canonical}: {members_str} [{data['total_appearances']}x]")
-    return "\n".join(lines)
-
-
-async def _gemini_auto_assign(
-    items: List[dict],
-    members: List[str],
-    preferences: dict,
-) -> List[dict]:
-    """Use Gemini to match receipt items to canonical names and assign members."""
-    compact_prefs = _build_compact_preferences(preferences, members)
-
-    items_list = "\n".join(f"- {item['name']} (${item['price']:.2f})" for item in items)
-
-    # Build member-count-aware instructions
-    all_members_str = ", ".join(members)
-    num_members = len(members)
-
-    if num_members > 7:
-        member_rule = (
-            "- If historical data shows 'ALL', assign ALL available members.\n"
-            "- For items that are clearly common/shared groceries (staples, produce, household), assign ALL available members.\n"
-            "- Only assign a subset when the item is clearly personal (snacks, specific dietary items, etc.)."
-        )
-    else:
-        member_rule = (
-            "- If historical data shows 'ALL', assign ALL available members.\n"
-            "- Otherwise assign members who appear in more than 30% of that product's purchase history."
-        )
-
-    prompt = f"""You are matching receipt items to known product names from historical grocery data.
-
-RECEIPT ITEMS TO MATCH:
-{items_list}
-
-AVAILABLE MEMBERS ({num_members}): {all_members_str}
-
-HISTORICAL PRODUCT DATA (canonical_name: member(times_bought) or ALL [total_purchases]):
-{compact_prefs}
-
-TASK:
-For each receipt item, find the closest matching canonical product name from the historical data.
-Consider abbreviations, typos, brand names, size variations, and truncated names.
-Then assign members based on these rules:
-{member_rule}
-
-For each item return:
-- "name": the original receipt item name
-- "matched_canonical": the matched canonical product name, or null if no match
-- "members": list of member names to assign (from AVAILABLE MEMBERS only)
-- "confidence": "high" if exact/very close match, "medium" if reasonable match, "low" if uncertain, "unmatched" if no match found
-
-If you cannot match an item, return empty members list and confidence "unmatched"."""
-
-    # Schema for structured output
-    result_schema = types.Schema(
-        type=types.Type.ARRAY,
-        items=types.Schema(
-            type=types.Type.OBJECT,
-            properties={
-                "name": types.Schema(type=types.Type.STRING),
-                "matched_canonical": types.Schema(type=types.Type.STRING, nullable=True),
-                "members": types.Schema(
-                    type=types.Type.ARRAY,
-                    items=types.Schema(type=types.Type.STRING),
-                ),
-                "confidence": types.Schema(type=types.Type.STRING),
-            },
-            required=["name", "matched_canonical", "members", "confidence"],
-        ),
-    )
-
-    client = genai.Client(api_key=GEMINI_API_KEY)
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=[types.Part.from_text(text=prompt)],
-        config=types.GenerateContentConfig(
-            response_mime_type="application/json",
-            response_schema=result_schema,
-            temperature=0.1,
-        ),
-    )
-
-    return json.loads(response.text)
-
-
-@app.post("/api/auto-split")
+@app.post("/api/auto-split", responses={200: {"model": AutoSplitResponse}})
 async def auto_split(request: Request, split_request: AutoSplitRequest):
     """Auto-assign members to items based on historical preferences."""
     get_current_session(request)  # require auth
     try:
-        results: List[AutoSplitResultItem] = []
-        non_shared_items = []
-        auto_assigned = 0
-        shared_count = 0
-        unmatched_count = 0
-
-        # Step 1: Handle shared items
-        for item in split_request.items:
-            if _is_shared_item(item.name):
-                results.append(AutoSplitResultItem(
-                    name=item.name,
-                    price=item.price,
-                    members=split_request.members,  # All members
-                    confidence="shared",
-                    matched_canonical="__SHARED__",
-                ))
-                shared_count += 1
-            else:
-                non_shared_items.append({"name": item.name, "price": item.price})
-
-        # Step 2: Fuzzy matching pre-pass using item_name_mapping
-        gemini_items = []
-        if non_shared_items and member_preferences and item_name_mapping:
-            for item in non_shared_items:
-                canonical = _fuzzy_match_item(item["name"], item_name_mapping)
-                if canonical and canonical in member_preferences:
-                    # Look up members from preferences
-                    pref_data = member_preferences[canonical]
-                    item_members = pref_data.get("members", {})
-                    active_buyers = [m for m in split_request.members if m in item_members]
-
-                    if len(active_buyers) == len(split_request.members) and len(split_request.members) > 1:
-                        assigned = list(split_request.members)
-                    else:
-                        # Assign members who bought >30% of the time
-                        total = pref_data.get("total_appearances", 1)
-                        assigned = [
-                            m for m in active_buyers
-                            if item_members[m] / total > 0.3
-                        ]
-
-                    if assigned:
-                        results.append(AutoSplitResultItem(
-                            name=item["name"],
-                            price=item["price"],
-                            members=assigned,
-                            confidence="fuzzy_match",
-                            matched_canonical=canonical,
-                        ))
-                        auto_assigned += 1
-                    else:
-                        gemini_items.append(item)
-                else:
-                    gemini_items.append(item)
-        else:
-            gemini_items = non_shared_items
-
-        # Step 3: Use Gemini for remaining unmatched items
-        if gemini_items and member_preferences:
-            if not GEMINI_API_KEY:
-                # No Gemini key configured — return items unassigned
-                for item in gemini_items:
-                    results.append(AutoSplitResultItem(
-                        name=item["name"],
-                        price=item["price"],
-                        members=[],
-                        confidence="unmatched",
-                    ))
-                    unmatched_count += 1
-            else:
-                try:
-                    gemini_results = await _gemini_auto_assign(
-                        gemini_items, split_request.members, member_preferences
-                    )
-
-                    for gr in gemini_results:
-                        # Filter members to only include those in the request
-                        valid_members = [m for m in gr.get("members", []) if m in split_request.members]
-                        confidence = gr.get("confidence", "unmatched")
-
-                        results.append(AutoSplitResultItem(
-                            name=gr["name"],
-                            price=next((i["price"] for i in gemini_items if i["name"] == gr["name"]), 0),
-                            members=valid_members,
-                            confidence=confidence,
-                            matched_canonical=gr.get("matched_canonical"),
-                        ))
-
-                        if confidence in ("high", "medium", "low") and valid_members:
-                            auto_assigned += 1
-                        else:
-                            unmatched_count += 1
-
-                except Exception as e:
-                    print(f"Gemini auto-assign failed: {e}")
-                    # Fallback: return items unassigned
-                    for item in gemini_items:
-                        results.append(AutoSplitResultItem(
-                            name=item["name"],
-                            price=item["price"],
-                            members=[],
-                            confidence="unmatched",
-                        ))
-                        unmatched_count += 1
-        elif gemini_items:
-            # No preferences loaded — return items unassigned
-            for item in gemini_items:
-                results.append(AutoSplitResultItem(
-                    name=item["name"],
-                    price=item["price"],
-                    members=[],
-                    confidence="unmatched",
-                ))
-                unmatched_count += 1
-
-        return AutoSplitResponse(
-            items=results,
-            auto_assigned=auto_assigned,
-            shared=shared_count,
-            unmatched=unmatched_count,
+        # The group's own history if it has a shard, else the deployment-wide profile
+        preferences = None
+        if split_request.group_id is not None:
+            preferences = await asyncio.to_thread(group_profiles.get, split_request.group_id)
+        if preferences is None:
+            preferences = await asyncio.to_thread(live_profiles.preferences)
+        if preferences is None:
+            preferences = member_preferences
+
+        remote_assign = partial(gemini_auto_assign, api_key=GEMINI_API_KEY) if GEMINI_API_KEY else None
+
+        result = await auto_split_items(
+            [{"name": item.name, "price": item.price} for item in split_request.items],
+            split_request.members,
+            preferences,
+            item_name_mapping,
+            classifier=item_classifier,
+            remote_assign=remote_assign,
         )
+        # Plain dicts rendered straight to JSON; skips per-item validation and jsonable_encoder
+        return FastJSONResponse(result)
 
     except HTTPException:
         raise
@@ -898,7 +948,7 @@ async def auto_split(request: Request, split_request: AutoSplitRequest):
 
 
 @app.get("/api/get-expense")
-async def get_expense(expense_id: int, request: Request):
+def get_expense(expense_id: int, request: Request):
     try:
         session = get_current_session(request)
         sObj = get_splitwise_client(session)
@@ -918,7 +968,8 @@ async def get_expense(expense_id: int, request: Request):
         expense_details = {
             "cost": exp_obj.getCost(),
             "description": exp_obj.getDescription(),
-            "comment": exp_obj.getDetails(),
+            # Compact ITEMDATA is expanded back to the JSON list the frontend parses
+            "comment": itemdata.expand_details(exp_obj.getDetails() or ""),
             "users": [],
             "group_name":group_name
         }
@@ -938,7 +989,7 @@ async def get_expense(expense_id: int, request: Request):
 
 
 @app.get("/api/list-expenses")
-async def list_expenses(request: Request, count: int = 20, offset: int = 0, group_id: Optional[int] = None):
+def list_expenses(request: Request, count: int = 20, offset: int = 0, group_id: Optional[int] = None):
     """List recent expenses created by this app (containing ---ITEMDATA--- in details)."""
     try:
         session = get_current_session(request)
@@ -973,13 +1024,10 @@ async def list_expenses(request: Request, count: int = 20, offset: int = 0, grou
                 if "---ITEMDATA---" not in details:
                     continue
 
-                # Parse item count
+                # Parse item count (compact payloads carry it in the header)
                 num_items = 0
                 try:
-                    parts = details.split("---ITEMDATA---")
-                    if len(parts) > 1:
-                        item_data = json_lib.loads(parts[1].strip())
-                        num_items = len(item_data) if isinstance(item_data, list) else 0
+                    num_items = itemdata.parse_details(details, header_only=True).count
                 except Exception:
                     pass
 
@@ -1006,11 +1054,11 @@ async def list_expenses(request: Request, count: int = 20, offset: int = 0, grou
             if len(matched) >= count:
                 break
 
-        return {
+        return FastJSONResponse({
             "expenses": matched,
             "next_offset": current_offset,
             "has_more": has_more and len(matched) >= count,
-        }
+        })
 
     except HTTPException:
         raise
@@ -1027,107 +1075,91 @@ class UpdateExpenseRequest(BaseModel):
     description: str
     comment: str
 
+def _submit_expense_update(sObj, expense_req: UpdateExpenseRequest) -> dict:
+    """Overwrite an existing Splitwise expense with the edited splits and comment."""
+    mem_to_id, groups_to_ids = _resolve_splitwise_ids(sObj)
+
+    # Exact integer-cent shares that add up to the total
+    splits, total_cents = _owed_cents(expense_req)
+    total_amt = format_cents(total_cents)
+    
+    # Create expense object for update
+    expense = Expense()
+    expense.setId(expense_req.expense_id)
+    expense.setCost(total_amt)
+    expense.setDescription(expense_req.description)
+    
+    # Check if the comment already has the expense ID, if not add it
+    comment = itemdata.compact_details(expense_req.comment)
+    if not comment.startswith(f"EXPENSE_ID:{expense_req.expense_id}"):
+        updated_comment = f"EXPENSE_ID:{expense_req.expense_id}\n{comment}"
+        expense.setDetails(updated_comment)
+    else:
+        expense.setDetails(comment)
+    
+    # Ensure the group ID is properly set
+    if expense_req.group_id in groups_to_ids:
+        expense.setGroupId(groups_to_ids[expense_req.group_id])
+    else:
+        # If the group_id is already the ID and not the name
+        expense.setGroupId(expense_req.group_id)
+    
+    # Create payer
+    payer = ExpenseUser()
+    payer.setId(mem_to_id[expense_req.paid_user])
+    payer.setPaidShare(total_amt)
+    
+    # Set owed share for payer
+    if expense_req.paid_user in splits:
+        payer.setOwedShare(format_cents(splits[expense_req.paid_user]))
+    else:
+        payer.setOwedShare('0')
+    
+    # Add payer to users list
+    users = [payer]
+    
+    # Add debtors
+    for member, amount in splits.items():
+        if amount == 0 or member == expense_req.paid_user:
+            continue
+        
+        debtor = ExpenseUser()
+        debtor.setId(mem_to_id[member])
+        debtor.setPaidShare('0')
+        debtor.setOwedShare(format_cents(amount))
+        users.append(debtor)
+    
+    # Set users and update expense
+    expense.setUsers(users)
+    updated_expense, errors = sObj.updateExpense(expense)
+    
+    if errors:
+        raise HTTPException(status_code=400, detail=f"Error updating expense: {errors}")
+    
+    return {"status": "success", "expense": updated_expense}
+
+
 @app.post("/api/update-expense")
-async def update_expense(expense_req: UpdateExpenseRequest, request: Request):
+def update_expense(expense_req: UpdateExpenseRequest, request: Request, response: Response):
     try:
         session = get_current_session(request)
         sObj = get_splitwise_client(session)
         print("Updating expense:", expense_req.expense_id)
-        
-        # Get member IDs
-        user = sObj.getCurrentUser()
-        friends = sObj.getFriends()
-        
-        mem_to_id = {}
-        mem_to_id[user.first_name] = user.id
-        for friend in friends:
-            mem_to_id[friend.first_name] = friend.id
-        
-        # Get group IDs
-        groups = sObj.getGroups()
-        groups_to_ids = {}
-        for group in groups:
-            groups_to_ids[group.name] = group.id
-        
-        # Round amounts
-        total_amt = round(expense_req.total_amt, 2)
-        splits = {member: round(amount, 2) for member, amount in expense_req.splits.items()}
-        
-        # Calculate rounding difference
-        splits_sum = sum(splits.values())
-        rounding_difference = total_amt - splits_sum
-        
-        if expense_req.paid_user in splits:
-            splits[expense_req.paid_user] = round(splits[expense_req.paid_user] + rounding_difference, 2)
-        
-        # Create expense object for update
-        expense = Expense()
-        expense.setId(expense_req.expense_id)
-        expense.setCost(str(total_amt))
-        expense.setDescription(expense_req.description)
-        
-        # Check if the comment already has the expense ID, if not add it
-        if not expense_req.comment.startswith(f"EXPENSE_ID:{expense_req.expense_id}"):
-            updated_comment = f"EXPENSE_ID:{expense_req.expense_id}\n{expense_req.comment}"
-            expense.setDetails(updated_comment)
-        else:
-            expense.setDetails(expense_req.comment)
-        
-        # Ensure the group ID is properly set
-        if expense_req.group_id in groups_to_ids:
-            expense.setGroupId(groups_to_ids[expense_req.group_id])
-        else:
-            # If the group_id is already the ID and not the name
-            expense.setGroupId(expense_req.group_id)
-        
-        # Create payer
-        payer = ExpenseUser()
-        payer.setId(mem_to_id[expense_req.paid_user])
-        payer.setPaidShare(str(total_amt))
-        
-        # Set owed share for payer
-        if expense_req.paid_user in splits:
-            payer.setOwedShare(str(splits[expense_req.paid_user]))
-        else:
-            payer.setOwedShare('0')
-        
-        # Add payer to users list
-        users = [payer]
-        
-        # Add debtors
-        for member, amount in splits.items():
-            if amount == 0 or member == expense_req.paid_user:
-                continue
-            
-            debtor = ExpenseUser()
-            debtor.setId(mem_to_id[member])
-            debtor.setPaidShare('0')
-            debtor.setOwedShare(str(amount))
-            users.append(debtor)
-        
-        # Set users and update expense
-        expense.setUsers(users)
-        updated_expense, errors = sObj.updateExpense(expense)
-        
-        if errors:
-            raise HTTPException(status_code=400, detail=f"Error updating expense: {errors}")
-        
-        return {"status": "success", "expense": updated_expense}
+        return _run_idempotent(
+            request, response, session, "update-expense", expense_req,
+            lambda state: _submit_expense_update(sObj, expense_req),
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to update expense: {str(e)}")
-    
 
 
 # ADD THIS HELPER FUNCTION
 def parse_expense_comment(comment: str):
-    """Parse the JSON data from Splitwise comment"""
+    """Parse the item data (compact v2 or legacy JSON) from a Splitwise comment"""
     try:
-        if "---ITEMDATA---" in comment:
-            # Split and get the JSON part
-            parts = comment.split("---ITEMDATA---")
-            if len(parts) > 1:
-                json_data = parts[1].strip()
-                return json_lib.loads(json_data)
+        return itemdata.parse_items(comment)
     except Exception as e:
         print(f"Error parsing comment JSON: {e}")
     return None
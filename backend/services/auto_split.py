@@ -0,0 +1,348 @@
+# backend/services/auto_split.py
+"""The /api/auto-split pipeline, independent of FastAPI.
+
+Stages, in order:
+    shared       fee/tax items go to every member
+    fuzzy        token_sort_ratio match against item_name_mapping, members from preferences
+    local_model  services.classifier for what the fuzzy pass missed (if a model is loaded)
+    remote       Gemini (or any `remote_assign` stand-in) for the rest
+
+`auto_split_items` takes the remote step as a parameter, so the backend passes
+Gemini and analysis/replay_auto_split.py can replay history with recorded or
+local stand-in responses. Per-stage seconds and the number of remote calls
+are added to an optional `stats` dict.
+"""
+import json
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from rapidfuzz import fuzz
+
+from services.classifier import CLASSIFIER_MIN_CONFIDENCE
+
+ALWAYS_SHARED_KEYWORDS = ["tax", "service fee", "delivery fee", "tip", "bag fee", "discount", "fees", "tax & fees"]
+
+# (items, members, preferences) -> [{"name", "matched_canonical", "members", "confidence"}]
+RemoteAssign = Callable[[List[dict], List[str], dict], Awaitable[List[dict]]]
+
+STAGES = ("shared", "fuzzy", "local_model", "remote")
+
+
+def auto_split_result(
+    name: str,
+    price: float,
+    members: List[str],
+    confidence: str,
+    matched_canonical: Optional[str] = None,
+) -> dict:
+    """An AutoSplitResultItem as a plain dict (no per-item pydantic validation)."""
+    return {
+        "name": name,
+        "price": price,
+        "members": members,
+        "confidence": confidence,
+        "matched_canonical": matched_canonical,
+    }
+
+
+def is_shared_item(name: str) -> bool:
+    """Check if an item name matches shared/fee keywords."""
+    lower = name.lower().strip()
+    for kw in ALWAYS_SHARED_KEYWORDS:
+        if kw in lower:
+            return True
+    return False
+
+
+def fuzzy_match_item(name: str, mapping: dict, threshold: int = 50) -> str | None:
+    """Try to match a receipt item name to a canonical name using fuzzy matching.
+
+    Uses the same token_sort_ratio algorithm as normalize_app.py.
+    Returns the canonical name if best score >= threshold, else None.
+    """
+    lower_name = name.lower().strip()
+    best_score = 0
+    best_canonical = None
+
+    for raw_name, canonical in mapping.items():
+        if canonical == "__SHARED__":
+            continue
+        score = fuzz.token_sort_ratio(lower_name, raw_name.lower().strip())
+        if score > best_score:
+            best_score = score
+            best_canonical = canonical
+
+    if best_score >= threshold:
+        return best_canonical
+    return None
+
+
+def build_compact_preferences(preferences: dict, active_members: List[str], top_n: int = 5) -> str:
+    """Build a compact string of preferences for the Gemini prompt.
+
+    Items where all active members have purchased are marked as ALL
+    to reduce prompt size and signal universal assignment.
+    """
+    num_active = len(active_members)
+    lines = []
+    for canonical, data in preferences.items():
+        if canonical == "__SHARED__":
+            continue
+        item_members = data["members"]
+        # Count how many of the active members appear in this item's history
+        active_buyers = sum(1 for m in active_members if m in item_members)
+
+        if num_active > 1 and active_buyers == num_active:
+            # All active members have bought this — mark as ALL
+            lines.append(f"- {canonical}: ALL [{data['total_appearances']}x]")
+        else:
+            top_members = list(item_members.items())[:top_n]
+            members_str = ", ".join(f"{m}({c})" for m, c in top_members)
+            lines.append(f"- {canonical}: {members_str} [{data['total_appearances']}x]")
+    return "\n".join(lines)
+
+
+async def gemini_auto_assign(
+    items: List[dict],
+    members: List[str],
+    preferences: dict,
+    api_key: str,
+) -> List[dict]:
+    """Use Gemini to match receipt items to canonical names and assign members."""
+    # Imported here so offline tools (analysis/replay_auto_split.py) run without google-genai
+    from google import genai
+    from google.genai import types
+
+    compact_prefs = build_compact_preferences(preferences, members)
+
+    items_list = "\n".join(f"- {item['name']} (${item['price']:.2f})" for item in items)
+
+    # Build member-count-aware instructions
+    all_members_str = ", ".join(members)
+    num_members = len(members)
+
+    if num_members > 7:
+        member_rule = (
+            "- If historical data shows 'ALL', assign ALL available members.\n"
+            "- For items that are clearly common/shared groceries (staples, produce, household), assign ALL available members.\n"
+            "- Only assign a subset when the item is clearly personal (snacks, specific dietary items, etc.)."
+        )
+    else:
+        member_rule = (
+            "- If historical data shows 'ALL', assign ALL available members.\n"
+            "- Otherwise assign members who appear in more than 30% of that product's purchase history."
+        )
+
+    prompt = f"""You are matching receipt items to known product names from historical grocery data.
+
+RECEIPT ITEMS TO MATCH:
+{items_list}
+
+AVAILABLE MEMBERS ({num_members}): {all_members_str}
+
+HISTORICAL PRODUCT DATA (canonical_name: member(times_bought) or ALL [total_purchases]):
+{compact_prefs}
+
+TASK:
+For each receipt item, find the closest matching canonical product name from the historical data.
+Consider abbreviations, typos, brand names, size variations, and truncated names.
+Then assign members based on these rules:
+{member_rule}
+
+For each item return:
+- "name": the original receipt item name
+- "matched_canonical": the matched canonical product name, or null if no match
+- "members": list of member names to assign (from AVAILABLE MEMBERS only)
+- "confidence": "high" if exact/very close match, "medium" if reasonable match, "low" if uncertain, "unmatched" if no match found
+
+If you cannot match an item, return empty members list and confidence "unmatched"."""
+
+    # Schema for structured output
+    result_schema = types.Schema(
+        type=types.Type.ARRAY,
+        items=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "name": types.Schema(type=types.Type.STRING),
+                "matched_canonical": types.Schema(type=types.Type.STRING, nullable=True),
+                "members": types.Schema(
+                    type=types.Type.ARRAY,
+                    items=types.Schema(type=types.Type.STRING),
+                ),
+                "confidence": types.Schema(type=types.Type.STRING),
+            },
+            required=["name", "matched_canonical", "members", "confidence"],
+        ),
+    )
+
+    client = genai.Client(api_key=api_key)
+    response = client.models.generate_content(
+        model="gemini-2.5-flash",
+        contents=[types.Part.from_text(text=prompt)],
+        config=types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=result_schema,
+            temperature=0.1,
+        ),
+    )
+
+    return json.loads(response.text)
+
+
+async def auto_split_items(
+    items: List[dict],
+    members: List[str],
+    preferences: dict,
+    name_mapping: dict,
+    classifier=None,
+    remote_assign: Optional[RemoteAssign] = None,
+    min_confidence: float = CLASSIFIER_MIN_CONFIDENCE,
+    stats: Optional[dict] = None,
+) -> dict:
+    """Auto-assign members to receipt items ({"name", "price"} dicts).
+
+    Returns the AutoSplitResponse body as plain dicts. Without
+    `remote_assign`, items no local stage could place come back unmatched.
+    """
+    if stats is None:
+        stats = {}
+    seconds = stats.setdefault("seconds", dict.fromkeys(STAGES, 0.0))
+    stats.setdefault("remote_calls", 0)
+    stats.setdefault("remote_items", 0)
+
+    results: List[dict] = []
+    non_shared_items = []
+    auto_assigned = 0
+    shared_count = 0
+    unmatched_count = 0
+
+    # Step 1: Handle shared items
+    start = time.perf_counter()
+    for item in items:
+        if is_shared_item(item["name"]):
+            results.append(auto_split_result(
+                name=item["name"],
+                price=item["price"],
+                members=members,  # All members
+                confidence="shared",
+                matched_canonical="__SHARED__",
+            ))
+            shared_count += 1
+        else:
+            non_shared_items.append({"name": item["name"], "price": item["price"]})
+    seconds["shared"] += time.perf_counter() - start
+
+    # Step 2: Fuzzy matching pre-pass using item_name_mapping
+    start = time.perf_counter()
+    gemini_items = []
+    if non_shared_items and preferences and name_mapping:
+        for item in non_shared_items:
+            canonical = fuzzy_match_item(item["name"], name_mapping)
+            if canonical and canonical in preferences:
+                # Look up members from preferences
+                pref_data = preferences[canonical]
+                item_members = pref_data.get("members", {})
+                active_buyers = [m for m in members if m in item_members]
+
+                if len(active_buyers) == len(members) and len(members) > 1:
+                    assigned = list(members)
+                else:
+                    # Assign members who bought >30% of the time
+                    total = pref_data.get("total_appearances", 1)
+                    assigned = [
+                        m for m in active_buyers
+                        if item_members[m] / total > 0.3
+                    ]
+
+                if assigned:
+                    results.append(auto_split_result(
+                        name=item["name"],
+                        price=item["price"],
+                        members=assigned,
+                        confidence="fuzzy_match",
+                        matched_canonical=canonical,
+                    ))
+                    auto_assigned += 1
+                else:
+                    gemini_items.append(item)
+            else:
+                gemini_items.append(item)
+    else:
+        gemini_items = non_shared_items
+    seconds["fuzzy"] += time.perf_counter() - start
+
+    # Step 2b: Local classifier; only items it is unsure about go to Gemini
+    start = time.perf_counter()
+    if gemini_items and classifier is not None:
+        remaining = []
+        for item in gemini_items:
+            prediction = classifier.predict(item["name"], members)
+            if prediction["confidence"] >= min_confidence and prediction["members"]:
+                results.append(auto_split_result(
+                    name=item["name"],
+                    price=item["price"],
+                    members=prediction["members"],
+                    confidence="local_model",
+                    matched_canonical=prediction["matched"],
+                ))
+                auto_assigned += 1
+            else:
+                remaining.append(item)
+        gemini_items = remaining
+    seconds["local_model"] += time.perf_counter() - start
+
+    # Step 3: Use Gemini for remaining unmatched items
+    start = time.perf_counter()
+    if gemini_items and preferences and remote_assign is not None:
+        try:
+            stats["remote_calls"] += 1
+            stats["remote_items"] += len(gemini_items)
+            gemini_results = await remote_assign(gemini_items, members, preferences)
+
+            for gr in gemini_results:
+                # Filter members to only include those in the request
+                valid_members = [m for m in gr.get("members", []) if m in members]
+                confidence = gr.get("confidence", "unmatched")
+
+                results.append(auto_split_result(
+                    name=gr["name"],
+                    price=next((i["price"] for i in gemini_items if i["name"] == gr["name"]), 0),
+                    members=valid_members,
+                    confidence=confidence,
+                    matched_canonical=gr.get("matched_canonical"),
+                ))
+
+                if confidence in ("high", "medium", "low") and valid_members:
+                    auto_assigned += 1
+                else:
+                    unmatched_count += 1
+
+        except Exception as e:
+            print(f"Gemini auto-assign failed: {e}")
+            # Fallback: return items unassigned
+            for item in gemini_items:
+                results.append(auto_split_result(
+                    name=item["name"],
+                    price=item["price"],
+                    members=[],
+                    confidence="unmatched",
+                ))
+                unmatched_count += 1
+    elif gemini_items:
+        # No remote step configured or no preferences loaded — return items unassigned
+        for item in gemini_items:
+            results.append(auto_split_result(
+                name=item["name"],
+                price=item["price"],
+                members=[],
+                confidence="unmatched",
+            ))
+            unmatched_count += 1
+    seconds["remote"] += time.perf_counter() - start
+
+    return {
+        "items": results,
+        "auto_assigned": auto_assigned,
+        "shared": shared_count,
+        "unmatched": unmatched_count,
+    }
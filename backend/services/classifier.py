@@ -0,0 +1,198 @@
+# backend/services/classifier.py
+"""Local item → members model, trained by analysis/build_profiles.py.
+
+Each distinct (token-sorted, lowercased) historical item name is one
+example, with how often each member was on it. Names are embedded as TF-IDF
+vectors of hashed character 3- and 4-grams; a receipt item is scored
+against every example through an inverted index (postings per n-gram) and
+its members are the similarity-weighted vote of the top neighbours. The
+cosine similarity of the best neighbour is the confidence: auto-split only
+asks Gemini about items below CLASSIFIER_MIN_CONFIDENCE. Each example also
+stores the canonical name its raw names map to (the most common one), which
+is what a prediction reports as matched, like the fuzzy and Gemini stages.
+
+The model is one .npz file (no pickles) and predicts in well under a
+millisecond per item.
+"""
+import math
+import os
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("CLASSIFIER_MIN_CONFIDENCE", "0.7"))
+
+MODEL_VERSION = 2
+NGRAM_SIZES = (3, 4)
+HASH_BUCKETS = 1 << 20
+NEIGHBOURS = 5
+# Same cut-off as the fuzzy pre-pass: members on more than 30% of purchases
+MEMBER_SHARE = 0.3
+
+
+def name_key(name: str) -> str:
+    """Lowercased, whitespace-normalized name with its tokens sorted."""
+    return " ".join(sorted(name.lower().split()))
+
+
+def _ngram_counts(key: str) -> Counter:
+    padded = f" {key} "
+    counts = Counter()
+    for n in NGRAM_SIZES:
+        if len(padded) < n:
+            counts[zlib.crc32(padded.encode()) % HASH_BUCKETS] += 1
+            continue
+        for i in range(len(padded) - n + 1):
+            counts[zlib.crc32(padded[i:i + n].encode()) % HASH_BUCKETS] += 1
+    return counts
+
+
+def _tf(counts: Counter) -> Dict[int, float]:
+    return {feature: 1.0 + math.log(count) for feature, count in counts.items()}
+
+
+def train(rows: Iterable[Tuple[str, List[str], str]]) -> dict:
+    """Model arrays from (item name, members, canonical name) rows."""
+    example_ids: Dict[str, int] = {}
+    member_ids: Dict[str, int] = {}
+    appearances: List[int] = []
+    member_counts: List[Counter] = []
+    canonical_counts: List[Counter] = []
+    for name, members, canonical in rows:
+        key = name_key(name)
+        if not key:
+            continue
+        example = example_ids.get(key)
+        if example is None:
+            example = example_ids[key] = len(example_ids)
+            appearances.append(0)
+            member_counts.append(Counter())
+            canonical_counts.append(Counter())
+        appearances[example] += 1
+        canonical_counts[example][canonical] += 1
+        for member in members:
+            member_counts[example][member_ids.setdefault(member, len(member_ids))] += 1
+
+    keys = list(example_ids)
+    tfs = [_tf(_ngram_counts(key)) for key in keys]
+    document_freq = Counter(feature for tf in tfs for feature in tf)
+    features = np.array(sorted(document_freq), dtype=np.uint32)
+    idf = np.array(
+        [math.log((1 + len(keys)) / (1 + document_freq[f])) + 1.0 for f in features.tolist()], dtype=np.float32,
+    )
+    idf_of = dict(zip(features.tolist(), idf.tolist()))
+
+    # Postings grouped by feature: (feature, example, weight of the feature in the example's unit vector)
+    entries = []
+    for example, tf in enumerate(tfs):
+        weights = {feature: value * idf_of[feature] for feature, value in tf.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        entries.extend((feature, example, weight / norm) for feature, weight in weights.items())
+    entries.sort()
+    posting_features = np.array([e[0] for e in entries], dtype=np.uint32)
+
+    counts = np.zeros((len(keys), len(member_ids)), dtype=np.uint32)
+    for example, member_counter in enumerate(member_counts):
+        for member, count in member_counter.items():
+            counts[example, member] = count
+
+    return {
+        "version": np.array(MODEL_VERSION),
+        "keys": np.array(keys, dtype=str),
+        "canonicals": np.array([c.most_common(1)[0][0] for c in canonical_counts], dtype=str),
+        "members": np.array(list(member_ids), dtype=str),
+        "features": features,
+        "idf": idf,
+        "feature_ptr": np.searchsorted(posting_features, features, side="left").astype(np.int64).tolist()
+        + [len(entries)],
+        "posting_examples": np.array([e[1] for e in entries], dtype=np.int32),
+        "posting_weights": np.array([e[2] for e in entries], dtype=np.float32),
+        "counts": counts,
+        "appearances": np.array(appearances, dtype=np.uint32),
+    }
+
+
+def save(path, model: dict):
+    """Write the model atomically."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, **{name: np.asarray(value) for name, value in model.items()})
+    os.replace(tmp_path, path)
+
+
+class ItemClassifier:
+    """Nearest-neighbour member predictions over a trained model."""
+
+    def __init__(self, model: dict):
+        self.keys = [str(k) for k in model["keys"]]
+        self.canonicals = [str(c) for c in model["canonicals"]]
+        self.members = [str(m) for m in model["members"]]
+        self.member_index = {m: i for i, m in enumerate(self.members)}
+        self.features = np.asarray(model["features"], dtype=np.uint32)
+        self.idf = np.asarray(model["idf"], dtype=np.float32)
+        self.feature_ptr = np.asarray(model["feature_ptr"], dtype=np.int64)
+        self.posting_examples = np.asarray(model["posting_examples"], dtype=np.int32)
+        self.posting_weights = np.asarray(model["posting_weights"], dtype=np.float32)
+        counts = np.asarray(model["counts"], dtype=np.float32)
+        appearances = np.maximum(np.asarray(model["appearances"], dtype=np.float32), 1.0)
+        # Share of an example's purchases each member was on
+        self.shares = counts / appearances[:, None]
+
+    @classmethod
+    def load(cls, path) -> Optional["ItemClassifier"]:
+        """The model at `path`, or None if missing, unreadable or outdated."""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                model = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            return None
+        if int(model.get("version", -1)) != MODEL_VERSION:
+            return None
+        return cls(model)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def similarities(self, name: str) -> np.ndarray:
+        """Cosine similarity of `name` to every example."""
+        scores = np.zeros(len(self.keys), dtype=np.float32)
+        tf = _tf(_ngram_counts(name_key(name)))
+        if not tf or not len(self.features):
+            return scores
+        query = np.fromiter(tf, dtype=np.uint32, count=len(tf))
+        positions = np.searchsorted(self.features, query)
+        positions = np.minimum(positions, len(self.features) - 1)
+        known = self.features[positions] == query
+        # N-grams never seen in training get the rarest weight; they still count towards the norm
+        weights = np.fromiter(tf.values(), dtype=np.float32, count=len(tf))
+        weights[known] *= self.idf[positions[known]]
+        weights[~known] *= self.idf.max()
+        weights /= np.linalg.norm(weights) or 1.0
+        for position, weight in zip(positions[known].tolist(), weights[known].tolist()):
+            start, end = self.feature_ptr[position], self.feature_ptr[position + 1]
+            scores[self.posting_examples[start:end]] += weight * self.posting_weights[start:end]
+        return scores
+
+    def predict(self, name: str, active_members: List[str], k: int = NEIGHBOURS) -> dict:
+        """{"members", "confidence", "matched"} for one item.
+
+        Members are the active members whose similarity-weighted share over
+        the top `k` neighbours is above MEMBER_SHARE; confidence is the best
+        neighbour's cosine similarity and matched its canonical name.
+        """
+        scores = self.similarities(name)
+        if not len(scores) or scores.max() <= 0:
+            return {"members": [], "confidence": 0.0, "matched": None}
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        top = top[scores[top] > 0]
+        weights = scores[top]
+        votes = weights @ self.shares[top] / weights.sum()
+        members = [
+            m for m in active_members
+            if m in self.member_index and votes[self.member_index[m]] > MEMBER_SHARE
+        ]
+        return {"members": members, "confidence": float(scores[top[0]]), "matched": self.canonicals[top[0]]}
@@ -0,0 +1,104 @@
+# backend/services/idempotency.py
+"""Bounded in-process store for Idempotency-Key handling.
+
+The first request for a key runs the operation; retries with the same key get
+the stored result back without touching Splitwise again, and duplicates that
+arrive while the first is still running wait for it instead of running twice.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "1000"))
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(60 * 60 * 24)))
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a request with a different body."""
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "created_at", "running", "completed", "result", "error", "state", "done")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.created_at = time.monotonic()
+        self.running = False
+        self.completed = False
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        # Survives failed attempts, so a retry can resume (e.g. skip an expense already created)
+        self.state: Dict[str, Any] = {}
+        self.done = threading.Event()
+
+
+def fingerprint(payload: str) -> str:
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """LRU + TTL bounded map of idempotency key -> completed result."""
+
+    def __init__(self, max_keys: int = IDEMPOTENCY_MAX_KEYS, ttl: float = IDEMPOTENCY_TTL_SECONDS):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        expired = [k for k, e in self._entries.items() if not e.running and now - e.created_at > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        # Oldest first; never drop an entry someone may be waiting on
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_keys:
+                break
+            if not self._entries[key].running:
+                del self._entries[key]
+
+    def execute(self, key: str, request_fingerprint: str, fn: Callable[[dict], Any]) -> Tuple[Any, bool]:
+        """Run `fn(state)` once per key. Returns (result, replayed)."""
+        with self._lock:
+            self._evict(time.monotonic())
+            entry = self._entries.get(key)
+            if entry is not None and entry.fingerprint != request_fingerprint:
+                raise IdempotencyConflict("Idempotency-Key was already used with a different request")
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if entry.completed:
+                    return entry.result, True
+            if entry is not None and entry.running:
+                leader = False
+            else:
+                if entry is None:
+                    entry = _Entry(request_fingerprint)
+                    self._entries[key] = entry
+                entry.running = True
+                entry.error = None
+                entry.done = threading.Event()
+                leader = True
+
+        if not leader:
+            entry.done.wait()
+            if entry.completed:
+                return entry.result, True
+            raise entry.error
+
+        try:
+            result = fn(entry.state)
+        except BaseException as e:
+            with self._lock:
+                entry.running = False
+                entry.error = e
+            entry.done.set()
+            raise
+
+        with self._lock:
+            entry.result = result
+            entry.completed = True
+            entry.running = False
+        entry.done.set()
+        return result, False
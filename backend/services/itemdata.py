@@ -0,0 +1,206 @@
+# backend/services/itemdata.py
+"""Encoding of the ITEMDATA section stored in Splitwise expense `details`.
+
+    <comment text>
+    ---ITEMDATA---
+    <payload>
+
+Legacy payloads are a JSON list of {"name", "price", "members"} items, which
+repeats every member name on every item. Version 2 stores a member table plus a
+per-item bitmask, zlib-compressed and base64url-encoded, behind a small plain
+text header so listings can read the item count and total without decoding:
+
+    v2;n=<item count>;t=<total cents>;<base64url(zlib(json))>
+
+where the JSON is {"m": [members...], "i": [[name, price_cents, mask], ...]}.
+Masks wider than 53 bits (groups past 53 members) are written as hex strings,
+since JSON parsers, orjson included, do not keep integers that large exact.
+Both formats are accepted everywhere ITEMDATA is read. Decoded v2 items list
+their members in member-table order.
+
+This is the one parser for stored details, shared by the backend and
+`analysis/extract_expenses.py`. `parse_details(..., header_only=True)` returns
+the EXPENSE_ID and item count without decoding items (v2 payloads only; legacy
+JSON still has to be decoded to be counted).
+"""
+import base64
+import json
+import zlib
+from typing import List, NamedTuple, Optional
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # optional speedup
+    _loads = json.loads
+
+# Largest mask written as a JSON number (exact as a double)
+MAX_INT_MASK = (1 << 53) - 1
+
+MARKER = "---ITEMDATA---"
+V2_PREFIX = "v2;"
+EXPENSE_ID_PREFIX = "EXPENSE_ID:"
+
+
+class ItemDataHeader(NamedTuple):
+    count: int
+    total_cents: int
+
+
+class ParsedDetails(NamedTuple):
+    expense_id: Optional[str]
+    count: int
+    total_cents: Optional[int]
+    items: Optional[list]  # None in header-only mode or without ITEMDATA
+
+
+def _cents(price) -> int:
+    return int(round(float(price) * 100))
+
+
+def _selected_members(members) -> List[str]:
+    # Older payloads store members as {name: bool}
+    if isinstance(members, dict):
+        return [m for m, selected in members.items() if selected]
+    if isinstance(members, list):
+        return members
+    return []
+
+
+def encode_items(items: List[dict]) -> str:
+    """Encode ITEMDATA items as a compact v2 payload."""
+    member_bits = {}
+    rows = []
+    total = 0
+    for item in items:
+        price = item.get("price", item.get("item_price", 0))
+        cents = _cents(price)
+        mask = 0
+        for m in _selected_members(item.get("members")):
+            mask |= 1 << member_bits.setdefault(m, len(member_bits))
+        row = [item.get("name", item.get("item_name", "")), cents, mask if mask <= MAX_INT_MASK else f"{mask:x}"]
+        if cents / 100 != float(price):
+            row.append(float(price))  # keep sub-cent prices lossless
+        rows.append(row)
+        total += cents
+
+    body = json.dumps({"m": list(member_bits), "i": rows}, separators=(",", ":"), ensure_ascii=False)
+    packed = base64.urlsafe_b64encode(zlib.compress(body.encode("utf-8"), 9)).decode("ascii")
+    return f"{V2_PREFIX}n={len(rows)};t={total};{packed}"
+
+
+def read_header(payload: str) -> Optional[ItemDataHeader]:
+    """Item count and total of a v2 payload, without decoding the body."""
+    payload = payload.lstrip()
+    if not payload.startswith(V2_PREFIX):
+        return None
+    try:
+        _, count, total, _ = payload.split(";", 3)
+        return ItemDataHeader(int(count[2:]), int(total[2:]))
+    except ValueError:
+        return None
+
+
+def decode_payload(payload: str):
+    """Decode an ITEMDATA payload (v2 or legacy JSON) into a list of items."""
+    payload = payload.strip()
+    if not payload.startswith(V2_PREFIX):
+        return _loads(payload)
+
+    packed = payload.split(";", 3)[3]
+    body = zlib.decompress(base64.urlsafe_b64decode(packed))
+    data = _loads(body)
+    if _loads is not json.loads and any(isinstance(row[2], float) for row in data["i"]):
+        # Written as integer masks past 64 bits, which orjson reads as floats
+        data = json.loads(body)
+    members = data["m"]
+    # Decoded member lists are shared between items with the same mask
+    by_mask = {}
+    items = []
+    for row in data["i"]:
+        mask = int(row[2], 16) if isinstance(row[2], str) else row[2]
+        selected = by_mask.get(mask)
+        if selected is None:
+            selected = by_mask[mask] = [m for bit, m in enumerate(members) if mask >> bit & 1]
+        items.append({
+            "name": row[0],
+            "price": row[3] if len(row) > 3 else row[1] / 100,
+            "members": list(selected),
+        })
+    return items
+
+
+def split_details(details: str):
+    """Split details into (text before the marker, payload) or (details, None)."""
+    head, sep, payload = details.partition(MARKER)
+    if not sep:
+        return details, None
+    return head, payload
+
+
+def parse_items(details: str):
+    """Items stored in a details string, or None if it has no ITEMDATA section.
+
+    Raises ValueError if the payload is malformed.
+    """
+    _, payload = split_details(details)
+    if payload is None:
+        return None
+    return decode_payload(payload)
+
+
+def parse_expense_id(details: str) -> Optional[str]:
+    """The EXPENSE_ID value stamped at the top of details, if any."""
+    if not details:
+        return None
+    start = details.find(EXPENSE_ID_PREFIX)
+    if start == -1:
+        return None
+    start += len(EXPENSE_ID_PREFIX)
+    end = details.find("\n", start)
+    value = (details[start:] if end == -1 else details[start:end]).strip()
+    return value or None
+
+
+def parse_details(details: str, header_only: bool = False) -> ParsedDetails:
+    """EXPENSE_ID, item count, total and (unless header_only) items of a details string.
+
+    Raises ValueError if the ITEMDATA payload is malformed.
+    """
+    expense_id = parse_expense_id(details)
+    _, payload = split_details(details or "")
+    if payload is None:
+        return ParsedDetails(expense_id, 0, None, None)
+
+    header = read_header(payload)
+    if header_only and header:
+        return ParsedDetails(expense_id, header.count, header.total_cents, None)
+
+    items = decode_payload(payload)
+    if not isinstance(items, list):
+        return ParsedDetails(expense_id, 0, None, None)
+    total = header.total_cents if header else None
+    return ParsedDetails(expense_id, len(items), total, None if header_only else items)
+
+
+def compact_details(details: str) -> str:
+    """Rewrite a details string so its ITEMDATA uses the compact v2 encoding."""
+    head, payload = split_details(details)
+    if payload is None or payload.lstrip().startswith(V2_PREFIX):
+        return details
+    try:
+        items = decode_payload(payload)
+        if not isinstance(items, list):
+            return details
+        encoded = encode_items(items)
+    except (ValueError, TypeError, AttributeError):
+        return details  # leave payloads we cannot read untouched
+    return f"{head}{MARKER}\n{encoded}"
+
+
+def expand_details(details: str) -> str:
+    """Rewrite v2 ITEMDATA back to the legacy JSON list the frontend parses."""
+    head, payload = split_details(details)
+    if payload is None or not payload.lstrip().startswith(V2_PREFIX):
+        return details
+    return f"{head}{MARKER}\n{json.dumps(decode_payload(payload))}"
@@ -0,0 +1,161 @@
+# backend/services/jobs.py
+"""In-process background jobs for slow receipt analysis.
+
+Clients submit work and poll `/api/jobs/{job_id}` instead of holding an HTTP
+request open for the whole Gemini call. Workers are asyncio tasks that run the
+(blocking) analysis in a thread. Pending jobs wait in `LocalFairQueue`, which
+serves users round-robin.
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+ANALYSIS_MAX_PENDING = int(os.getenv("ANALYSIS_MAX_PENDING", "50"))
+ANALYSIS_MAX_PENDING_PER_USER = int(os.getenv("ANALYSIS_MAX_PENDING_PER_USER", "5"))
+ANALYSIS_RESULT_TTL_SECONDS = float(os.getenv("ANALYSIS_RESULT_TTL_SECONDS", "900"))
+
+
+class QueueFull(Exception):
+    """Too many jobs pending, globally or for this user."""
+
+
+class Job:
+    def __init__(self, owner: str, kind: str, fn: Callable, args: tuple):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.kind = kind
+        self.fn = fn
+        self.args = args
+        self.status = "queued"  # "queued", "running", "done", "failed"
+        self.progress = 0.0
+        self.stage = "Waiting in queue"
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def report(self, progress: float, stage: str):
+        """Progress callback handed to the job function (called from its thread)."""
+        self.progress = round(progress, 2)
+        self.stage = stage
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "stage": self.stage,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class LocalFairQueue:
+    """Per-user FIFO queues served round-robin, so one user's batch of uploads
+    cannot starve everyone else."""
+
+    def __init__(self, max_pending: int = ANALYSIS_MAX_PENDING, max_per_user: int = ANALYSIS_MAX_PENDING_PER_USER):
+        self.max_pending = max_pending
+        self.max_per_user = max_per_user
+        self._queues: "OrderedDict[str, Deque[Job]]" = OrderedDict()
+        self._size = 0
+        self._available: Optional[asyncio.Semaphore] = None
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the server's event loop
+        if self._available is None:
+            self._available = asyncio.Semaphore(0)
+        return self._available
+
+    def pending(self, owner: Optional[str] = None) -> int:
+        if owner is None:
+            return self._size
+        return len(self._queues.get(owner, ()))
+
+    def put(self, job: Job):
+        if self._size >= self.max_pending:
+            raise QueueFull("Analysis queue is full, try again shortly")
+        if self.pending(job.owner) >= self.max_per_user:
+            raise QueueFull(f"You already have {self.max_per_user} analyses pending")
+        self._queues.setdefault(job.owner, deque()).append(job)
+        self._size += 1
+        self._semaphore().release()
+
+    async def get(self) -> Job:
+        await self._semaphore().acquire()
+        # Take from the user at the front, then move them to the back
+        owner, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        self._queues.pop(owner)
+        if queue:
+            self._queues[owner] = queue
+        self._size -= 1
+        return job
+
+
+class JobManager:
+    """Owns the queue, the worker tasks and finished results (kept for a TTL)."""
+
+    def __init__(self, queue: Optional[LocalFairQueue] = None, workers: int = ANALYSIS_WORKERS,
+                 result_ttl: float = ANALYSIS_RESULT_TTL_SECONDS):
+        self.queue = queue or LocalFairQueue()
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self._jobs: Dict[str, Job] = {}
+        self._tasks: list = []
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _purge_expired(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, owner: str, kind: str, fn: Callable, *args) -> Job:
+        """Queue `fn(job.report, *args)` to run on a worker. Raises QueueFull."""
+        self._purge_expired()
+        job = Job(owner, kind, fn, args)
+        self.queue.put(job)
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._purge_expired()
+        return self._jobs.get(job_id)
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            job.status = "running"
+            job.report(0.05, "Starting")
+            try:
+                job.result = await asyncio.to_thread(job.fn, job.report, *job.args)
+                job.status = "done"
+                job.report(1.0, "Done")
+            except Exception as e:
+                job.status = "failed"
+                job.error = getattr(e, "detail", None) or str(e)
+                job.stage = "Failed"
+            finally:
+                job.finished_at = time.time()
+                # Inputs (uploaded bytes) are no longer needed once the job ran
+                job.args = ()
@@ -0,0 +1,576 @@
+# backend/services/preferences.py
+"""Additive member-preference aggregates.
+
+member_preferences.json is derived from per-canonical sums that can be
+updated one expense at a time:
+
+    {canonical: {"members": {name: count}, "appearances": n,
+                 "price_sum": dollars, "price_count": n}}
+
+`analysis/build_profiles.py` keeps them in profile_state.json together with
+the IDs of the expenses they cover, and only folds in new item rows on later
+runs. The backend applies the same delta right after /api/create-expense and
+writes the state back periodically (`LiveProfiles`).
+
+The same state format, one file per Splitwise group, is written to
+profiles/<group_id>.json. The backend loads a group's shard only when that
+group auto-splits, into an LRU-bounded cache (`GroupProfiles`), so prompt
+size and memory follow the group rather than the whole deployment.
+
+In memory the backend holds preferences as `CompactPreferences`: an interned
+member table and flat integer arrays instead of one dict per item, decoded
+back to the same dicts (and cached) when an item is looked up. Recording
+an expense replaces just the items it touched, in a small overlay on top of
+the arrays; only once the overlay outgrows PREFERENCES_OVERLAY_MAX items is
+the compact form rebuilt from all aggregates (O(items in history)), on the
+next read.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+PREFERENCES_FLUSH_SECONDS = float(os.getenv("PREFERENCES_FLUSH_SECONDS", "60"))
+PREFERENCE_SHARDS_CACHED = int(os.getenv("PREFERENCE_SHARDS_CACHED", "32"))
+# Groups whose recorded expenses are held in memory while their shard file does not cover them
+PREFERENCE_PENDING_GROUPS = int(os.getenv("PREFERENCE_PENDING_GROUPS", "256"))
+# Member counts below this are dropped from the in-memory preferences (1 keeps everything)
+PREFERENCES_MIN_COUNT = int(os.getenv("PREFERENCES_MIN_COUNT", "1"))
+# Decoded items CompactPreferences keeps for repeated lookups
+PREFERENCES_DECODED_CACHE = int(os.getenv("PREFERENCES_DECODED_CACHE", "4096"))
+# Items updated in place before CompactPreferences is rebuilt from the aggregates
+PREFERENCES_OVERLAY_MAX = int(os.getenv("PREFERENCES_OVERLAY_MAX", "1024"))
+
+STATE_VERSION = 1
+SHARED = "__SHARED__"
+
+Row = Tuple[str, float, List[str]]  # (canonical name, price, members)
+
+
+def canonical_names(raw_name: str, name_mapping: dict) -> List[str]:
+    """Canonical names for one raw item name.
+
+    Unmapped names fall back to the lowercased raw name; mappings like
+    "paneer, onions" (combined items) give one canonical name per part.
+    """
+    mapped = name_mapping.get(raw_name)
+    if mapped is None:
+        return [raw_name.lower().strip()]
+    if mapped == SHARED:
+        return [SHARED]
+    if "," in mapped:
+        return [c.strip() for c in mapped.split(",") if c.strip()]
+    return [mapped]
+
+
+def mapping_fingerprint(name_mapping: dict, names: Optional[Iterable[str]] = None) -> str:
+    """Aggregates are only valid for the name mapping they were built with.
+
+    Given the raw `names` the aggregates cover, only the canonical names the
+    mapping gives those count: entries for names not in the data yet, or that
+    agree with the lowercased fallback, leave the fingerprint unchanged.
+    """
+    if names is not None:
+        name_mapping = {name: canonical_names(name, name_mapping) for name in names if isinstance(name, str)}
+    body = json.dumps(name_mapping, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def item_rows(items: Iterable[dict], name_mapping: dict) -> List[Row]:
+    """Aggregate rows for ITEMDATA items (one per canonical name of each item)."""
+    rows = []
+    for item in items:
+        members = item.get("members", {})
+        # Older payloads store members as {name: bool}
+        if isinstance(members, dict):
+            members = [m for m, selected in members.items() if selected]
+        elif not isinstance(members, list):
+            members = []
+        members = [m.strip() for m in members if m and m.strip()]
+        price = float(item.get("price", item.get("item_price", 0)))
+        name = item.get("name", item.get("item_name", ""))
+        rows.extend((canonical, price, members) for canonical in canonical_names(name, name_mapping))
+    return rows
+
+
+def _empty() -> dict:
+    return {"members": {}, "appearances": 0, "price_sum": 0.0, "price_count": 0}
+
+
+def add_rows(aggregates: Dict[str, dict], rows: Iterable[Row]):
+    """Fold rows into `aggregates` in place."""
+    for canonical, price, members in rows:
+        agg = aggregates.get(canonical)
+        if agg is None:
+            agg = aggregates[canonical] = _empty()
+        agg["appearances"] += 1
+        if price == price:  # skip NaN prices, like a pandas mean
+            agg["price_sum"] += price
+            agg["price_count"] += 1
+        counts = agg["members"]
+        for member in members:
+            counts[member] = counts.get(member, 0) + 1
+
+
+def merge(aggregates: Dict[str, dict], other: Dict[str, dict]):
+    """Add `other` into `aggregates` in place (new members keep their first-seen order)."""
+    for canonical, delta in other.items():
+        agg = aggregates.get(canonical)
+        if agg is None:
+            agg = aggregates[canonical] = _empty()
+        agg["appearances"] += delta["appearances"]
+        agg["price_sum"] += delta["price_sum"]
+        agg["price_count"] += delta["price_count"]
+        counts = agg["members"]
+        for member, count in delta["members"].items():
+            counts[member] = counts.get(member, 0) + count
+
+
+def to_preference(agg: dict) -> dict:
+    """One member_preferences.json item: members by count (ties by first seen)."""
+    count = agg["price_count"]
+    return {
+        "members": dict(sorted(agg["members"].items(), key=lambda x: -x[1])),
+        "total_appearances": agg["appearances"],
+        "avg_price": float(np.round(agg["price_sum"] / count, 2)) if count else float("nan"),
+    }
+
+
+def to_preferences(aggregates: Dict[str, dict]) -> dict:
+    """member_preferences.json content: canonicals by appearances (ties alphabetical)."""
+    preferences = {canonical: to_preference(aggregates[canonical]) for canonical in sorted(aggregates)}
+    return dict(sorted(preferences.items(), key=lambda x: -x[1]["total_appearances"]))
+
+
+class CompactPreferences(Mapping):
+    """member_preferences packed into flat arrays, behind the same mapping API.
+
+    Member names are interned once in a table and referred to by 16-bit IDs;
+    each item's (member, count) entries are a slice of two flat arrays, in
+    the original order. Entries with a count below `min_count` are dropped.
+
+    A lookup decodes the item back into the plain {"members",
+    "total_appearances", "avg_price"} dict. Up to `cache_size` decoded items
+    are kept, so the items a receipt keeps hitting cost a dict lookup; the
+    cache is simply reset when full rather than paying LRU bookkeeping on
+    every hit.
+
+    `update` replaces or adds items without touching the arrays: they go to
+    an overlay dict that is swapped in whole, so a reader iterating the
+    mapping never sees it change size. Updated items keep their position
+    (new ones come last) until the owner rebuilds from its aggregates.
+    """
+
+    def __init__(self, preferences: dict, min_count: int = PREFERENCES_MIN_COUNT,
+                 cache_size: int = PREFERENCES_DECODED_CACHE):
+        self.min_count = min_count
+        self.cache_size = cache_size
+        self.members: List[str] = []
+        self.member_ids: Dict[str, int] = {}
+        self.index: Dict[str, int] = {}
+        self.entry_ptr = array("I", [0])
+        self.entry_members = array("H")
+        self.entry_counts = array("I")
+        self.appearances = array("I")
+        self.avg_prices = array("d")
+        self._decoded: Dict[str, dict] = {}
+        self._overlay: Dict[str, dict] = {}
+        # Overlay items that are not in `index`
+        self._added: List[str] = []
+        for canonical, data in preferences.items():
+            self.index[sys.intern(canonical)] = len(self.index)
+            for member, count in data["members"].items():
+                if count < min_count:
+                    continue
+                member_id = self.member_ids.get(member)
+                if member_id is None:
+                    member = sys.intern(member)
+                    member_id = self.member_ids[member] = len(self.members)
+                    self.members.append(member)
+                self.entry_members.append(member_id)
+                self.entry_counts.append(count)
+            self.entry_ptr.append(len(self.entry_members))
+            self.appearances.append(data["total_appearances"])
+            self.avg_prices.append(data.get("avg_price", float("nan")))
+
+    def _decode(self, i: int) -> dict:
+        start, end = self.entry_ptr[i], self.entry_ptr[i + 1]
+        return {
+            "members": dict(zip(map(self.members.__getitem__, self.entry_members[start:end]),
+                                self.entry_counts[start:end])),
+            "total_appearances": self.appearances[i],
+            "avg_price": self.avg_prices[i],
+        }
+
+    @property
+    def overlay_size(self) -> int:
+        return len(self._overlay)
+
+    def update(self, entries: Dict[str, dict]):
+        """Replace or add items, given as member_preferences.json entries."""
+        if self.min_count > 1:
+            entries = {
+                canonical: {**data, "members": {m: c for m, c in data["members"].items() if c >= self.min_count}}
+                for canonical, data in entries.items()
+            }
+        overlay = {**self._overlay, **entries}
+        self._added = [c for c in overlay if c not in self.index]
+        self._overlay = overlay
+        for canonical in entries:
+            self._decoded.pop(canonical, None)
+
+    def __getitem__(self, canonical: str) -> dict:
+        entry = self._overlay.get(canonical)
+        if entry is not None:
+            return entry
+        entry = self._decoded.get(canonical)
+        if entry is None:
+            entry = self._decode(self.index[canonical])
+            if len(self._decoded) >= self.cache_size:
+                self._decoded.clear()
+            self._decoded[canonical] = entry
+        return entry
+
+    def __contains__(self, canonical) -> bool:
+        return canonical in self.index or canonical in self._overlay
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.index
+        yield from self._added
+
+    def __len__(self) -> int:
+        return len(self.index) + len(self._added)
+
+
+def _refresh(preferences: Optional[CompactPreferences], aggregates: Dict[str, dict],
+             rows: List[Row]) -> Optional[CompactPreferences]:
+    """`preferences` with the items in `rows` updated from `aggregates`, or None
+    (rebuild on next read) if there are none yet or the overlay would grow too big."""
+    if preferences is None:
+        return None
+    touched = {canonical for canonical, _, _ in rows}
+    if preferences.overlay_size + len(touched) > PREFERENCES_OVERLAY_MAX:
+        return None
+    preferences.update({canonical: to_preference(aggregates[canonical]) for canonical in touched})
+    return preferences
+
+
+def load_state(path) -> Optional[dict]:
+    """The saved aggregates state, or None if missing, unreadable or outdated."""
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+        return None
+    return state
+
+
+def save_state(path, aggregates: Dict[str, dict], expense_ids: Iterable[str], fingerprint: str,
+               group_id: Optional[str] = None):
+    """Write the aggregates state atomically (`group_id` marks a per-group shard)."""
+    state = {
+        "version": STATE_VERSION,
+        "mapping_fingerprint": fingerprint,
+        "expense_ids": sorted(expense_ids),
+        "aggregates": aggregates,
+    }
+    if group_id is not None:
+        state["group_id"] = group_id
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+class LiveProfiles:
+    """Aggregates kept in memory by the backend and updated after each new expense.
+
+    The state file is written back every `flush_interval` seconds when dirty.
+    If build_profiles.py replaced the file in the meantime, the new state is
+    adopted and any expenses it does not cover yet are re-applied on top.
+    """
+
+    def __init__(self, state_path, flush_interval: float = PREFERENCES_FLUSH_SECONDS):
+        self.state_path = str(state_path)
+        self.flush_interval = flush_interval
+        self.aggregates: Optional[Dict[str, dict]] = None
+        # Built from the aggregates on first read, then updated per recorded expense
+        self._preferences: Optional[CompactPreferences] = None
+        self.expense_ids: set = set()
+        self.fingerprint: Optional[str] = None
+        # Rows applied here that the state on disk may not cover yet
+        self._pending: Dict[str, List[Row]] = {}
+        self._dirty = False
+        self._loaded_mtime: Optional[int] = None
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.aggregates is not None
+
+    def _mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.state_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _adopt(self, state: dict, mtime: Optional[int]):
+        self.aggregates = state["aggregates"]
+        self.expense_ids = set(state["expense_ids"])
+        self.fingerprint = state.get("mapping_fingerprint")
+        self._loaded_mtime = mtime
+        for expense_id in [e for e in self._pending if e in self.expense_ids]:
+            del self._pending[expense_id]
+        for expense_id, rows in self._pending.items():
+            add_rows(self.aggregates, rows)
+            self.expense_ids.add(expense_id)
+        self._dirty = bool(self._pending)
+        self._preferences = None
+
+    def preferences(self) -> Optional[CompactPreferences]:
+        """member_preferences for the current aggregates, or None if live updates are off.
+
+        Recorded expenses update the items they touch in place; a full rebuild
+        (O(items in history)) happens on the first read and after every
+        PREFERENCES_OVERLAY_MAX updated items.
+        """
+        with self._lock:
+            if self.aggregates is None:
+                return None
+            if self._preferences is None:
+                self._preferences = CompactPreferences(to_preferences(self.aggregates))
+            return self._preferences
+
+    def load(self) -> bool:
+        """Load the state file; returns False (live updates off) if there is none."""
+        mtime = self._mtime()
+        state = load_state(self.state_path)
+        if state is None:
+            return False
+        with self._lock:
+            self._adopt(state, mtime)
+        return True
+
+    def record(self, expense_id: str, items: Optional[list], name_mapping: dict) -> bool:
+        """Apply one newly created expense. Returns False if it was skipped."""
+        if not items:
+            return False
+        rows = item_rows(items, name_mapping)
+        with self._lock:
+            if not self.enabled or expense_id in self.expense_ids:
+                return False
+            add_rows(self.aggregates, rows)
+            self.expense_ids.add(expense_id)
+            self._pending[expense_id] = rows
+            self._dirty = True
+            self._preferences = _refresh(self._preferences, self.aggregates, rows)
+        return True
+
+    def flush(self):
+        """Adopt a newer state file if there is one, then write back unsaved deltas."""
+        with self._lock:
+            if not self.enabled:
+                return
+            mtime = self._mtime()
+            if mtime != self._loaded_mtime:
+                state = load_state(self.state_path)
+                if state is None:
+                    return  # being replaced right now; try again next round
+                self._adopt(state, mtime)
+            if self._dirty:
+                save_state(self.state_path, self.aggregates, self.expense_ids, self.fingerprint or "")
+                self._loaded_mtime = self._mtime()
+                self._dirty = False
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                print(f"Warning: Could not persist preference aggregates: {e}")
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+
+class GroupProfiles:
+    """Per-group preferences, loaded on first use from `<shard_dir>/<group_id>.json`.
+
+    At most `max_groups` groups are held; the least recently used one is
+    dropped first. A shard replaced on disk is reloaded on its next lookup.
+    Expenses recorded since a shard was built are kept per group, re-applied
+    whenever the shard is (re)loaded and written into the shard file every
+    `flush_interval` seconds, after which the file covers them. Groups without
+    a shard file keep theirs in memory (at most `max_pending_groups` groups)
+    until a rebuild publishes one.
+    """
+
+    def __init__(self, shard_dir, max_groups: int = PREFERENCE_SHARDS_CACHED,
+                 max_pending_groups: int = PREFERENCE_PENDING_GROUPS,
+                 flush_interval: float = PREFERENCES_FLUSH_SECONDS):
+        self.shard_dir = str(shard_dir)
+        self.max_groups = max_groups
+        self.max_pending_groups = max_pending_groups
+        self.flush_interval = flush_interval
+        # group_id -> {"mtime", "aggregates", "expense_ids", "preferences"}; preferences
+        # is None when a recorded expense overflowed its overlay, until the next lookup
+        self._cache: "OrderedDict[str, dict]" = OrderedDict()
+        # group_id -> {expense_id: rows} recorded here that the shard file does not cover yet
+        self._pending: "OrderedDict[str, Dict[str, List[Row]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _key(group_id) -> Optional[str]:
+        # Splitwise group IDs are integers; anything else never names a shard file
+        key = str(group_id).strip()
+        return key if key.isdigit() else None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.shard_dir, f"{key}.json")
+
+    def _mtime(self, key: str) -> Optional[int]:
+        try:
+            return os.stat(self._path(key)).st_mtime_ns
+        except OSError:
+            return None
+
+    def get(self, group_id) -> Optional[dict]:
+        """member_preferences for one group, or None if it has no shard."""
+        key = self._key(group_id)
+        if key is None:
+            return None
+        mtime = self._mtime(key)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry["mtime"] == mtime:
+                self._cache.move_to_end(key)
+                if entry["preferences"] is None:
+                    entry["preferences"] = CompactPreferences(to_preferences(entry["aggregates"]))
+                return entry["preferences"]
+            if mtime is None:
+                self._cache.pop(key, None)
+                return None
+
+        # Read outside the lock; two concurrent misses just load twice
+        state = load_state(self._path(key))
+        if state is None:
+            return None
+        with self._lock:
+            aggregates = state["aggregates"]
+            expense_ids = set(state["expense_ids"])
+            self._prune(key, expense_ids)
+            for expense_id, rows in self._pending.get(key, {}).items():
+                add_rows(aggregates, rows)
+                expense_ids.add(expense_id)
+            entry = {
+                "mtime": mtime,
+                "aggregates": aggregates,
+                "expense_ids": expense_ids,
+                "preferences": CompactPreferences(to_preferences(aggregates)),
+            }
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_groups:
+                self._cache.popitem(last=False)
+            return entry["preferences"]
+
+    def _prune(self, key: str, covered: set):
+        """Forget pending expenses of a group that its shard file already covers."""
+        pending = self._pending.get(key)
+        if pending is None:
+            return
+        for expense_id in [e for e in pending if e in covered]:
+            del pending[expense_id]
+        if not pending:
+            del self._pending[key]
+
+    def record(self, group_id, expense_id: str, items: Optional[list], name_mapping: dict) -> bool:
+        """Apply one newly created expense to its group. Returns False if it was skipped."""
+        key = self._key(group_id)
+        if key is None or not items:
+            return False
+        rows = item_rows(items, name_mapping)
+        with self._lock:
+            entry = self._cache.get(key)
+            if expense_id in self._pending.get(key, ()) or (entry is not None and expense_id in entry["expense_ids"]):
+                return False
+            self._pending.setdefault(key, {})[expense_id] = rows
+            self._pending.move_to_end(key)
+            if entry is not None:
+                add_rows(entry["aggregates"], rows)
+                entry["expense_ids"].add(expense_id)
+                entry["preferences"] = _refresh(entry["preferences"], entry["aggregates"], rows)
+            while len(self._pending) > self.max_pending_groups:
+                # Least recently recorded group: keep what can go into its shard, drop the rest
+                oldest = next(iter(self._pending))
+                self._persist(oldest)
+                self._pending.pop(oldest, None)
+        return True
+
+    def _persist(self, key: str):
+        """Write a group's pending expenses into its shard file (caller holds the lock)."""
+        mtime = self._mtime(key)
+        state = load_state(self._path(key))
+        if state is None:
+            return  # no shard yet (or being replaced): keep them pending
+        aggregates = state["aggregates"]
+        expense_ids = set(state["expense_ids"])
+        new = {e: rows for e, rows in self._pending.get(key, {}).items() if e not in expense_ids}
+        if new:
+            for expense_id, rows in new.items():
+                add_rows(aggregates, rows)
+                expense_ids.add(expense_id)
+            save_state(self._path(key), aggregates, expense_ids, state.get("mapping_fingerprint") or "",
+                       group_id=key)
+            entry = self._cache.get(key)
+            if entry is not None and entry["mtime"] == mtime:
+                # The cached entry already had these rows applied; it matches the file we wrote
+                entry["mtime"] = self._mtime(key)
+        self._prune(key, expense_ids)
+
+    def flush(self):
+        """Write every group's pending expenses into its shard file."""
+        with self._lock:
+            for key in list(self._pending):
+                self._persist(key)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                print(f"Warning: Could not persist group preference shards: {e}")
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def __len__(self) -> int:
+        return len(self._cache)
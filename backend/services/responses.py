@@ -0,0 +1,24 @@
+# backend/services/responses.py
+"""Default JSON response class for the API.
+
+Renders with orjson (several times faster than the stdlib encoder on large
+receipt and expense listings) and falls back to Starlette's JSONResponse when
+orjson is not installed.
+"""
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
@@ -0,0 +1,148 @@
+# backend/services/split_engine.py
+"""Exact integer-cents split allocation.
+
+Per-member shares are computed from ITEMDATA items as one matrix product and
+then rounded with largest-remainder allocation, so owed amounts are whole cents
+that always add up to the receipt total (no float drift, no dumping the whole
+rounding difference on the payer).
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import chain
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_ONE = Decimal("1")
+
+
+def to_cents(amount) -> int:
+    """Dollar amount (float/str/Decimal) -> integer cents, rounding half up."""
+    if isinstance(amount, int):
+        return amount * 100
+    if isinstance(amount, float):
+        # Fast path; only values sitting on a half cent need exact decimal rounding
+        scaled = amount * 100
+        if abs(abs(scaled - int(scaled)) - 0.5) > 1e-6:
+            return int(round(scaled))
+    return int((Decimal(str(amount)) * 100).quantize(_ONE, rounding=ROUND_HALF_UP))
+
+
+def format_cents(cents: int) -> str:
+    """Integer cents -> Splitwise amount string, e.g. 1234 -> "12.34"."""
+    return str(Decimal(int(cents)).scaleb(-2))
+
+
+def largest_remainder(exact: np.ndarray, total: int) -> np.ndarray:
+    """Round `exact` (fractional cents) to integers that sum exactly to `total`.
+
+    Each value is floored, then the missing cents go to the largest fractional
+    parts (ties broken by position, so results are deterministic).
+    """
+    base = np.floor(exact)
+    # Guard against float noise like 4.999999999 being floored to 4
+    frac = np.round(exact - base, 9)
+    base = base.astype(np.int64)
+    wrap = frac >= 1
+    base[wrap] += 1
+    frac[wrap] = 0
+
+    remaining = int(total - base.sum())
+    if remaining == 0 or len(base) == 0:
+        return base
+    order = np.lexsort((np.arange(len(frac)), -frac))
+    n = len(base)
+    if remaining > 0:
+        steps, extra = divmod(remaining, n)
+        base += steps
+        base[order[:extra]] += 1
+    else:
+        steps, extra = divmod(-remaining, n)
+        base -= steps
+        base[order[::-1][:extra]] -= 1
+    return base
+
+
+def split_matrix(prices_cents: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Core allocation: items x members boolean `mask`, per-item prices in cents.
+
+    Returns the integer cents owed by each member column. Rows with no member
+    selected are ignored (the caller decides who absorbs them).
+    """
+    counts = mask.sum(axis=1)
+    assigned = counts > 0
+    per_head = np.zeros(len(prices_cents), dtype=np.float64)
+    per_head[assigned] = prices_cents[assigned] / counts[assigned]
+    exact = per_head @ mask
+    return largest_remainder(exact, int(prices_cents[assigned].sum()))
+
+
+def _selected_members(members) -> List[str]:
+    # ITEMDATA stores members as a list of names (current) or {name: bool} (older payloads)
+    if isinstance(members, dict):
+        return [m for m, selected in members.items() if selected]
+    if isinstance(members, list):
+        return members
+    return []
+
+
+def compute_splits(
+    items: Iterable[dict],
+    members: Optional[Sequence[str]] = None,
+    paid_user: Optional[str] = None,
+    is_shared: Callable[[str], bool] = lambda name: False,
+) -> Tuple[Dict[str, int], int, int]:
+    """Split ITEMDATA items into integer cents per member.
+
+    - Items with selected members are split evenly among them.
+    - Shared/fee items (`is_shared(name)`) with nobody selected are split across
+      every member on the receipt.
+    - Any other item with nobody selected is charged to `paid_user` (or, without
+      a payer, reported as unassigned).
+
+    Returns ({member: owed_cents}, total_cents, unassigned_cents); owed cents
+    plus unassigned cents always sum to the total.
+    """
+    items = list(items)
+    selected = [_selected_members(item.get("members")) for item in items]
+    flat = list(chain.from_iterable(selected))
+    payer = [paid_user] if paid_user is not None else []
+    # Member order: explicit members, then first appearance on the receipt, then the payer
+    names = list(dict.fromkeys(chain(members or (), flat, payer)))
+    member_index = {m: i for i, m in enumerate(names)}
+
+    prices = np.fromiter((to_cents(item.get("price", 0)) for item in items), dtype=np.int64, count=len(items))
+    lengths = np.fromiter(map(len, selected), dtype=np.int64, count=len(items))
+    mask = np.zeros((len(items), len(names)), dtype=bool)
+    cols = np.fromiter(map(member_index.__getitem__, flat), dtype=np.intp, count=len(flat))
+    mask[np.repeat(np.arange(len(items)), lengths), cols] = True
+
+    unassigned = 0
+    for i in np.flatnonzero(lengths == 0):
+        if names and is_shared(items[i].get("name", "")):
+            mask[i, :] = True
+        else:
+            unassigned += int(prices[i])
+
+    owed = split_matrix(prices, mask)
+    splits = {m: int(c) for m, c in zip(names, owed)}
+    if unassigned and paid_user is not None:
+        splits[paid_user] += unassigned
+        unassigned = 0
+    return splits, int(prices.sum()), unassigned
+
+
+def reconcile_splits(splits: Dict[str, float], total_amt: float, paid_user: str) -> Dict[str, int]:
+    """Turn client-side float splits into integer cents that sum to `total_amt`.
+
+    Sub-cent rounding is spread by largest remainder; only a real gap between
+    the splits and the total (e.g. unassigned items) is charged to the payer.
+    """
+    names = list(splits)
+    exact = np.array([splits[m] for m in names], dtype=np.float64) * 100
+    target = int(round(float(exact.sum())))
+    owed = largest_remainder(exact, target)
+    result = {m: int(c) for m, c in zip(names, owed)}
+    gap = to_cents(total_amt) - target
+    if gap:
+        result[paid_user] = result.get(paid_user, 0) + gap
+    return result
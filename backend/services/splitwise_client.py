@@ -0,0 +1,267 @@
+# backend/services/splitwise_client.py
+"""Rate-limit-aware access to the Splitwise SDK.
+
+Every call made through `RateLimitedSplitwise` draws from a token bucket keyed
+by the caller's Splitwise token, is retried with exponential backoff + jitter on
+429s and transient failures (honouring Retry-After), and identical concurrent
+reads (e.g. two tabs calling `getGroups`) are coalesced into one upstream call.
+
+Shared by the backend and `analysis/extract_expenses.py`, so it only depends on
+the splitwise SDK and `requests`.
+"""
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError
+from splitwise.exception import SplitwiseBaseException
+
+SPLITWISE_RATE_LIMIT = float(os.getenv("SPLITWISE_RATE_LIMIT", "5"))      # requests / second / token
+SPLITWISE_RATE_BURST = float(os.getenv("SPLITWISE_RATE_BURST", "10"))     # bucket capacity
+SPLITWISE_MAX_RETRIES = int(os.getenv("SPLITWISE_MAX_RETRIES", "4"))
+SPLITWISE_BACKOFF_BASE = float(os.getenv("SPLITWISE_BACKOFF_BASE", "0.5"))  # seconds
+SPLITWISE_BACKOFF_MAX = float(os.getenv("SPLITWISE_BACKOFF_MAX", "30"))     # seconds
+
+# Upstream statuses worth retrying. Only 429 is retried for writes, since the
+# others may have been applied before the error came back.
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Kept small: one bucket per active token is plenty for a single deployment.
+MAX_TRACKED_TOKENS = 1024
+
+
+class TokenBucket:
+    """Thread-safe token bucket. `acquire()` blocks until a token is available."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._blocked_until:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+                else:
+                    wait = self._blocked_until - now
+            time.sleep(wait)
+
+    def block_for(self, seconds: float):
+        """Pause every caller sharing this bucket, e.g. after a Retry-After."""
+        with self._lock:
+            now = time.monotonic()
+            self._blocked_until = max(self._blocked_until, now + seconds)
+            self._tokens = 0
+            self._updated = max(self._updated, self._blocked_until)
+
+
+class _InflightCall:
+    """A read in progress that other threads can wait on instead of re-issuing."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+def _status_of(error: BaseException) -> Optional[int]:
+    status = getattr(error, "http_status", None)
+    # The SDK stores the status as a 1-tuple (trailing comma in SplitwiseException)
+    if isinstance(status, tuple):
+        status = status[0] if status else None
+    return status
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    headers = getattr(error, "http_headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _failed_to_connect(error: requests.exceptions.ConnectionError) -> bool:
+    """Whether a ConnectionError happened before the request was sent.
+
+    requests also raises ConnectionError for a connection aborted or closed
+    after the body went out ("Connection aborted.", RemoteDisconnected); only
+    connect-phase failures (refused, DNS, connect timeout) are safe for writes.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    # urllib3 wraps the cause in a MaxRetryError; NewConnectionError subclasses ConnectTimeoutError
+    reason = getattr(reason, "reason", reason)
+    return isinstance(reason, ConnectTimeoutError)
+
+
+def is_retryable(error: BaseException, write: bool = False) -> bool:
+    """Whether a failed call can safely be retried.
+
+    Writes are only retried when the request provably never reached Splitwise
+    (429 or a failure to connect), so a retry cannot create a duplicate.
+    """
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return not write or _failed_to_connect(error)
+    if isinstance(error, requests.exceptions.Timeout):
+        return not write
+    if isinstance(error, SplitwiseBaseException):
+        status = _status_of(error)
+        if write:
+            return status == 429
+        return status in RETRYABLE_STATUSES
+    return False
+
+
+class SplitwiseGateway:
+    """Per-token rate limiting, retries and read coalescing for Splitwise calls."""
+
+    def __init__(
+        self,
+        rate: float = SPLITWISE_RATE_LIMIT,
+        burst: float = SPLITWISE_RATE_BURST,
+        max_retries: int = SPLITWISE_MAX_RETRIES,
+        backoff_base: float = SPLITWISE_BACKOFF_BASE,
+        backoff_max: float = SPLITWISE_BACKOFF_MAX,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._inflight: Dict[Hashable, _InflightCall] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, key: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+                self._buckets[key] = bucket
+                if len(self._buckets) > MAX_TRACKED_TOKENS:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def call(self, key: str, fn: Callable, *args, write: bool = False, **kwargs):
+        """Run `fn` under the token's bucket, retrying transient failures."""
+        bucket = self.bucket(key)
+        attempt = 0
+        while True:
+            bucket.acquire()
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e, write=write):
+                    raise
+                delay = self._backoff(attempt)
+                retry_after = _retry_after(e)
+                if retry_after is not None:
+                    # Splitwise told us when to come back: hold the whole token, not just this call
+                    bucket.block_for(retry_after)
+                    delay = min(delay, retry_after)
+                print(f"Splitwise call {getattr(fn, '__name__', fn)} failed ({e!r}), "
+                      f"retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+
+    def read(self, key: str, fn: Callable, *args, **kwargs):
+        """Like `call`, but identical concurrent reads share one upstream request."""
+        try:
+            call_key = (key, getattr(fn, "__name__", id(fn)), args, tuple(sorted(kwargs.items())))
+            hash(call_key)
+        except TypeError:
+            return self.call(key, fn, *args, **kwargs)
+
+        with self._lock:
+            inflight = self._inflight.get(call_key)
+            leader = inflight is None
+            if leader:
+                inflight = _InflightCall()
+                self._inflight[call_key] = inflight
+
+        if not leader:
+            inflight.done.wait()
+            if inflight.error is not None:
+                raise inflight.error
+            return inflight.result
+
+        try:
+            inflight.result = self.call(key, fn, *args, **kwargs)
+            return inflight.result
+        except BaseException as e:
+            inflight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(call_key, None)
+            inflight.done.set()
+
+
+# Shared by every client in the process so buckets are per token, not per request
+gateway = SplitwiseGateway()
+
+
+def token_key(token: str) -> str:
+    """Bucket key for a Splitwise token, so raw tokens are not kept as dict keys."""
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+
+class RateLimitedSplitwise:
+    """Drop-in wrapper around a `Splitwise` client.
+
+    `get*` methods are treated as reads (coalesced, retried on any transient
+    error); everything else is a write (retried only when it cannot duplicate).
+    """
+
+    def __init__(self, client, token: str, gw: Optional[SplitwiseGateway] = None):
+        self._client = client
+        self._key = token_key(token)
+        self._gateway = gw or gateway
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name.startswith("set"):
+            return attr
+
+        if name.startswith("get"):
+            def read(*args, **kwargs):
+                return self._gateway.read(self._key, attr, *args, **kwargs)
+            return read
+
+        def write(*args, **kwargs):
+            return self._gateway.call(self._key, attr, *args, write=True, **kwargs)
+        return write
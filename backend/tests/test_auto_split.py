@@ -0,0 +1,53 @@
+import asyncio
+import json
+import sys
+from functools import partial
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("rapidfuzz")
+pytest.importorskip("numpy")
+
+from services.auto_split import auto_split_items, gemini_auto_assign  # noqa: E402
+
+
+@pytest.fixture
+def gemini_client(monkeypatch):
+    """A google.genai stand-in whose Client returns a canned generate_content response."""
+    genai = mock.MagicMock()
+    google = mock.MagicMock(genai=genai)
+    monkeypatch.setitem(sys.modules, "google", google)
+    monkeypatch.setitem(sys.modules, "google.genai", genai)
+    monkeypatch.setitem(sys.modules, "google.genai.types", genai.types)
+    return genai.Client.return_value
+
+
+def test_item_is_assigned_through_gemini(gemini_client):
+    gemini_client.models.generate_content.return_value.text = json.dumps([
+        {"name": "Oat Milk 64oz", "matched_canonical": "oat milk", "members": ["Akula", "Nobody"],
+         "confidence": "high"},
+    ])
+    preferences = {"oat milk": {"members": {"Akula": 4}, "total_appearances": 4, "avg_price": 4.99}}
+    stats = {}
+
+    result = asyncio.run(auto_split_items(
+        [{"name": "Oat Milk 64oz", "price": 4.99}],
+        ["Akula", "Satwik"],
+        preferences,
+        {},
+        remote_assign=partial(gemini_auto_assign, api_key="test-key"),
+        stats=stats,
+    ))
+
+    assert result["items"] == [{
+        "name": "Oat Milk 64oz",
+        "price": 4.99,
+        "members": ["Akula"],
+        "confidence": "high",
+        "matched_canonical": "oat milk",
+    }]
+    assert result["auto_assigned"] == 1
+    assert result["unmatched"] == 0
+    assert stats["remote_calls"] == 1
+    gemini_client.models.generate_content.assert_called_once()
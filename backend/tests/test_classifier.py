@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("rapidfuzz")
+
+from services import classifier  # noqa: E402
+from services.auto_split import auto_split_items  # noqa: E402
+from services.preferences import canonical_names  # noqa: E402
+
+NAME_MAPPING = {
+    "Organic Oat Milk 64oz": "oat milk",
+    "OATLY Oat Milk Barista": "oat milk",
+    "Paneer & Onions Combo": "paneer, onions",
+}
+HISTORY = [
+    ("Organic Oat Milk 64oz", ["Akula"]),
+    ("OATLY Oat Milk Barista", ["Akula"]),
+    ("Paneer & Onions Combo", ["Satwik", "Puneet"]),
+    ("Basmati Rice 10lb", ["Satwik"]),
+]
+
+
+def _model():
+    rows = [(name, members, canonical_names(name, NAME_MAPPING)[0]) for name, members in HISTORY]
+    return classifier.ItemClassifier(classifier.train(rows))
+
+
+def test_local_model_reports_canonical_names():
+    canonical_set = {c for name, _ in HISTORY for c in canonical_names(name, NAME_MAPPING)}
+    items = [
+        {"name": "Organic Oat Milk 64 oz", "price": 4.99},
+        {"name": "Paneer & Onions Combo Pack", "price": 7.5},
+        {"name": "Basmati Rice 10 lb", "price": 12.0},
+    ]
+
+    result = asyncio.run(auto_split_items(
+        items, ["Akula", "Satwik", "Puneet"], {}, {}, classifier=_model(), min_confidence=0.5,
+    ))
+
+    local = [item for item in result["items"] if item["confidence"] == "local_model"]
+    assert len(local) == len(items)
+    for item in local:
+        assert item["matched_canonical"] in canonical_set
+    assert local[0]["matched_canonical"] == "oat milk"
+    assert local[2]["matched_canonical"] == "basmati rice 10lb"
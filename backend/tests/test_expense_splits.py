@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("splitwise")
+pytest.importorskip("google.genai")
+
+from fastapi import HTTPException  # noqa: E402
+
+import app  # noqa: E402
+from services import itemdata  # noqa: E402
+
+ITEMS = [
+    {"name": "Pizza", "price": 3.33, "members": ["A", "B", "C"]},
+    {"name": "Tax", "price": 0.5, "members": []},
+]
+
+
+def _request(splits, items=ITEMS, total=3.83):
+    return app.ExpenseRequest(
+        splits=splits, paid_user="A", total_amt=total, group_id="Home", description="Dinner",
+        comment=f"Dinner\n{itemdata.MARKER}\n{itemdata.encode_items(items)}",
+    )
+
+
+def test_client_splits_are_kept_and_unassigned_items_go_to_the_payer():
+    splits, total = app._owed_cents(_request({"A": 1.11, "B": 1.11, "C": 1.11}))
+    assert total == 383
+    assert splits == {"A": 161, "B": 111, "C": 111}
+
+
+def test_splits_disagreeing_with_itemdata_are_rejected():
+    with pytest.raises(HTTPException) as error:
+        app._owed_cents(_request({"A": 1.28, "B": 1.28, "C": 1.27}))
+    assert error.value.status_code == 400
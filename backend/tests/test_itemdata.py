@@ -0,0 +1,33 @@
+import base64
+import json
+import zlib
+
+from services import itemdata
+
+
+def _members(n):
+    return [f"member {i}" for i in range(n)]
+
+
+def test_round_trip_with_more_than_64_members():
+    members = _members(70)
+    items = [
+        {"name": "Everyone", "price": 70.0, "members": members},
+        {"name": "Last two", "price": 3.5, "members": members[-2:]},
+        {"name": "First", "price": 1.25, "members": members[:1]},
+    ]
+
+    payload = itemdata.encode_items(items)
+
+    assert itemdata.read_header(payload) == (3, 7475)
+    assert itemdata.decode_payload(payload) == items
+
+
+def test_reads_payloads_with_integer_masks_past_64_bits():
+    members = _members(70)
+    body = json.dumps({"m": members, "i": [["Everyone", 7000, (1 << 70) - 1]]})
+    packed = base64.urlsafe_b64encode(zlib.compress(body.encode())).decode()
+
+    items = itemdata.decode_payload(f"v2;n=1;t=7000;{packed}")
+
+    assert items == [{"name": "Everyone", "price": 70.0, "members": members}]
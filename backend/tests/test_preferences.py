@@ -0,0 +1,113 @@
+from services import preferences
+from services.preferences import GroupProfiles, LiveProfiles, mapping_fingerprint, save_state
+
+ITEMS = [{"name": "Oat Milk", "price": 4.5, "members": ["Akula", "Satwik"]}]
+MAPPING = {"Oat Milk": "oat milk"}
+
+
+def _count_rebuilds(monkeypatch):
+    calls = []
+    real = preferences.to_preferences
+
+    def counting(aggregates):
+        calls.append(1)
+        return real(aggregates)
+
+    monkeypatch.setattr(preferences, "to_preferences", counting)
+    return calls
+
+
+def test_live_profiles_update_in_place(tmp_path, monkeypatch):
+    state_path = tmp_path / "profile_state.json"
+    save_state(state_path, {}, [], "fingerprint")
+    live = LiveProfiles(state_path)
+    assert live.load()
+    rebuilds = _count_rebuilds(monkeypatch)
+
+    for i in range(5):
+        assert live.record(f"expense-{i}", ITEMS, MAPPING)
+    assert rebuilds == []
+
+    prefs = live.preferences()
+    assert prefs["oat milk"]["members"]["Akula"] == 5
+    assert len(rebuilds) == 1
+
+    names = iter(prefs)
+    assert live.record("expense-5", ITEMS + [{"name": "Paneer", "price": 6.0, "members": ["Puneet"]}], MAPPING)
+    assert live.preferences() is prefs
+    assert prefs["oat milk"]["total_appearances"] == 6
+    assert prefs["paneer"]["members"] == {"Puneet": 1}
+    assert list(names) == ["oat milk", "paneer"]
+    assert len(prefs) == 2
+    assert len(rebuilds) == 1
+
+
+def test_full_overlay_rebuilds_on_next_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(preferences, "PREFERENCES_OVERLAY_MAX", 1)
+    state_path = tmp_path / "profile_state.json"
+    save_state(state_path, {}, [], "fingerprint")
+    live = LiveProfiles(state_path)
+    assert live.load()
+    prefs = live.preferences()
+    rebuilds = _count_rebuilds(monkeypatch)
+
+    assert live.record("expense-1", ITEMS, MAPPING)
+    assert live.preferences() is prefs
+    assert live.record("expense-2", [{"name": "Paneer", "price": 6.0, "members": ["Puneet"]}], MAPPING)
+    assert rebuilds == []
+
+    rebuilt = live.preferences()
+    assert rebuilt is not prefs
+    assert list(rebuilt) == ["oat milk", "paneer"]
+    assert len(rebuilds) == 1
+
+
+def test_group_profiles_update_in_place(tmp_path, monkeypatch):
+    save_state(tmp_path / "42.json", {}, [], "fingerprint", group_id="42")
+    groups = GroupProfiles(tmp_path)
+    prefs = groups.get(42)
+    assert len(prefs) == 0
+    rebuilds = _count_rebuilds(monkeypatch)
+
+    assert groups.record(42, "expense-1", ITEMS, MAPPING)
+    assert groups.record(42, "expense-2", ITEMS, MAPPING)
+
+    assert groups.get(42) is prefs
+    assert prefs["oat milk"]["members"] == {"Akula": 2, "Satwik": 2}
+    assert rebuilds == []
+
+
+def test_group_expenses_survive_a_restart(tmp_path):
+    save_state(tmp_path / "42.json", {}, [], "fingerprint", group_id="42")
+    groups = GroupProfiles(tmp_path)
+    assert groups.record(42, "expense-1", ITEMS, MAPPING)
+
+    groups.flush()
+
+    assert not groups._pending
+    restarted = GroupProfiles(tmp_path)
+    assert restarted.get(42)["oat milk"]["total_appearances"] == 1
+    assert not restarted.record(42, "expense-1", ITEMS, MAPPING)
+
+
+def test_pending_groups_are_capped(tmp_path):
+    save_state(tmp_path / "1.json", {}, [], "fingerprint", group_id="1")
+    groups = GroupProfiles(tmp_path, max_pending_groups=2)
+    for group_id in (1, 2, 3):
+        assert groups.record(group_id, f"expense-{group_id}", ITEMS, MAPPING)
+
+    # Group 1 was the oldest: written into its shard instead of held in memory
+    assert list(groups._pending) == ["2", "3"]
+    assert groups.get(1)["oat milk"]["total_appearances"] == 1
+
+
+def test_fingerprint_covers_only_names_in_the_data():
+    names = ["Oat Milk", "Basmati Rice 10lb"]
+    fingerprint = mapping_fingerprint(MAPPING, names)
+
+    # New names and mappings that agree with the lowercase fallback don't matter
+    assert mapping_fingerprint({**MAPPING, "Paneer 400g": "paneer"}, names) == fingerprint
+    assert mapping_fingerprint({**MAPPING, "Basmati Rice 10lb": "basmati rice 10lb"}, names) == fingerprint
+    # Re-assigning an aggregated name does
+    assert mapping_fingerprint({**MAPPING, "Basmati Rice 10lb": "basmati rice"}, names) != fingerprint
+    assert mapping_fingerprint({"Oat Milk": "milk"}, names) != fingerprint
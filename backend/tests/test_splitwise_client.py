@@ -0,0 +1,40 @@
+from http.client import RemoteDisconnected
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from services.splitwise_client import SplitwiseGateway, is_retryable
+
+
+def _aborted():
+    # What requests raises when the server drops the connection after the request was sent
+    return requests.exceptions.ConnectionError(
+        ProtocolError("Connection aborted.", RemoteDisconnected("Remote end closed connection without response"))
+    )
+
+
+def _refused():
+    reason = NewConnectionError(None, "Failed to establish a new connection: [Errno 111] Connection refused")
+    return requests.exceptions.ConnectionError(MaxRetryError(None, "/api/v3.0/create_expense", reason))
+
+
+def test_write_is_not_retried_after_mid_request_disconnect():
+    calls = []
+
+    def create_expense():
+        calls.append(1)
+        raise _aborted()
+
+    gateway = SplitwiseGateway(rate=1000, burst=1000, max_retries=3, backoff_base=0)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        gateway.call("token", create_expense, write=True)
+    assert len(calls) == 1
+
+
+def test_retryable_connection_errors():
+    assert is_retryable(_aborted())
+    assert not is_retryable(_aborted(), write=True)
+    assert is_retryable(_refused(), write=True)
+    assert is_retryable(requests.exceptions.ConnectTimeout(), write=True)
+    assert not is_retryable(requests.exceptions.ReadTimeout(), write=True)
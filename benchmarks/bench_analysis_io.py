@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Compare analysis-stage load times: JSON/CSV vs the typed Parquet outputs.
+
+Writes a synthetic dataset with extract_expenses.save_data into a temporary
+directory, then times what the analysis scripts do at startup:
+  - expenses: json.load + build_dataframes (analyze_expenses.py) vs read_parquet
+  - items: read_csv + splitting |-joined members vs read_parquet (list column)
+
+Usage:
+    python benchmarks/bench_analysis_io.py
+    python benchmarks/bench_analysis_io.py --expenses 20000 --items 30
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+ANALYSIS_DIR = Path(__file__).resolve().parent.parent / "analysis"
+sys.path.insert(0, str(ANALYSIS_DIR))
+import analyze_expenses  # noqa: E402
+import extract_expenses  # noqa: E402
+
+MEMBERS = ["Saichandu", "Akula", "Satwik", "Puneet", "Bharadwaj", "Yadalla", "Pranav", "Saidheeraj", "Vamsi", "Mayank"]
+
+
+def make_expenses(n, items_per_expense, seed=0):
+    rng = random.Random(seed)
+    expenses = []
+    for i in range(n):
+        items = [
+            {
+                "name": f"Item {rng.randint(0, 500)} (16 oz)",
+                "price": round(rng.uniform(0.5, 25), 2),
+                "members": rng.sample(MEMBERS, rng.randint(0, 4)),
+            }
+            for _ in range(rng.randint(1, items_per_expense))
+        ]
+        splits = {m: round(rng.uniform(1, 50), 2) for m in rng.sample(MEMBERS, rng.randint(1, 5))}
+        date = f"20{rng.randint(22, 26)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T12:00:00Z"
+        expenses.append({
+            "expense_id": str(4000000000 + i),
+            "stored_expense_id": f"exp-{i}",
+            "description": f"Costco run {i}",
+            "cost": round(sum(it["price"] for it in items), 2),
+            "date": date,
+            "created_at": date,
+            "updated_at": date,
+            "group_id": str(rng.randint(1, 20)),
+            "payer": rng.choice(MEMBERS),
+            "splits": splits,
+            "num_users": len(splits),
+            "item_data": items,
+            "num_items": len(items),
+            "raw_details": "",
+        })
+    return expenses
+
+
+def timed(label, fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<44} {best * 1000:>9.1f} ms")
+
+
+def load_json_frames(path):
+    with open(path) as f:
+        data = json.load(f)
+    return analyze_expenses.build_dataframes(data)
+
+
+def load_csv_items(path):
+    df = pd.read_csv(path)
+    df["members"] = df["members"].fillna("").str.split("|")
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark analysis data loading")
+    parser.add_argument("--expenses", type=int, default=5000, help="Number of synthetic expenses")
+    parser.add_argument("--items", type=int, default=30, help="Max items per expense")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed repetitions (best is reported)")
+    args = parser.parse_args()
+
+    if extract_expenses.pa is None:
+        print("pyarrow is not installed; nothing to compare")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        extract_expenses.DATA_DIR = data_dir
+        extract_expenses.RAW_JSON_PATH = data_dir / "expenses_raw.json"
+        extract_expenses.EXPENSES_CSV_PATH = data_dir / "expenses_flat.csv"
+        extract_expenses.ITEMS_CSV_PATH = data_dir / "items_flat.csv"
+        extract_expenses.EXPENSES_PARQUET_PATH = data_dir / "expenses.parquet"
+        extract_expenses.ITEMS_PARQUET_PATH = data_dir / "items.parquet"
+        with contextlib.redirect_stdout(io.StringIO()):
+            extract_expenses.save_data(make_expenses(args.expenses, args.items))
+
+        sizes = {p.name: p.stat().st_size / 1e6 for p in sorted(data_dir.iterdir())}
+        print(f"{args.expenses} expenses, {len(pd.read_parquet(data_dir / 'items.parquet'))} item rows")
+        print("  " + ", ".join(f"{name} {mb:.1f} MB" for name, mb in sizes.items()))
+
+        print("Expenses + items frames (analyze_expenses.py):")
+        timed("expenses_raw.json + build_dataframes", lambda: load_json_frames(data_dir / "expenses_raw.json"), args.repeat)
+        timed("expenses.parquet + items.parquet",
+              lambda: (pd.read_parquet(data_dir / "expenses.parquet"), pd.read_parquet(data_dir / "items.parquet")),
+              args.repeat)
+        print("Item rows with member lists (build_profiles.py / normalize_app.py):")
+        timed("items_flat.csv + split members", lambda: load_csv_items(data_dir / "items_flat.csv"), args.repeat)
+        timed("items.parquet", lambda: pd.read_parquet(data_dir / "items.parquet"), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
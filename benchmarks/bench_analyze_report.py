@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Time analyze_expenses.py's report at scale: parsing the raw JSON into frames,
+loading the cached frames instead, and computing every report section.
+
+Usage:
+    python benchmarks/bench_analyze_report.py
+    python benchmarks/bench_analyze_report.py --expenses 20000 --items 30
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+from bench_analysis_io import make_expenses, timed
+
+ANALYSIS_DIR = Path(__file__).resolve().parent.parent / "analysis"
+sys.path.insert(0, str(ANALYSIS_DIR))
+import analyze_expenses  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analyze_expenses.py report")
+    parser.add_argument("--expenses", type=int, default=10_000, help="Number of synthetic expenses")
+    parser.add_argument("--items", type=int, default=30, help="Max items per expense")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed repetitions (best is reported)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        analyze_expenses.RAW_JSON = data_dir / "expenses_raw.json"
+        analyze_expenses.CACHE_DIR = data_dir / ".cache"
+        with open(analyze_expenses.RAW_JSON, "w") as f:
+            json.dump(make_expenses(args.expenses, args.items), f)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            frames = analyze_expenses.load_frames()  # also writes the cache
+        print(f"{args.expenses} expenses, {len(frames[1])} item rows")
+
+        def quiet(fn):
+            def run():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    return fn()
+            return run
+
+        timed("parse expenses_raw.json into frames", quiet(lambda: analyze_expenses.load_frames(use_cache=False)),
+              args.repeat)
+        timed("load cached frames (hash + unpickle)", quiet(analyze_expenses.load_frames), args.repeat)
+        timed("compute_report", lambda: analyze_expenses.compute_report(*frames), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
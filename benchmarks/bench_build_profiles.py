@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark member-preference profile building at increasing item-row counts.
+
+Compares the previous row-by-row build (iterrows + per-group loops) with the
+columnar build_profiles.build_preferences, checks both produce identical
+member_preferences.json content, and times the columnar build up to 1M rows.
+
+Usage:
+    python benchmarks/bench_build_profiles.py
+    python benchmarks/bench_build_profiles.py --sizes 1000 100000 1000000 --legacy-max 100000
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "analysis"))
+from build_profiles import build_preferences  # noqa: E402
+
+MEMBERS = ["Saichandu", "Akula", "Satwik", "Puneet", "Bharadwaj", "Yadalla", "Pranav", "Saidheeraj", "Vamsi", "Mayank"]
+
+
+def make_data(n_rows, n_names=2000, seed=0):
+    """items_flat.csv-shaped rows plus a mapping covering most names."""
+    rng = random.Random(seed)
+    names = [f"Item {i} (16 oz)" for i in range(n_names)]
+    mapping = {}
+    for name in names:
+        roll = rng.random()
+        if roll < 0.6:
+            mapping[name] = f"item {rng.randint(0, n_names // 3)}"
+        elif roll < 0.65:
+            mapping[name] = "__SHARED__"
+        elif roll < 0.7:
+            mapping[name] = f"item {rng.randint(0, 50)}, item {rng.randint(51, 100)}"
+    df = pd.DataFrame({
+        "item_name": [rng.choice(names) for _ in range(n_rows)],
+        "item_price": [round(rng.uniform(0.5, 25), 2) for _ in range(n_rows)],
+        "members": ["|".join(rng.sample(MEMBERS, rng.randint(0, 4))) or float("nan") for _ in range(n_rows)],
+    })
+    return df, mapping
+
+
+def legacy_build(df, name_mapping):
+    # What build_profiles.main used to do
+    expanded_rows = []
+    for _, row in df.iterrows():
+        raw_name = row["item_name"]
+        mapped = name_mapping.get(raw_name)
+        if mapped is None:
+            canonicals = [raw_name.lower().strip()]
+        elif mapped == "__SHARED__":
+            canonicals = ["__SHARED__"]
+        elif "," in mapped:
+            canonicals = [c.strip() for c in mapped.split(",") if c.strip()]
+        else:
+            canonicals = [mapped]
+        for canon in canonicals:
+            expanded_rows.append({"canonical_name": canon, "item_price": row["item_price"], "members": row["members"]})
+
+    preferences = {}
+    for canonical, group in pd.DataFrame(expanded_rows).groupby("canonical_name"):
+        member_counts = defaultdict(int)
+        for members_str in group["members"]:
+            if pd.isna(members_str):
+                continue
+            for member in str(members_str).split("|"):
+                member = member.strip()
+                if member:
+                    member_counts[member] += 1
+        preferences[canonical] = {
+            "members": dict(sorted(member_counts.items(), key=lambda x: -x[1])),
+            "total_appearances": len(group),
+            "avg_price": round(group["item_price"].mean(), 2),
+        }
+    return dict(sorted(preferences.items(), key=lambda x: -x[1]["total_appearances"]))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark build_profiles aggregation")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000],
+                        help="Item-row counts to benchmark")
+    parser.add_argument("--legacy-max", type=int, default=100_000,
+                        help="Largest size to also run (and compare against) the legacy build")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'legacy':>10} {'columnar':>10} {'speedup':>8}  identical")
+    for size in args.sizes:
+        df, mapping = make_data(size)
+        (columnar, _), t_new = timed(lambda: build_preferences(df, mapping))
+        if size <= args.legacy_max:
+            legacy, t_old = timed(lambda: legacy_build(df, mapping))
+            same = json.dumps(legacy, indent=2) == json.dumps(columnar, indent=2)
+            print(f"{size:>10} {t_old:>9.2f}s {t_new:>9.2f}s {t_old / t_new:>7.0f}x  {same}")
+        else:
+            print(f"{size:>10} {'-':>10} {t_new:>9.2f}s {'-':>8}  -")
+
+
+if __name__ == "__main__":
+    main()
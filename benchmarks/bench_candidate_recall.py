@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Measure LSH candidate generation for item-name clustering against exact all-pairs scoring.
+
+Clusters the real item names (analysis/data/items.parquet or items_flat.csv;
+the raw names in backend/data/item_name_mapping.json if neither exists) or
+synthetic names, once with every pair scored and once with only the
+candidate_pairs scored. Reports:
+  - pair recall: similar pairs found via LSH / similar pairs found exactly
+  - cluster agreement: exact clusters reproduced unchanged, per linkage
+  - candidate count and time for both modes
+
+Usage:
+    python benchmarks/bench_candidate_recall.py
+    python benchmarks/bench_candidate_recall.py --synthetic 20000 100000 --exact-max 50000
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "analysis"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+import name_clustering  # noqa: E402
+from bench_cluster_names import make_names  # noqa: E402
+
+DATA_DIR = ROOT / "analysis" / "data"
+MAPPING_PATH = ROOT / "backend" / "data" / "item_name_mapping.json"
+
+
+def load_real_names():
+    """Unique raw item names, most frequent first, and where they came from."""
+    if (DATA_DIR / "items.parquet").exists():
+        path = DATA_DIR / "items.parquet"
+        names = pd.read_parquet(path, columns=["item_name"])["item_name"].astype(object)
+    elif (DATA_DIR / "items_flat.csv").exists():
+        path = DATA_DIR / "items_flat.csv"
+        names = pd.read_csv(path, usecols=["item_name"])["item_name"]
+    else:
+        with open(MAPPING_PATH) as f:
+            return sorted(json.load(f)), MAPPING_PATH
+    return names.value_counts().index.tolist(), path
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def pair_set(left, right):
+    return set(zip(left.tolist(), right.tolist()))
+
+
+def report(label, names, threshold, exact_max, workers):
+    unique = list(pd.unique(pd.Series([name_clustering.normalize(n) for n in names], dtype=object)))
+    n = len(unique)
+    print(f"\n{label}: {len(names)} names, {n} after normalizing")
+
+    candidates, candidate_time = timed(lambda: name_clustering.candidate_pairs(unique))
+    (lsh_left, lsh_right), lsh_time = timed(
+        lambda: name_clustering.similar_pairs_lsh(unique, threshold, workers=workers)
+    )
+    all_pairs = n * (n - 1) // 2
+    print(f"  lsh:   {len(candidates[0]):>12} candidates ({len(candidates[0]) / max(all_pairs, 1):.4%} of all pairs) "
+          f"in {candidate_time:.2f}s, {len(lsh_left)} similar after scoring, {lsh_time:.2f}s total")
+
+    if n > exact_max:
+        print(f"  exact: skipped (more than --exact-max {exact_max} names)")
+        return
+    (exact_left, exact_right), exact_time = timed(
+        lambda: name_clustering.similar_pairs(unique, threshold, workers=workers)
+    )
+    exact, found = pair_set(exact_left, exact_right), pair_set(lsh_left, lsh_right)
+    recall = len(exact & found) / len(exact) if exact else 1.0
+    print(f"  exact: {all_pairs:>12} pairs scored, {len(exact)} similar, {exact_time:.2f}s")
+    print(f"  pair recall: {recall:.4f} ({len(exact - found)} similar pairs missed)")
+
+    for linkage, labeller in name_clustering.LINKAGES.items():
+        exact_groups = name_clustering.group_labels(labeller(n, exact_left, exact_right))
+        lsh_groups = name_clustering.group_labels(labeller(n, lsh_left, lsh_right))
+        kept = set(map(tuple, exact_groups)) & set(map(tuple, lsh_groups))
+        multi = [g for g in exact_groups if len(g) > 1]
+        multi_kept = sum(tuple(g) in kept for g in multi)
+        print(f"  {linkage:>10}: {len(kept)}/{len(exact_groups)} clusters identical "
+              f"({multi_kept}/{len(multi)} multi-name)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure LSH candidate recall for name clustering")
+    parser.add_argument("--threshold", type=int, default=75, help="Similarity threshold")
+    parser.add_argument("--synthetic", type=int, nargs="*", default=[], help="Also run on synthetic name counts")
+    parser.add_argument("--exact-max", type=int, default=50000, help="Largest name count to score exactly")
+    parser.add_argument("--workers", type=int, default=-1, help="rapidfuzz workers (-1 = all cores)")
+    args = parser.parse_args()
+
+    names, source = load_real_names()
+    report(f"real names ({source.relative_to(ROOT)})", names, args.threshold, args.exact_max, args.workers)
+    for size in args.synthetic:
+        report("synthetic", make_names(size), args.threshold, args.exact_max, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark item-name clustering for normalize_app.py on synthetic grocery names.
+
+Times name_clustering.cluster_names (blocked multi-core cdist, then greedy
+seed grouping or union-find components) at several sizes, and the old
+pairwise loop where it is still tolerable. Checks that greedy linkage gives
+the old loop's clusters and that repeated runs are identical.
+
+Usage:
+    python benchmarks/bench_cluster_names.py
+    python benchmarks/bench_cluster_names.py --sizes 1000 10000 50000 --legacy-max 2000
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+from rapidfuzz import fuzz
+
+ANALYSIS_DIR = Path(__file__).resolve().parent.parent / "analysis"
+sys.path.insert(0, str(ANALYSIS_DIR))
+from name_clustering import cluster_names  # noqa: E402
+
+BRANDS = ["Kirkland", "Great Value", "Organic", "Amul", "Haldiram's", "Deep", "Swad", "Laxmi", "Trader Joe's", "365"]
+PRODUCTS = [
+    "Whole Milk", "Paneer", "Basmati Rice", "Toor Dal", "Greek Yogurt", "Eggs", "Bananas", "Onions", "Tomatoes",
+    "Chicken Breast", "Atta Flour", "Ghee", "Coriander", "Green Chillies", "Potatoes", "Bread", "Butter",
+    "Orange Juice", "Spinach", "Frozen Parathas", "Masala Chai", "Coconut Oil", "Chana Dal", "Almonds",
+]
+SIZES = ["", "1 lb", "2 lb", "5 lb", "16 oz", "32 oz", "1 gal", "12 ct", "18 ct", "500 g", "1 kg", "4 pack"]
+
+
+def make_names(n, seed=0):
+    """`n` distinct raw names: brand/product/size combinations plus typos and case changes."""
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < n:
+        parts = [rng.choice(BRANDS), rng.choice(PRODUCTS), rng.choice(SIZES), str(rng.randint(1, n // 20 + 1))]
+        name = " ".join(p for p in parts if p)
+        if rng.random() < 0.3:
+            i = rng.randrange(len(name))
+            name = name[:i] + name[i + 1:]
+        if rng.random() < 0.2:
+            name = name.upper()
+        names.add(name)
+    return sorted(names)
+
+
+def legacy_cluster(names, threshold):
+    # The old greedy O(n²) loop from normalize_app.py
+    lowered = [n.lower().strip() for n in names]
+    visited = set()
+    clusters = []
+    for i, name_i in enumerate(lowered):
+        if i in visited:
+            continue
+        cluster = [i]
+        visited.add(i)
+        for j, name_j in enumerate(lowered):
+            if j in visited:
+                continue
+            if fuzz.token_sort_ratio(name_i, name_j) >= threshold:
+                cluster.append(j)
+                visited.add(j)
+        clusters.append(cluster)
+    return clusters
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark item-name clustering")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="Numbers of distinct names")
+    parser.add_argument("--threshold", type=int, default=75, help="Similarity threshold")
+    parser.add_argument("--legacy-max", type=int, default=2000, help="Largest size to also time the greedy loop at")
+    parser.add_argument("--workers", type=int, default=-1, help="cdist workers (-1 = all cores)")
+    args = parser.parse_args()
+
+    print(f"{'names':>8} {'linkage':>10} {'legacy':>9} {'time':>9} {'clusters':>9} {'largest':>8}  same as legacy  deterministic")
+    for size in args.sizes:
+        names = make_names(size)
+        legacy, legacy_time = None, "-"
+        if size <= args.legacy_max:
+            legacy, elapsed = timed(lambda: legacy_cluster(names, args.threshold))
+            legacy_time = f"{elapsed:.2f}s"
+        for linkage in ("greedy", "components"):
+            clusters, elapsed = timed(lambda: cluster_names(names, args.threshold, linkage, workers=args.workers))
+            again = cluster_names(list(names), args.threshold, linkage, workers=args.workers)
+            largest = max(map(len, clusters)) if clusters else 0
+            same = "-" if legacy is None or linkage != "greedy" else clusters == legacy
+            print(f"{size:>8} {linkage:>10} {legacy_time:>9} {elapsed:>8.2f}s {len(clusters):>9} {largest:>8}  "
+                  f"{str(same):>14}  {clusters == again}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark ITEMDATA parsing over a corpus of stored details strings.
+
+Compares the old inline parser (split + json.loads) with the shared
+services.itemdata parser, in full and header-only mode, for legacy JSON and
+compact v2 payloads.
+
+Usage:
+    python benchmarks/bench_itemdata.py
+    python benchmarks/bench_itemdata.py --count 10000 --items 40
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from services import itemdata  # noqa: E402
+
+MEMBERS = ["Saichandu", "Akula", "Satwik", "Puneet", "Bharadwaj", "Yadalla", "Pranav", "Saidheeraj", "Vamsi", "Mayank"]
+
+
+def make_details(n, items_per_expense, seed=0):
+    rng = random.Random(seed)
+    details = []
+    for i in range(n):
+        items = [
+            {
+                "name": f"Item {rng.randint(0, 500)} (16 oz)",
+                "price": round(rng.uniform(0.5, 25), 2),
+                "members": rng.sample(MEMBERS, rng.randint(1, len(MEMBERS))),
+            }
+            for _ in range(rng.randint(1, items_per_expense))
+        ]
+        details.append(f"EXPENSE_ID:{4000000000 + i}\nItemized bill split\n---ITEMDATA---\n{json.dumps(items)}")
+    return details
+
+
+def old_inline(details):
+    # What list_expenses / parse_expense_comment used to do
+    parts = details.split("---ITEMDATA---")
+    item_data = json.loads(parts[1].strip())
+    expense_id = None
+    for line in details.split("\n"):
+        line = line.strip()
+        if line.startswith("EXPENSE_ID:"):
+            expense_id = line.split("EXPENSE_ID:")[1].strip()
+    return expense_id, len(item_data)
+
+
+def run(label, fn, corpus):
+    start = time.perf_counter()
+    for d in corpus:
+        fn(d)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<36} {elapsed * 1000:>9.1f} ms  ({elapsed / len(corpus) * 1e6:>6.1f} µs/expense)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ITEMDATA parsing")
+    parser.add_argument("--count", type=int, default=10_000, help="Number of details strings")
+    parser.add_argument("--items", type=int, default=40, help="Max items per expense")
+    args = parser.parse_args()
+
+    legacy = make_details(args.count, args.items)
+    compact = [itemdata.compact_details(d) for d in legacy]
+    print(f"{args.count} details strings, avg size legacy {sum(map(len, legacy)) / len(legacy):.0f} B, "
+          f"v2 {sum(map(len, compact)) / len(compact):.0f} B (JSON decoder: {itemdata._loads.__module__})")
+
+    print("Legacy JSON payloads:")
+    run("old inline split + json.loads", old_inline, legacy)
+    run("parse_details", itemdata.parse_details, legacy)
+    run("parse_details header_only", lambda d: itemdata.parse_details(d, header_only=True), legacy)
+    print("Compact v2 payloads:")
+    run("parse_details", itemdata.parse_details, compact)
+    run("parse_details header_only", lambda d: itemdata.parse_details(d, header_only=True), compact)
+
+
+if __name__ == "__main__":
+    main()
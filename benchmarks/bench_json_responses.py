@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark JSON response serialization for the largest API payloads.
+
+Compares the previous path (pydantic models / plain dicts run through
+jsonable_encoder and the stdlib JSONResponse) with plain dicts rendered by the
+orjson-backed FastJSONResponse, for an /api/auto-split response and an
+/api/list-expenses page.
+
+Usage:
+    python benchmarks/bench_json_responses.py
+    python benchmarks/bench_json_responses.py --items 5000 --expenses 1000 --repeat 20
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from app import AutoSplitResponse, AutoSplitResultItem  # noqa: E402
+from services.auto_split import auto_split_result  # noqa: E402
+from services.responses import FastJSONResponse  # noqa: E402
+
+MEMBERS = ["Saichandu", "Akula", "Satwik", "Puneet", "Bharadwaj", "Yadalla", "Pranav", "Saidheeraj", "Vamsi", "Mayank"]
+
+
+def make_items(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        dict(
+            name=f"Item {rng.randint(0, 500)} (16 oz)",
+            price=round(rng.uniform(0.5, 25), 2),
+            members=rng.sample(MEMBERS, rng.randint(0, 4)),
+            confidence=rng.choice(["high", "medium", "shared", "unmatched"]),
+            matched_canonical=rng.choice([None, f"item {rng.randint(0, 500)}"]),
+        )
+        for _ in range(n)
+    ]
+
+
+def make_expenses(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "id": str(4000000000 + i),
+            "description": f"Costco run {i}",
+            "cost": f"{rng.uniform(5, 400):.2f}",
+            "date": "2026-10-19T12:00:00Z",
+            "group_id": str(rng.randint(1, 20)),
+            "created_by": rng.choice(MEMBERS),
+            "item_count": rng.randint(1, 60),
+        }
+        for i in range(n)
+    ]
+
+
+def run(label, fn, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        size = len(fn())
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<44} {elapsed * 1000:>8.2f} ms/response  ({size / 1024:.0f} KiB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON response serialization")
+    parser.add_argument("--items", type=int, default=2000, help="Items in the auto-split response")
+    parser.add_argument("--expenses", type=int, default=500, help="Expenses in the list-expenses page")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed repetitions per case")
+    args = parser.parse_args()
+
+    items = make_items(args.items)
+    counts = {"auto_assigned": 0, "shared": 0, "unmatched": 0}
+    print(f"Auto-split response with {args.items} items:")
+    run("pydantic models + jsonable_encoder + json",
+        lambda: JSONResponse(jsonable_encoder(AutoSplitResponse(
+            items=[AutoSplitResultItem(**item) for item in items], **counts))).body,
+        args.repeat)
+    run("plain dicts + FastJSONResponse",
+        lambda: FastJSONResponse({"items": [auto_split_result(**item) for item in items], **counts}).body,
+        args.repeat)
+
+    expenses = make_expenses(args.expenses)
+    page = {"expenses": expenses, "next_offset": args.expenses, "has_more": True}
+    print(f"List-expenses page with {args.expenses} expenses:")
+    run("dict + jsonable_encoder + json", lambda: JSONResponse(jsonable_encoder(page)).body, args.repeat)
+    run("dict + FastJSONResponse", lambda: FastJSONResponse(page).body, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Measure the memory of member preferences as plain dicts vs CompactPreferences.
+
+Loads backend/data/member_preferences.json plus synthetic preferences of
+increasing size, and for each reports:
+  - retained: bytes still allocated once loading is done (tracemalloc)
+  - rss: growth of the process RSS per copy when --copies of it are held at
+    once (as the per-group LRU does), in a fresh subprocess per representation
+  - lookup: time of the auto-split lookups (item → members → member count)
+    over up to 20000 items, and over a hot set of 1000 items looked up again
+    and again (what CompactPreferences' decoded-item cache serves)
+  - entries left after pruning with --min-count, if given
+
+Usage:
+    python benchmarks/bench_preferences_memory.py
+    python benchmarks/bench_preferences_memory.py --sizes 10000 100000 --min-count 2 --copies 8
+"""
+
+import argparse
+import gc
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+from services.preferences import CompactPreferences  # noqa: E402
+
+PREFERENCES_PATH = ROOT / "backend" / "data" / "member_preferences.json"
+MEMBERS = ["Saichandu", "Akula", "Satwik", "Puneet", "Bharadwaj", "Yadalla", "Pranav", "Saidheeraj", "Vamsi", "Mayank"]
+
+
+def make_preferences(n_items, seed=0):
+    """member_preferences.json-shaped dict with a long tail of rarely bought items."""
+    rng = random.Random(seed)
+    preferences = {}
+    for i in range(n_items):
+        appearances = max(1, int(rng.paretovariate(1.2)))
+        members = {}
+        for member in rng.sample(MEMBERS, rng.randint(1, 6)):
+            members[member] = rng.randint(1, appearances)
+        preferences[f"item {i} {rng.choice(['organic', 'large', 'frozen', 'pack'])}"] = {
+            "members": dict(sorted(members.items(), key=lambda x: -x[1])),
+            "total_appearances": appearances,
+            "avg_price": round(rng.uniform(0.5, 25), 2),
+        }
+    return preferences
+
+
+def load(path, compact, min_count):
+    with open(path) as f:
+        preferences = json.load(f)
+    if compact:
+        preferences = CompactPreferences(preferences, min_count=min_count)
+    return preferences
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * 4096
+
+
+def child(path, compact, min_count, copies):
+    """Print the RSS growth per copy of holding `copies` loads of `path` in this (fresh) process.
+
+    The first load is not counted: it leaves the JSON parse's freed arenas
+    behind, which later loads reuse.
+    """
+    held = [load(path, compact, min_count)]
+    gc.collect()
+    before = rss_bytes()
+    held.extend(load(path, compact, min_count) for _ in range(copies))
+    gc.collect()
+    print((rss_bytes() - before) // copies)
+    return held
+
+
+def retained_bytes(path, compact, min_count):
+    gc.collect()
+    tracemalloc.start()
+    preferences = load(path, compact, min_count)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, preferences
+
+
+def rss_growth(path, compact, min_count, copies):
+    cmd = [sys.executable, __file__, "--child", str(path), "--min-count", str(min_count), "--copies", str(copies)]
+    if compact:
+        cmd.append("--compact")
+    return int(subprocess.run(cmd, capture_output=True, text=True, check=True).stdout.split()[-1])
+
+
+def lookup_seconds(preferences, names, repeat=3):
+    """Best-of time of the per-item lookups auto_split_items does."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for name in names:
+            if name in preferences:
+                pref_data = preferences[name]
+                item_members = pref_data.get("members", {})
+                total = pref_data.get("total_appearances", 1)
+                for member in MEMBERS:
+                    if member in item_members:
+                        item_members[member] / total
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(label, path, min_count, copies):
+    rows = {}
+    for compact in (False, True):
+        retained, preferences = retained_bytes(path, compact, min_count)
+        names = list(preferences)[:20000]
+        rss = rss_growth(path, compact, min_count, copies)
+        hot = names[:1000]
+        rows[compact] = (retained, rss, lookup_seconds(preferences, names) / max(len(names), 1),
+                         lookup_seconds(preferences, hot) / max(len(hot), 1))
+    entries = len(CompactPreferences(load(path, False, 1), min_count=min_count).entry_counts)
+    print(f"\n{label}: {entries} member entries kept (min count {min_count})")
+    for compact, (retained, rss, seconds, hot_seconds) in rows.items():
+        kind = "compact" if compact else "dict"
+        print(f"  {kind:<8} retained {retained / 1e6:>8.2f} MB   rss {rss / 1e6:>8.2f} MB   "
+              f"lookup {1e6 * seconds:>6.2f} us/item   hot {1e6 * hot_seconds:>6.2f} us/item")
+    print(f"  retained ratio {rows[False][0] / max(rows[True][0], 1):.1f}x, "
+          f"rss ratio {rows[False][1] / max(rows[True][1], 1):.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark member preference memory")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 500_000],
+                        help="Synthetic item counts to benchmark")
+    parser.add_argument("--min-count", type=int, default=1, help="Prune member counts below this")
+    parser.add_argument("--copies", type=int, default=4, help="Copies held at once for the RSS measurement")
+    parser.add_argument("--child", type=Path, help=argparse.SUPPRESS)
+    parser.add_argument("--compact", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.compact, args.min_count, args.copies)
+        return
+
+    if PREFERENCES_PATH.exists():
+        report(PREFERENCES_PATH.name, PREFERENCES_PATH, args.min_count, args.copies)
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = Path(tmp) / f"preferences_{size}.json"
+            with open(path, "w") as f:
+                json.dump(make_preferences(size), f)
+            report(f"synthetic {size} items", path, args.min_count, args.copies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark the integer-cents split engine on large receipts.
+
+Usage:
+    python benchmarks/bench_split_engine.py
+    python benchmarks/bench_split_engine.py --items 1000 --members 50
+"""
+
+import argparse
+import random
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from services.split_engine import compute_splits, split_matrix  # noqa: E402
+
+
+def make_items(n_items, n_members, seed=0):
+    rng = random.Random(seed)
+    members = [f"member{i}" for i in range(n_members)]
+    return [
+        {
+            "name": f"item {i}",
+            "price": round(rng.uniform(0.5, 40), 2),
+            "members": rng.sample(members, rng.randint(1, n_members)),
+        }
+        for i in range(n_items)
+    ]
+
+
+def bench(label, fn, repeat):
+    best = min(timeit.repeat(fn, number=1, repeat=repeat))
+    print(f"  {label:<40} {best * 1e6:>10.1f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the split engine")
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--members", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    items = make_items(args.items, args.members)
+    splits, total, _ = compute_splits(items)
+    assert sum(splits.values()) == total
+
+    # Pre-built matrix: the vectorized allocation alone
+    index = {f"member{i}": i for i in range(args.members)}
+    mask = np.zeros((args.items, args.members), dtype=bool)
+    for i, item in enumerate(items):
+        mask[i, [index[m] for m in item["members"]]] = True
+    prices = np.array([round(item["price"] * 100) for item in items], dtype=np.int64)
+
+    print(f"{args.items} items x {args.members} members")
+    bench("split_matrix (allocation only)", lambda: split_matrix(prices, mask), args.repeat)
+    bench("compute_splits (ITEMDATA -> cents)", lambda: compute_splits(items), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -210,6 +210,7 @@ const handleItemsUpdate = (newItems: Item[]) => {
               price: item.price,
             })),
             members: visibleMembers,
+            group_id: groups[selectedGroup] || null,
           }),
         }
       );